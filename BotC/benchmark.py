@@ -0,0 +1,298 @@
+"""
+Benchmarks for the max jinx script's search strategies, on the real jinx data and on seeded
+synthetic jinx graphs of growing size and density. Each strategy is run in its own process, so
+that its peak memory can be measured, and the results are written as JSON. Passing an earlier
+results file with --compare reports any regressions against it.
+"""
+import argparse
+import importlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import data
+
+from datetime import datetime
+
+
+def _load_search_module():
+    """The script's filename is not a valid module name, so load it by path"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "max-jinx-script.py")
+    spec = importlib.util.spec_from_file_location("max_jinx_script", path)
+    module = importlib.util.module_from_spec(spec)
+    # Worker processes find pickled functions by module name
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+mjs = _load_search_module()
+
+# Strategies which finish (or can be stopped by the time limit) on every graph
+DEFAULT_STRATEGIES = [
+    "branch-and-bound",
+    "exhaustion-reduced",
+    "construction-greedy",
+    "construction-greedy-all-starts",
+    "annealing",
+    "tabu",
+    "genetic",
+]
+SYNTHETIC_SIZES = [8, 12, 16]
+SYNTHETIC_DENSITIES = [0.1, 0.25]
+TIME_LIMIT = 30
+# Relative drop in evaluations per second reported as a regression
+TOLERANCE = 0.2
+
+
+def synthetic_distribution(team_size):
+    """Roughly the proportions of a normal script, for teams of team_size characters"""
+    return {
+        "townsfolk": team_size // 2,
+        "outsider": team_size // 4,
+        "minion": team_size // 4,
+        "demon": max(team_size // 8, 1),
+    }
+
+
+def synthetic_world(team_size, density, seed=0):
+    """
+    Random characters and jinxes, with team_size characters in each team and each pair of
+    characters jinxed with probability density. Returns (characters, jinxes) in the formats
+    loaded from data/characters.yaml and data/jinxes.yaml.
+    """
+    rng = random.Random(f"{team_size}/{density}/{seed}")
+    char_dict = {team: {f"{team}{i}": {} for i in range(team_size)}
+                 for team in mjs.TOWN_DISTRIBUTION.keys()}
+    names = [name for team in char_dict.values() for name in team.keys()]
+    jinx_dict = {}
+    for i in range(len(names)):
+        for j in range(i + 1, len(names)):
+            if rng.random() < density:
+                jinx_dict.setdefault(names[i], {})[names[j]] = "Synthetic jinx"
+    return char_dict, jinx_dict
+
+
+def get_graphs(sizes=SYNTHETIC_SIZES, densities=SYNTHETIC_DENSITIES, real=True, seed=0):
+    """
+    Returns a list of the graphs to benchmark on, each a dict of its name, characters, jinxes,
+    distribution and (for synthetic graphs) size and density
+    """
+    graphs = []
+    if real:
+        graphs.append({
+            "name": "real",
+            "characters": data.characters,
+            "jinxes": data.jinxes,
+            "distribution": mjs.TOWN_DISTRIBUTION,
+        })
+    for size in sizes:
+        for density in densities:
+            char_dict, jinx_dict = synthetic_world(size, density, seed)
+            graphs.append({
+                "name": f"synthetic-{size}-{density}",
+                "characters": char_dict,
+                "jinxes": jinx_dict,
+                "distribution": synthetic_distribution(size),
+                "size": size,
+                "density": density,
+            })
+    return graphs
+
+
+def get_strategy_name(strategy):
+    """Name of a SEARCH_TYPES strategy, or of a custom callable"""
+    if isinstance(strategy, str):
+        return strategy
+    return f"{strategy.__module__}.{strategy.__qualname__}"
+
+
+def _run_case(strategy, graph, time_limit, seed, connection):
+    """Run one strategy on one graph, in a child process. Sends the result dict to connection"""
+    # The searches print their progress and scripts
+    sys.stdout = open(os.devnull, "w")
+    search_type = mjs.SEARCH_TYPES[strategy] if isinstance(strategy, str) else strategy
+    search = mjs.Search(search_type, seed=seed, time_limit=time_limit,
+                        distribution=graph["distribution"], char_dict=graph["characters"],
+                        jinx_dict=graph["jinxes"])
+
+    start = time.perf_counter()
+    solutions = search.solve()
+    wall_time = time.perf_counter() - start
+
+    evaluations = search.progress.get_checked()
+    # Kilobytes on Linux, but bytes on macOS
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_memory //= 1024
+    connection.send({
+        "wall_seconds": wall_time,
+        "evaluations": evaluations,
+        "evaluations_per_second": evaluations / wall_time if wall_time > 0 else None,
+        "peak_memory_kib": peak_memory,
+        "best_jinxes": search.solutions.best if len(solutions) > 0 else None,
+        "num_solutions": len(solutions),
+        "timed_out": search.timed_out,
+    })
+    connection.close()
+
+
+def run_case(strategy, graph, time_limit=TIME_LIMIT, seed=0):
+    """
+    Benchmark one strategy on one graph in a fresh process, so that runs do not share memory or
+    caches. Returns a dict of the results.
+    @param strategy name from SEARCH_TYPES, or a callable accepted by Search(search_type=...)
+    @param graph a graph dict from get_graphs
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_run_case,
+                                      args=(strategy, graph, time_limit, seed, sender))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        # The child raised or was killed before sending anything
+        result = None
+    process.join()
+    if result is None:
+        result = {"error": f"exited with code {process.exitcode}"}
+
+    result = {
+        "strategy": get_strategy_name(strategy),
+        "graph": graph["name"],
+        "size": graph.get("size"),
+        "density": graph.get("density"),
+        "distribution": mjs.format_distribution(graph["distribution"]),
+        **result,
+    }
+    return result
+
+
+def run_benchmarks(strategies=None, graphs=None, time_limit=TIME_LIMIT, seed=0, log=print):
+    """
+    Benchmark every strategy on every graph. Returns the results document, ready to be written as
+    JSON, with a result dict per strategy and graph.
+    """
+    strategies = DEFAULT_STRATEGIES if strategies is None else strategies
+    graphs = get_graphs() if graphs is None else graphs
+    results = []
+    for graph in graphs:
+        for strategy in strategies:
+            result = run_case(strategy, graph, time_limit, seed)
+            log(format_result(result))
+            results.append(result)
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": _get_commit(),
+        "python": platform.python_version(),
+        "numpy": None if mjs.numpy is None else mjs.numpy.__version__,
+        "time_limit": time_limit,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def _get_commit():
+    """The current git commit, or None outside a git checkout"""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_result(result):
+    if "error" in result:
+        return f"{result['graph']:>24} {result['strategy']:>32}: {result['error']}"
+    rate = result["evaluations_per_second"] or 0
+    status = " (time limit)" if result["timed_out"] else ""
+    return f"{result['graph']:>24} {result['strategy']:>32}: best {result['best_jinxes']}, " \
+        f"{result['wall_seconds']:.2f}s, {rate:,.0f} evals/s, " \
+        f"{result['peak_memory_kib'] / 1024:.1f} MiB{status}"
+
+
+def compare(old, new, tolerance=TOLERANCE):
+    """
+    Compare two results documents. Returns a list of messages, one per regression: a strategy
+    which found fewer jinxes, or evaluated more than tolerance slower, on the same graph
+    """
+    old_results = {(result["strategy"], result["graph"]): result for result in old["results"]}
+    regressions = []
+    for result in new["results"]:
+        previous = old_results.get((result["strategy"], result["graph"]))
+        if previous is None or "error" in previous:
+            continue
+        name = f"{result['strategy']} on {result['graph']}"
+        if "error" in result:
+            regressions.append(f"{name}: {result['error']}")
+            continue
+        if (previous["best_jinxes"] or 0) > (result["best_jinxes"] or 0):
+            regressions.append(f"{name}: best fell from {previous['best_jinxes']} to "
+                               f"{result['best_jinxes']} jinxes")
+        old_rate = previous["evaluations_per_second"]
+        new_rate = result["evaluations_per_second"]
+        if old_rate and new_rate is not None and new_rate < old_rate * (1 - tolerance):
+            regressions.append(f"{name}: {new_rate:,.0f} evals/s, down from {old_rate:,.0f}")
+    return regressions
+
+
+def _import_callable(path):
+    """Import a custom search callable given as module:function"""
+    module_name, _, func_name = path.partition(":")
+    if func_name == "":
+        raise argparse.ArgumentTypeError(f"Expected module:function, got {path}")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--strategy", action="append", choices=mjs.SEARCH_TYPES.keys(),
+                        help="strategy to benchmark (repeatable, default: "
+                             f"{', '.join(DEFAULT_STRATEGIES)})")
+    parser.add_argument("--custom", action="append", type=_import_callable, default=[],
+                        metavar="MODULE:FUNCTION",
+                        help="also benchmark a custom search callable (repeatable)")
+    parser.add_argument("--sizes", type=int, nargs="*", default=SYNTHETIC_SIZES,
+                        help="characters per team in the synthetic graphs")
+    parser.add_argument("--densities", type=float, nargs="*", default=SYNTHETIC_DENSITIES,
+                        help="chance of each pair of characters being jinxed in synthetic graphs")
+    parser.add_argument("--no-real", dest="real", action="store_false",
+                        help="skip the real jinx data")
+    parser.add_argument("--time-limit", type=float, default=TIME_LIMIT, metavar="SECONDS",
+                        help=f"stop each run after SECONDS (default {TIME_LIMIT})")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed for the synthetic graphs and local searches")
+    parser.add_argument("--output", default="benchmark-results.json", metavar="FILE",
+                        help="file to write the results to (default benchmark-results.json)")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="earlier results to check for regressions against")
+    args = parser.parse_args()
+
+    strategies = (args.strategy or DEFAULT_STRATEGIES) + args.custom
+    graphs = get_graphs(args.sizes, args.densities, args.real, args.seed)
+    document = run_benchmarks(strategies, graphs, args.time_limit, args.seed)
+    with open(args.output, "w") as output:
+        json.dump(document, output, indent=2)
+    print(f"Wrote {len(document['results'])} results to {args.output}")
+
+    if args.compare is not None:
+        with open(args.compare) as previous:
+            regressions = compare(json.load(previous), document)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if len(regressions) > 0:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
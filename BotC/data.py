@@ -1,18 +1,43 @@
 """
-Parser to process the YAML data stored in the ./data directory.
+Parser to process the YAML data stored in the data directory beside this file.
 Also has facility to write
 
 Grab as needed i.e.:
 
 from data import characters
+
+The characters are also indexed by data.registry (see CharacterRegistry), with an integer id per
+character and O(1) lookups between names, ids and teams. data.jinx_index (see JinxIndex) looks up
+the jinxes from either of their characters.
+
+Each dataset is only loaded when first used, and then kept for the rest of the process. Parsed
+files are cached with marshal in a .cache directory beside them, so later imports skip the YAML
+parse. A cache is rebuilt whenever its source file changes.
 """
-import yaml
+import marshal
+import os
+
+from array import array
+from types import MappingProxyType
+
+# PyYAML (and hashlib) take longer to import than a cached load, so they are only imported when
+# needed. marshal is built in, and loads plain data faster than pickle.
+
+_CACHE_DIRNAME = ".cache"
+_CACHE_VERSION = 1
+
+
+def _get_loader():
+    """The C YAML loader if PyYAML was built with libyaml, which parses several times faster"""
+    import yaml
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
 
 def load_yaml(filename):
+    import yaml
     try:
         with open(filename, 'r') as file:
-            file_data = yaml.safe_load(file)
+            file_data = yaml.load(file, Loader=_get_loader())
             return file_data
     except FileNotFoundError:
         print(f"Could not find {filename}")
@@ -22,17 +47,324 @@ def load_yaml(filename):
 
 
 def write_yaml(filename, contents):
+    import yaml
     with open(filename, 'w') as file:
         yaml.dump(contents, file, default_flow_style=False)
 
 
+def get_cache_filename(filename):
+    """Where the parsed contents of filename are cached"""
+    directory, basename = os.path.split(filename)
+    return os.path.join(directory, _CACHE_DIRNAME, basename + ".marshal")
+
+
+def load_cached_yaml(filename):
+    """
+    Load a YAML file through its cache. The cache is used as long as the file's modification time
+    and size are unchanged. If they have changed but the contents hash the same (e.g. after a
+    fresh checkout), the cache is still used, and updated with the new modification time.
+    Otherwise the file is parsed and the cache rewritten. Returns None if the file could not be
+    loaded, as load_yaml does.
+    """
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        print(f"Could not find {filename}")
+        return None
+    cache_filename = get_cache_filename(filename)
+
+    cache = None
+    try:
+        with open(cache_filename, 'rb') as file:
+            cache = marshal.load(file)
+    except (OSError, ValueError, EOFError, TypeError):
+        pass
+    if not isinstance(cache, dict) or cache.get("version") != _CACHE_VERSION:
+        cache = None
+    if cache is not None:
+        if cache["mtime_ns"] == stat.st_mtime_ns and cache["size"] == stat.st_size:
+            return cache["data"]
+
+    import hashlib
+    with open(filename, 'rb') as file:
+        digest = hashlib.sha256(file.read()).hexdigest()
+    if cache is not None and cache["sha256"] == digest:
+        file_data = cache["data"]
+    else:
+        file_data = load_yaml(filename)
+        if file_data is None:
+            return None
+
+    cache = {
+        "version": _CACHE_VERSION,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": digest,
+        "data": file_data,
+    }
+    try:
+        os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
+        temp_filename = cache_filename + f".{os.getpid()}.tmp"
+        with open(temp_filename, 'wb') as file:
+            marshal.dump(cache, file)
+        os.replace(temp_filename, cache_filename)
+    except (OSError, ValueError):
+        # Read-only checkouts (or data marshal cannot hold) still load, just without the cache
+        pass
+    return file_data
+
+
+class Character():
+    """One character's data from characters.yaml, as a compact record"""
+    # Attribute to the characters.yaml field it is read from, and its default
+    FIELDS = {
+        "display_name": ("name", None),
+        "ability": ("ability", None),
+        "edition": ("edition", None),
+        "image": ("image", None),
+        "flavor": ("flavor", None),
+        "first_night": ("firstNight", 0),
+        "first_night_reminder": ("firstNightReminder", None),
+        "other_night": ("otherNight", 0),
+        "other_night_reminder": ("otherNightReminder", None),
+        "reminders": ("reminders", ()),
+        "reminders_global": ("remindersGlobal", ()),
+        "setup": ("setup", False),
+        "special": ("special", ()),
+    }
+    __slots__ = ("id", "name", "team") + tuple(FIELDS.keys())
+
+    def __init__(self, char_id, name, team, attributes):
+        """
+        @param char_id the character's dense integer id in its registry
+        @param name the character's key in characters.yaml, e.g. "pithag"
+        @param team the team the character is listed under
+        @param attributes dict of the character's fields in characters.yaml
+        """
+        self.id = char_id
+        self.name = name
+        self.team = team
+        for attribute, (field, default) in self.FIELDS.items():
+            setattr(self, attribute, attributes.get(field, default))
+
+    def __repr__(self):
+        return f"Character({self.id}, {self.name!r}, {self.team!r})"
+
+
+class CharacterRegistry():
+    """
+    Index of every character, built once from a characters dict as loaded from characters.yaml.
+    Each character gets a dense integer id, numbered team by team so that each team's ids are a
+    contiguous range. Names, ids, teams and Character records translate in O(1).
+    """
+    def __init__(self, char_dict):
+        """
+        @param char_dict dict of team name to dict of character name to its fields
+        Raises ValueError if a character is listed under more than one team.
+        """
+        self.char_dict = char_dict
+        self.teams = list(char_dict.keys())
+        # Id to name and Character, and name to id
+        self.names = []
+        self.records = []
+        self._ids = {}
+        # Name to team, for code which needs a plain dict
+        self.types = {}
+        self._team_ranges = {}
+        self._team_of_id = array("B")
+
+        for team_index, team in enumerate(self.teams):
+            start = len(self.names)
+            for name, attributes in char_dict[team].items():
+                if name in self._ids:
+                    raise ValueError(f"{name} is listed under both {self.types[name]} and {team}")
+                char_id = len(self.names)
+                self.names.append(name)
+                self.records.append(Character(char_id, name, team, attributes or {}))
+                self._ids[name] = char_id
+                self.types[name] = team
+                self._team_of_id.append(team_index)
+            self._team_ranges[team] = range(start, len(self.names))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._ids
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, key):
+        """The Character with the given name or id. Raises KeyError if there is none"""
+        if isinstance(key, int):
+            if not 0 <= key < len(self.records):
+                raise KeyError(key)
+            return self.records[key]
+        return self.records[self._ids[key]]
+
+    def get(self, name):
+        """The Character with the given name, or None"""
+        char_id = self._ids.get(name)
+        return None if char_id is None else self.records[char_id]
+
+    def get_id(self, name):
+        """The id of the named character, or None"""
+        return self._ids.get(name)
+
+    def get_name(self, char_id):
+        return self.names[char_id]
+
+    def get_team(self, name):
+        """The team of the named character, or None"""
+        return self.types.get(name)
+
+    def get_team_of_id(self, char_id):
+        return self.teams[self._team_of_id[char_id]]
+
+    def get_team_range(self, team):
+        """The range of ids of the team's characters"""
+        return self._team_ranges[team]
+
+    def get_team_names(self, team):
+        """Names of the team's characters, in id order"""
+        team_range = self._team_ranges[team]
+        return self.names[team_range.start:team_range.stop]
+
+
+def get_registry(char_dict=None):
+    """
+    The CharacterRegistry of char_dict, or of the characters dataset by default. The registry of
+    the last dict asked for is kept, so it is only built once for each.
+    """
+    global _registry
+    if char_dict is None:
+        char_dict = _load("characters")
+    if _registry is None or _registry.char_dict is not char_dict:
+        _registry = CharacterRegistry(char_dict)
+    return _registry
+
+
 def get_team_of_character(char_name):
-    for team_name in characters.keys():
-        for char_id in characters[team_name].keys():
-            if char_id == char_name:
-                return team_name
-    return None
+    return get_registry().get_team(char_name)
+
+
+class JinxIndex():
+    """
+    Symmetric index of the jinxes, built once from a jinxes dict as loaded from jinxes.yaml. The
+    YAML stores each jinx under only one of its characters, while the index can be queried from
+    either, in any order.
+    """
+    def __init__(self, jinx_dict):
+        """
+        @param jinx_dict dict of character name to dict of jinxed character name to jinx text. A
+          jinx may be stored under either character, or both if the text matches.
+        Raises ValueError if a jinx is stored under both characters with different text, or a
+        character is jinxed with itself.
+        """
+        self.jinx_dict = jinx_dict
+        # Character name to dict of jinxed character name to jinx text, under both characters
+        self.adjacency = {}
+        self._num_jinxes = 0
+        for char_name, char_jinxes in jinx_dict.items():
+            for jinxed_char_name, text in char_jinxes.items():
+                if char_name == jinxed_char_name:
+                    raise ValueError(f"{char_name} is jinxed with itself")
+                existing = self.jinx_between(char_name, jinxed_char_name)
+                if existing is not None:
+                    if existing != text:
+                        raise ValueError(f"{char_name} and {jinxed_char_name} have two different "
+                                         "jinxes")
+                    continue
+                self.adjacency.setdefault(char_name, {})[jinxed_char_name] = text
+                self.adjacency.setdefault(jinxed_char_name, {})[char_name] = text
+                self._num_jinxes += 1
+
+    def __len__(self):
+        """The number of jinxes"""
+        return self._num_jinxes
+
+    def __iter__(self):
+        """Each jinx once, as (name, name, text) with the names sorted"""
+        for char_name, char_jinxes in self.adjacency.items():
+            for jinxed_char_name, text in char_jinxes.items():
+                if char_name < jinxed_char_name:
+                    yield char_name, jinxed_char_name, text
+
+    def jinx_between(self, char_1, char_2):
+        """The text of the jinx between the characters, in either order, or None"""
+        return self.adjacency.get(char_1, {}).get(char_2)
+
+    def jinxes_for(self, char_name):
+        """Read-only dict of each character jinxed with char_name to the jinx text"""
+        return MappingProxyType(self.adjacency.get(char_name, {}))
+
+    def jinxes_within(self, script):
+        """
+        Every jinx between two characters of script, as a list of (name, name, text) with the
+        names of each sorted. Takes time proportional to the number of jinxes of its characters.
+        """
+        chars = set(script)
+        found = []
+        for char_name in chars:
+            for jinxed_char_name, text in self.adjacency.get(char_name, {}).items():
+                if char_name < jinxed_char_name and jinxed_char_name in chars:
+                    found.append((char_name, jinxed_char_name, text))
+        return sorted(found)
+
+    def count_jinxes_within(self, script):
+        """The number of jinxes between two characters of script"""
+        chars = set(script)
+        count = 0
+        for char_name in chars:
+            count += sum(1 for jinxed_char_name in self.adjacency.get(char_name, {})
+                         if jinxed_char_name in chars)
+        return count // 2
+
+
+def get_jinx_index(jinx_dict=None):
+    """
+    The JinxIndex of jinx_dict, or of the jinxes dataset by default. Kept like get_registry.
+    """
+    global _jinx_index
+    if jinx_dict is None:
+        jinx_dict = _load("jinxes")
+    if _jinx_index is None or _jinx_index.jinx_dict is not jinx_dict:
+        _jinx_index = JinxIndex(jinx_dict)
+    return _jinx_index
+
 
 # === Exports ===
-characters = load_yaml('./data/characters.yaml')
-jinxes = load_yaml('./data/jinxes.yaml')
+# Loaded on first access (see __getattr__), from beside this file rather than the working directory
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+_DATASETS = {
+    "characters": "characters.yaml",
+    "jinxes": "jinxes.yaml",
+}
+_registry = None
+_jinx_index = None
+# Indexes built from the datasets, to their builders
+_INDEXES = {
+    "registry": get_registry,
+    "jinx_index": get_jinx_index,
+}
+
+
+def _load(name):
+    """Load a dataset by its export name, once per process"""
+    if name not in globals():
+        globals()[name] = load_cached_yaml(os.path.join(DATA_DIR, _DATASETS[name]))
+    return globals()[name]
+
+
+def __getattr__(name):
+    """Lazily load the datasets, so that importing this module does not parse any YAML"""
+    if name in _DATASETS:
+        return _load(name)
+    if name in _INDEXES:
+        return _INDEXES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals().keys()) | set(_DATASETS.keys()) | set(_INDEXES.keys()))
@@ -1,13 +1,29 @@
 """
 For generating a script with the maximum number of Jinxes.
 """
+import argparse
+import contextlib
+import hashlib
+import heapq
+import json
+import math
+import multiprocessing
+import os
+import random
 import signal
+import threading
+import time
 
-from data import characters, jinxes
+import data
 
-from datetime import datetime
-from itertools import combinations
-from copy import deepcopy
+from datetime import datetime, timedelta
+from itertools import combinations, product
+
+try:
+    import numpy
+except ImportError:
+    # Only needed for the batched exhaustive searches, which fall back to popcounts
+    numpy = None
 
 
 TOWN_DISTRIBUTION = {
@@ -18,12 +34,6 @@ TOWN_DISTRIBUTION = {
 }
 
 
-start_time = 0
-checked_solns = 0
-last_soln = []
-last_interrupt = datetime.now()
-
-
 def dict_member_append(dictionary, key, value):
     """Append to a list which is a member of a dict. If it doesn't exist, create the list"""
     if dictionary.get(key) is None:
@@ -46,21 +56,638 @@ def concat_lists(categorised):
     return output
 
 
-def sigint_handler(_signum, _frame):
-    """Update on status. Should be SIGINFO, but no library support"""
-    global last_interrupt
-    curr_time = datetime.now()
-    elapsed_time = curr_time - start_time
-    print(f'SIGINT: checked {checked_solns} in {elapsed_time}s. Last seen:\n  {last_soln}')
-    if (curr_time - last_interrupt).total_seconds() < 5:
-        raise KeyboardInterrupt("")
-    last_interrupt = curr_time
+def combinations_from(n, r, start=None):
+    """
+    Yield the same index tuples as itertools.combinations(range(n), r), in the same order, but
+    beginning at the combination start (if given) rather than the first
+    """
+    if r > n:
+        return
+    indices = list(range(r)) if start is None else list(start)
+    while True:
+        yield tuple(indices)
+        # Find the rightmost index which can still move right
+        for i in reversed(range(r)):
+            if indices[i] != i + n - r:
+                break
+        else:
+            return
+        indices[i] += 1
+        for j in range(i + 1, r):
+            indices[j] = indices[j - 1] + 1
+
+
+def describe_space_size(space, distribution):
+    """
+    Size of the search space for picking a distribution from a categorised space, written as in
+    the search docstrings, e.g. 2.3281309e+25 [69C13*23C4*27C4*19C4]
+    """
+    terms = [f"{len(space[category])}C{slots}" for category, slots in distribution.items()]
+    return f"{get_space_size(space, distribution):.7e} [{'*'.join(terms)}]"
+
+
+def get_space_size(space, distribution):
+    """Number of scripts with the distribution that can be picked from a categorised space"""
+    total = 1
+    for category, slots in distribution.items():
+        total *= math.comb(len(space[category]), slots)
+    return total
+
+
+def format_duration(seconds):
+    """A number of seconds as H:MM:SS, or in years if it is too long for that to mean much"""
+    years = seconds / (365.25 * 24 * 60 * 60)
+    if years >= 100:
+        return f"{years:.2e} years"
+    return str(timedelta(seconds=round(seconds)))
+
+
+def format_distribution(distribution):
+    """e.g. 13/4/4/4, in TOWN_DISTRIBUTION's team order"""
+    return "/".join(str(distribution[team]) for team in TOWN_DISTRIBUTION.keys())
+
+
+def parse_distributions(text):
+    """
+    Parse a grid of distributions, given as the comma-separated number of townsfolk, outsiders,
+    minions and demons. Each number may instead be an inclusive range, e.g. "12-14,4-5,4,4" gives
+    the 6 distributions from 12/4/4/4 to 14/5/4/4, with neighbouring distributions adjacent.
+    """
+    parts = text.split(",")
+    if len(parts) != len(TOWN_DISTRIBUTION):
+        raise ValueError(f"Expected {len(TOWN_DISTRIBUTION)} comma-separated counts, got {text}")
+    ranges = []
+    for part in parts:
+        low, _, high = part.partition("-")
+        low = int(low)
+        high = low if high == "" else int(high)
+        if low < 0 or high < low:
+            raise ValueError(f"Invalid count range {part}")
+        ranges.append(range(low, high + 1))
+    return [dict(zip(TOWN_DISTRIBUTION.keys(), counts)) for counts in product(*ranges)]
+
+
+def iter_bits(mask):
+    """Yield the index of each set bit in mask, lowest first"""
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+
+class _SearchTimeout(Exception):
+    """Raised through a search when its time limit is up"""
+
+
+class _SearchProgress():
+    """
+    Counters and history for reporting on a running search. When shared, each process counts
+    locally and periodically flushes into totals held in shared memory, so the parent process can
+    report on every worker.
+    Counts are of candidates evaluated (complete scripts, or swaps for the local searches), nodes
+    expanded and subtrees pruned. Improvements to the best script are kept with their times.
+    """
+    FLUSH_EVERY = 100000
+
+    def __init__(self, shared=False, time_limit=None):
+        """
+        @param shared if True, the counts are totalled across worker processes
+        @param time_limit optional number of seconds after which recording raises _SearchTimeout
+        """
+        self.start_time = datetime.now()
+        self.deadline = None if time_limit is None else time.monotonic() + time_limit
+        self.last_interrupt = datetime.now()
+        self.checked_solns = 0
+        self.nodes_expanded = 0
+        self.subtrees_pruned = 0
+        self.last_soln = []
+        self.units_done = 0
+        self.units_total = 0
+        # Number of candidates in the whole search, if known, for estimating the time left
+        self.total_solns = None
+        # (seconds since the start, jinxes) for each improvement to the best script
+        self.history = []
+        # The _SolutionCollector of the running search, if any
+        self.solutions = None
+        # The _ProgressReporter to send improvements to, if any
+        self.reporter = None
+        # (time.perf_counter(), solutions checked) when the first was recorded, once setup is done
+        self.first_record = None
+
+        self._flushed = [0, 0, 0]
+        self._shared_counts = multiprocessing.Array('q', 3) if shared else None
+
+    def __getstate__(self):
+        # The reporter's thread and file stay with the parent process
+        state = self.__dict__.copy()
+        state["reporter"] = None
+        return state
+
+    def record(self, soln, count=1):
+        """Count count more checked solutions, the last of which was soln"""
+        self.checked_solns += count
+        if self.first_record is None:
+            self.first_record = (time.perf_counter(), self.checked_solns)
+        self.last_soln = soln
+        if self._shared_counts is not None and \
+                self.checked_solns - self._flushed[0] >= self.FLUSH_EVERY:
+            self.flush()
+        self.check_deadline()
+
+    def record_expanded(self, count=1):
+        """Count count more search nodes expanded into their children"""
+        self.nodes_expanded += count
+        self.check_deadline()
+
+    def record_pruned(self, count=1):
+        """Count count more subtrees cut off without being searched"""
+        self.subtrees_pruned += count
+
+    def record_improvement(self, num_jinxes):
+        """Note that the best script found now has num_jinxes"""
+        elapsed = (datetime.now() - self.start_time).total_seconds()
+        self.history.append((elapsed, num_jinxes))
+        if self.reporter is not None:
+            self.reporter.write("improvement", jinxes=num_jinxes)
+
+    def check_deadline(self):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise _SearchTimeout()
+
+    def _get_local_counts(self):
+        return [self.checked_solns, self.nodes_expanded, self.subtrees_pruned]
+
+    def flush(self):
+        """Add any locally made counts to the shared totals"""
+        if self._shared_counts is None:
+            return
+        counts = self._get_local_counts()
+        with self._shared_counts.get_lock():
+            for i, count in enumerate(counts):
+                self._shared_counts[i] += count - self._flushed[i]
+        self._flushed = counts
+
+    def get_counts(self):
+        """Returns [checked, expanded, pruned] across every process"""
+        counts = self._get_local_counts()
+        if self._shared_counts is None:
+            return counts
+        return [self._shared_counts[i] + count - self._flushed[i]
+                for i, count in enumerate(counts)]
+
+    def get_checked(self):
+        return self.get_counts()[0]
+
+    def get_snapshot(self):
+        """Dict of the search's state, for status reports and telemetry"""
+        elapsed = (datetime.now() - self.start_time).total_seconds()
+        checked, expanded, pruned = self.get_counts()
+        rate = checked / elapsed if elapsed > 0 else 0
+        snapshot = {
+            "elapsed_seconds": elapsed,
+            "checked": checked,
+            "nodes_expanded": expanded,
+            "subtrees_pruned": pruned,
+            "checked_per_second": rate,
+            "best": None,
+            "eta_seconds": None,
+        }
+        if self.solutions is not None and len(self.solutions) > 0:
+            snapshot["best"] = self.solutions.best
+        if self.total_solns is not None and rate > 0:
+            snapshot["eta_seconds"] = max(self.total_solns - checked, 0) / rate
+        if self.units_total > 0:
+            snapshot["units_done"] = self.units_done
+            snapshot["units_total"] = self.units_total
+        return snapshot
+
+    def format_snapshot(self):
+        """One-line status from get_snapshot"""
+        snapshot = self.get_snapshot()
+        elapsed = format_duration(snapshot["elapsed_seconds"])
+        status = f'Checked {snapshot["checked"]} in {elapsed}' \
+            f' ({snapshot["checked_per_second"]:,.0f}/s).'
+        if snapshot["nodes_expanded"] > 0:
+            status += f' Expanded {snapshot["nodes_expanded"]} nodes,' \
+                f' pruned {snapshot["subtrees_pruned"]}.'
+        if "units_total" in snapshot:
+            status += f' Finished {snapshot["units_done"]}/{snapshot["units_total"]} work units.'
+        if snapshot["best"] is not None:
+            status += f' Best so far has {snapshot["best"]} jinxes' \
+                f' ({len(self.solutions)} scripts kept).'
+        if snapshot["eta_seconds"] is not None:
+            status += f' About {format_duration(snapshot["eta_seconds"])} left.'
+        return status
+
+    def sigusr1_handler(self, _signum, _frame):
+        """Print a status report, and carry on"""
+        print(f'SIGUSR1: {self.format_snapshot()} Last seen:\n  {self.last_soln}')
+
+    def sigint_handler(self, _signum, _frame):
+        """Update on status. Should be SIGINFO, but no library support"""
+        curr_time = datetime.now()
+        print(f'SIGINT: {self.format_snapshot()} Last seen:\n  {self.last_soln}')
+        if (curr_time - self.last_interrupt).total_seconds() < 5:
+            raise KeyboardInterrupt("")
+        self.last_interrupt = curr_time
+
+
+class _ProgressReporter():
+    """
+    Reports on a running search from a background thread, so that the search itself never has to
+    stop to do so. Every interval seconds it prints a status line and/or appends a snapshot to a
+    JSON-lines telemetry file. Improvements to the best script are written to the telemetry as
+    they happen, for plotting convergence.
+    """
+    def __init__(self, progress, interval, print_status=True, telemetry_file=None):
+        """
+        @param progress the _SearchProgress to report on
+        @param interval seconds between reports
+        @param print_status if True, print each report
+        @param telemetry_file optional filename to append each report to, as a JSON line
+        """
+        self.progress = progress
+        self.interval = interval
+        self.print_status = print_status
+        self.telemetry = None if telemetry_file is None else open(telemetry_file, "a")
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.progress.reporter = self
+        self.write("start")
+        self._thread.start()
+
+    def stop(self):
+        """Stop reporting, after one last report"""
+        self._stopped.set()
+        self._thread.join()
+        self.write("end")
+        self.progress.reporter = None
+        if self.telemetry is not None:
+            self.telemetry.close()
+            self.telemetry = None
+
+    def write(self, event, **fields):
+        """Append a snapshot, with the event name and any extra fields, to the telemetry"""
+        if self.telemetry is None:
+            return
+        line = {"event": event, "time": datetime.now().isoformat()}
+        line.update(self.progress.get_snapshot())
+        line.update(fields)
+        with self._lock:
+            self.telemetry.write(json.dumps(line) + "\n")
+            self.telemetry.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            if self.print_status:
+                print(f"Status: {self.progress.format_snapshot()}")
+            self.write("snapshot")
+
+
+class _Incumbent():
+    """
+    The best jinx count found so far. When shared, it is held in shared memory so that any worker
+    process can prune against another's improvement straight away.
+    """
+    def __init__(self, value=-1, shared=False):
+        self._value = value
+        self._shared_value = multiprocessing.Value('i', value) if shared else None
+
+    def get(self):
+        if self._shared_value is None:
+            return self._value
+        return self._shared_value.value
+
+    def offer(self, value):
+        """Raise the incumbent to value if it is better. Returns whether it was"""
+        if self._shared_value is None:
+            if value <= self._value:
+                return False
+            self._value = value
+            return True
+        with self._shared_value.get_lock():
+            if value <= self._shared_value.value:
+                return False
+            self._shared_value.value = value
+            return True
+
+
+class _SolutionCollector():
+    """
+    The best scripts found by a search, held as bitmasks. With a limit, keeps the top limit
+    scripts by jinx count; without one, keeps every script tied with the best, however many there
+    are. Earlier finds are kept over later ties. Each script kept can also be streamed to a
+    JSON-lines file as it is found, so long searches give results before they finish.
+    """
+    def __init__(self, graph, limit=None, unique=True, stream_file=None, on_improvement=None):
+        """
+        @param graph the _JinxGraph the script masks are over
+        @param limit maximum number of scripts to keep, or None to keep every tie with the best
+        @param unique if True, a script found more than once is only kept once
+        @param stream_file optional filename to append each script kept to, as a JSON line
+        @param on_improvement optional callable, called with the jinxes of each new best script
+        """
+        self.graph = graph
+        self.limit = limit
+        self.unique = unique
+        self.stream_file = stream_file
+        self.on_improvement = on_improvement
+        self.best = -1
+
+        # (jinxes, -find order, mask). A min-heap when limited, so the worst and latest goes first
+        self._kept = []
+        self._masks = set()
+        self._num_found = 0
+        self._stream = None
+
+    def __len__(self):
+        return len(self._kept)
+
+    def __getstate__(self):
+        # Open files cannot be sent to worker processes
+        state = self.__dict__.copy()
+        state["_stream"] = None
+        return state
+
+    def get_threshold(self):
+        """Fewest jinxes a script needs to be kept"""
+        if self.limit is None:
+            return max(self.best, 0)
+        if len(self._kept) < self.limit:
+            return 0
+        return self._kept[0][0] + 1
+
+    def offer(self, mask, num_jinxes):
+        """Keep the script bitmask, which has num_jinxes, if it is good enough. Returns if it was"""
+        if num_jinxes < self.get_threshold() or (self.unique and mask in self._masks):
+            return False
+
+        entry = (num_jinxes, -self._num_found, mask)
+        self._num_found += 1
+        if self.limit is None:
+            if num_jinxes > self.best:
+                self._kept = []
+                self._masks.clear()
+            self._kept.append(entry)
+        elif len(self._kept) < self.limit:
+            heapq.heappush(self._kept, entry)
+        else:
+            self._masks.discard(heapq.heapreplace(self._kept, entry)[2])
+        if self.unique:
+            self._masks.add(mask)
+        if num_jinxes > self.best:
+            self.best = num_jinxes
+            if self.on_improvement is not None:
+                self.on_improvement(num_jinxes)
+
+        if self.stream_file is not None:
+            if self._stream is None:
+                self._stream = open(self.stream_file, "a")
+            json.dump({"jinxes": num_jinxes, "script": self.graph.to_names(mask)}, self._stream)
+            self._stream.write("\n")
+            self._stream.flush()
+        return True
+
+    def offer_script(self, script):
+        """Keep the list of character names if it is good enough. Returns if it was"""
+        return self.offer(self.graph.to_mask(script), self.graph.get_num_jinxes(script))
+
+    def get_solutions(self):
+        """The scripts kept as lists of character names, most jinxes first then earliest found"""
+        return [self.graph.to_names(mask) for _, _, mask in sorted(self._kept, reverse=True)]
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+
+class _Checkpoint():
+    """
+    Periodically saved state of a search, so that a long run can be resumed. Saved as JSON, and
+    only accepted back when taken against the same jinx graph and search setup.
+    """
+    VERSION = 1
+
+    def __init__(self, filename, fingerprint, interval=60):
+        """
+        @param filename file to save to. Replaced atomically on each save.
+        @param fingerprint string identifying the graph and search the state belongs to
+        @param interval minimum number of seconds between saves
+        """
+        self.filename = filename
+        self.fingerprint = fingerprint
+        self.interval = interval
+        self.last_save = time.monotonic()
+
+    def is_due(self):
+        return time.monotonic() - self.last_save >= self.interval
+
+    def save(self, position, solutions, progress):
+        """
+        @param position JSON-compatible, strategy-specific place to resume from
+        @param solutions list of the best solutions found so far
+        @param progress _SearchProgress of the search
+        """
+        state = {
+            "version": self.VERSION,
+            "fingerprint": self.fingerprint,
+            "position": position,
+            "solutions": solutions,
+            "checked_solns": progress.get_checked(),
+            "elapsed_seconds": (datetime.now() - progress.start_time).total_seconds(),
+        }
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, 'w') as file:
+            json.dump(state, file)
+        os.replace(temp_filename, self.filename)
+        self.last_save = time.monotonic()
+
+    def load(self):
+        """Returns the saved state. Raises ValueError if it does not belong to this search"""
+        with open(self.filename, 'r') as file:
+            state = json.load(file)
+        if state.get("version") != self.VERSION:
+            raise ValueError(f"Checkpoint {self.filename} is from an incompatible version")
+        if state.get("fingerprint") != self.fingerprint:
+            raise ValueError(f"Checkpoint {self.filename} was taken against different jinx data " +
+                             "or search settings")
+        return state
+
+    def remove(self):
+        """Remove the saved state once the search is complete"""
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+class _DataDiff():
+    """
+    The changes to the characters and jinxes between the data a search's results were saved
+    against and the current data. Saved scripts can then be re-scored by the jinxes which changed,
+    rather than from scratch.
+    """
+    def __init__(self, old_types=None, old_edges=None, graph=None, types=None):
+        """
+        With no arguments, the data is unchanged.
+        @param old_types dict of character name to team, as saved
+        @param old_edges list of [name, name] for each jinx, as saved
+        @param graph the current _JinxGraph
+        @param types the current dict of character name to team
+        """
+        if graph is None:
+            self.added_chars = self.removed_chars = self.moved_chars = []
+            self.added_edges = self.removed_edges = []
+            return
+        self.added_chars = sorted(set(types.keys()) - set(old_types.keys()))
+        self.removed_chars = sorted(set(old_types.keys()) - set(types.keys()))
+        self.moved_chars = sorted(char for char, team in types.items()
+                                  if char in old_types and old_types[char] != team)
+        old_edges = {tuple(edge) for edge in old_edges}
+        new_edges = set(graph.get_edges())
+        self.added_edges = sorted(new_edges - old_edges)
+        self.removed_edges = sorted(old_edges - new_edges)
+
+    def is_empty(self):
+        return len(self.added_chars) == len(self.removed_chars) == len(self.moved_chars) == \
+            len(self.added_edges) == len(self.removed_edges) == 0
+
+    def rescore(self, script, num_jinxes):
+        """
+        Jinxes in a saved script under the current data, from num_jinxes under the saved data.
+        Returns None if the script is no longer valid, as a character was removed or changed team.
+        - Complexity: O(changed jinxes)
+        """
+        chars = set(script)
+        if any(char in chars for char in self.removed_chars + self.moved_chars):
+            return None
+        num_jinxes += sum(1 for char_1, char_2 in self.added_edges
+                          if char_1 in chars and char_2 in chars)
+        num_jinxes -= sum(1 for char_1, char_2 in self.removed_edges
+                          if char_1 in chars and char_2 in chars)
+        return num_jinxes
+
+    def get_touched(self):
+        """
+        Characters which could be in a script with more jinxes than before: those added, those
+        which changed team, and either end of a new jinx. A script of only untouched characters
+        has at most the jinxes it had under the saved data.
+        """
+        touched = set(self.added_chars + self.moved_chars)
+        for edge in self.added_edges:
+            touched.update(edge)
+        return sorted(touched)
+
+    def describe(self):
+        return f"{len(self.added_chars)} characters added, {len(self.removed_chars)} removed " \
+            f"and {len(self.moved_chars)} moved team; {len(self.added_edges)} jinxes added and " \
+            f"{len(self.removed_edges)} removed"
+
+
+class _ResultStore():
+    """
+    The best scripts of each distribution searched, saved as JSON along with the characters and
+    jinxes they were found against. When the data changes, loading diffs it against the saved
+    data and re-scores the saved scripts, so that the next search can start from them.
+    """
+    VERSION = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        # Distribution (see format_distribution) to a dict of:
+        #   "solutions": list of (jinxes, script) under the current data
+        #   "best": most jinxes found under the saved data
+        #   "exact": whether "best" was proven to be the optimum under the saved data
+        #   "floor": if exact, every script with more jinxes than this under the saved data was
+        #     saved. The best, or lower for an exact top K search
+        self.results = {}
+        # _DataDiff from the saved data to the current data, once loaded
+        self.diff = None
+
+    @staticmethod
+    def get_fingerprint(graph, types):
+        contents = {"graph": graph.get_fingerprint(), "types": types}
+        return hashlib.sha256(json.dumps(contents, sort_keys=True).encode()).hexdigest()
+
+    def load(self, graph, types):
+        """
+        Read the saved results, re-scored against the current data. Returns the _DataDiff, or None
+        if nothing has been saved yet. Raises ValueError if saved by an incompatible version.
+        """
+        if not os.path.exists(self.filename):
+            return None
+        with open(self.filename, 'r') as file:
+            state = json.load(file)
+        if state.get("version") != self.VERSION:
+            raise ValueError(f"Results {self.filename} are from an incompatible version")
+
+        if state["fingerprint"] == self.get_fingerprint(graph, types):
+            self.diff = _DataDiff()
+        else:
+            self.diff = _DataDiff(state["characters"], state["jinxes"], graph, types)
+        for key, result in state["results"].items():
+            solutions = []
+            for saved in result["solutions"]:
+                num_jinxes = self.diff.rescore(saved["script"], saved["jinxes"])
+                if num_jinxes is not None:
+                    solutions.append((num_jinxes, saved["script"]))
+            self.results[key] = {
+                "solutions": solutions,
+                "best": result["best"],
+                "exact": result["exact"],
+                "floor": result.get("floor", result["best"]),
+            }
+        return self.diff
+
+    def save(self, graph, types, distribution, solutions, exact, floor=None):
+        """
+        Save the solutions for the distribution against the current data. Results for other
+        distributions are kept, re-scored, but are no longer known to be exact if the data changed.
+        @param solutions list of the best solutions found
+        @param exact whether the best of the solutions is proven to be the optimum
+        @param floor if exact, the jinxes above which every script is among the solutions. Defaults
+          to the best of them
+        """
+        changed = self.diff is not None and not self.diff.is_empty()
+        results = {}
+        for key, result in self.results.items():
+            results[key] = {
+                "best": max((num_jinxes for num_jinxes, _ in result["solutions"]), default=0)
+                if changed else result["best"],
+                "exact": result["exact"] and not changed,
+                "floor": result["floor"],
+                "solutions": [{"jinxes": num_jinxes, "script": soln}
+                              for num_jinxes, soln in result["solutions"]],
+            }
+        scored = [(graph.get_num_jinxes(soln), soln) for soln in solutions]
+        best = max((num_jinxes for num_jinxes, _ in scored), default=0)
+        results[format_distribution(distribution)] = {
+            "best": best,
+            "exact": exact,
+            "floor": best if floor is None else floor,
+            "solutions": [{"jinxes": num_jinxes, "script": soln} for num_jinxes, soln in scored],
+        }
+        state = {
+            "version": self.VERSION,
+            "fingerprint": self.get_fingerprint(graph, types),
+            "characters": types,
+            "jinxes": graph.get_edges(),
+            "results": results,
+        }
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, 'w') as file:
+            json.dump(state, file)
+        os.replace(temp_filename, self.filename)
 
 
 class _JinxGraph():
-    def __init__(self, jinx_dict):
+    def __init__(self, jinx_dict, char_names=None):
         """
-        Create a new JinxGraph.
+        Create a new JinxGraph. Each character is given a dense integer id, and each character's
+        jinxes are stored as an int bitmask of those ids. A script can then be held as a bitmask,
+        and its jinxes counted with popcounts rather than list membership tests.
         @param jinx_dict dictionary of jinxes in format:
         {
             <char_name>: {
@@ -68,86 +695,686 @@ class _JinxGraph():
                 ...
             }, ...
         }
-        NOTE: It is assumed that jinx_dict stores jinxes such that <char_name> is alphabetically
-          before <jinxed_char_name>. Otherwise, get_num_jinxes will not work. This is because the
-          adjacency list does not currently create reverse adjacencies. (The other order is allowed
-          to be present, but may not be the only ordering.)
+        A jinx may be stored under either character (or both), as reverse adjacencies are created.
+        @param char_names optional iterable of character names to assign ids to up-front, so that
+          unjinxed characters can also be represented in a script mask.
         """
-        # Create adjacency list
-        self.adj_list = {}
+        self.ids = {}
+        self.names = []
+        self.adj_masks = []
         self.total_edges = 0
 
+        if char_names is not None:
+            for char_name in char_names:
+                self._add_character(char_name)
+
+        # Create adjacency bitmasks
         for char_name in jinx_dict.keys():
             for jinxed_char_name in jinx_dict[char_name].keys():
-                dict_member_append(self.adj_list, char_name, jinxed_char_name)
-                dict_member_append(self.adj_list, jinxed_char_name, char_name)
+                char_id = self._add_character(char_name)
+                jinxed_id = self._add_character(jinxed_char_name)
+                if self.adj_masks[char_id] >> jinxed_id & 1:
+                    # Already stored under the other character
+                    continue
+                self.adj_masks[char_id] |= 1 << jinxed_id
+                self.adj_masks[jinxed_id] |= 1 << char_id
                 self.total_edges += 1
 
-        self.total_nodes = len(list(self.adj_list.keys()))
+        # Mask of every character with at least one jinx
+        self.jinxed_mask = 0
+        for char_id, adj_mask in enumerate(self.adj_masks):
+            if adj_mask:
+                self.jinxed_mask |= 1 << char_id
+        self.total_nodes = self.jinxed_mask.bit_count()
+
+    def _add_character(self, char_name):
+        """Assign char_name the next dense id if it does not have one. Returns the id"""
+        char_id = self.ids.get(char_name)
+        if char_id is None:
+            char_id = len(self.names)
+            self.ids[char_name] = char_id
+            self.names.append(char_name)
+            self.adj_masks.append(0)
+        return char_id
 
     def get_total_num_jinxes(self):
-        return self._total_edges
+        return self.total_edges
+
+    def get_fingerprint(self):
+        """Hash of the characters and their jinxes, for spotting when the data has changed"""
+        contents = {name: sorted(self.to_names(self.adj_masks[char_id]))
+                    for char_id, name in enumerate(self.names)}
+        return hashlib.sha256(json.dumps(contents, sort_keys=True).encode()).hexdigest()
+
+    def get_edges(self):
+        """Returns a sorted list of (name, name) for each jinx, with each pair's names sorted"""
+        edges = []
+        for char_id, adj_mask in enumerate(self.adj_masks):
+            for other_id in iter_bits(adj_mask >> char_id + 1 << char_id + 1):
+                edges.append(tuple(sorted((self.names[char_id], self.names[other_id]))))
+        return sorted(edges)
 
     def get_num_jinxed_chars(self):
         return self.total_nodes
 
     def get_highest_num_jinxes(self):
         best = 0
-        for char_name in self.adj_list.keys():
-            current = len(self.adj_list[char_name])
+        for adj_mask in self.adj_masks:
+            current = adj_mask.bit_count()
             if current > best:
                 best = current
         return best
 
+    def get_id(self, char_name):
+        return self.ids.get(char_name)
+
     def get_degree(self, char_name):
-        if self.adj_list.get(char_name) is None:
+        char_id = self.ids.get(char_name)
+        if char_id is None:
             return 0
-        return len(self.adj_list[char_name])
+        return self.adj_masks[char_id].bit_count()
 
-    def get_num_jinxes(self, char_list):
+    def to_mask(self, char_list):
         """
-        Returns number of jinxes obtained by having the character set in play.
-        Uses the fact that jinxes are stored under the character which is first alphabetically.
+        Returns the bitmask of the characters in char_list. Characters without an id have no
+        jinxes, so are left out.
+        """
+        mask = 0
+        for char_name in char_list:
+            char_id = self.ids.get(char_name)
+            if char_id is not None:
+                mask |= 1 << char_id
+        return mask
+
+    def to_names(self, mask):
+        """Returns the list of character names in the bitmask, in id order"""
+        return [self.names[char_id] for char_id in iter_bits(mask)]
+
+    def count_jinxes(self, mask):
+        """Returns number of jinxes within the script bitmask"""
+        adj_masks = self.adj_masks
+        count = 0
+        remaining = mask & self.jinxed_mask
+        while remaining:
+            lowest = remaining & -remaining
+            count += (adj_masks[lowest.bit_length() - 1] & mask).bit_count()
+            remaining ^= lowest
+        # Each jinx was counted from both ends
+        return count // 2
+
+    def count_jinxes_between(self, mask_1, mask_2):
         """
+        Returns number of jinxes with one character in mask_1 and the other in mask_2. The masks
+        are expected to be disjoint, which allows extending a scored script one team at a time.
+        """
+        adj_masks = self.adj_masks
         count = 0
-        search_space = char_list[:]
-        # Remove unjinxed characters
-        for i in range(len(search_space) - 1, -1, -1):
-            if self.adj_list.get(search_space[i]) is None:
-                del search_space[i]
-
-        # Sort alphabetically (expects that half of the adjacency list)
-        search_space = sorted(search_space)
-
-        # For each remaining character, only check the characters after it in the list
-        for i in range(len(search_space)):
-            char_name = search_space[i]
-            for j in range(i + 1, len(search_space)):
-                jinxed_char_name = search_space[j]
-                if jinxed_char_name in self.adj_list[char_name]:
-                    count += 1
+        remaining = mask_1 & self.jinxed_mask
+        while remaining:
+            lowest = remaining & -remaining
+            count += (adj_masks[lowest.bit_length() - 1] & mask_2).bit_count()
+            remaining ^= lowest
         return count
 
+    def count_jinxes_into(self, char_name, mask):
+        """Returns number of jinxes between char_name and the characters in mask"""
+        char_id = self.ids.get(char_name)
+        if char_id is None:
+            return 0
+        return (self.adj_masks[char_id] & mask).bit_count()
+
+    def get_num_jinxes(self, char_list):
+        """
+        Returns number of jinxes obtained by having the character set in play.
+        """
+        return self.count_jinxes(self.to_mask(char_list))
+
     def get_num_jinxes_per_character(self, char_list):
         """
         Returns a dict of the count of jinxes which apply to the character when chars are
         limited to what is in char_list
         """
-        counts = {char_name: 0 for char_name in char_list}
-        search_space = char_list[:]
-        # Remove unjinxed characters
-        for i in range(len(search_space) - 1, -1, -1):
-            if self.adj_list.get(search_space[i]) is None:
-                del search_space[i]
-
-        # Expects bidirectional adjacency list
-        for char_name in search_space:
-            for jinxed_char_name in self.adj_list[char_name]:
-                if jinxed_char_name in search_space:
-                    counts[char_name] += 1
+        mask = self.to_mask(char_list)
+        return {char_name: self.count_jinxes_into(char_name, mask) for char_name in char_list}
+
+
+class _BatchEvaluator():
+    """
+    Scores blocks of complete scripts with matrix products. A script encoded as a 0/1 row x over
+    the character ids has diag(x·A·xᵀ) / 2 jinxes, for the jinx adjacency matrix A. When x is a
+    fixed prefix p plus a minion row m and a demon row d, that splits into terms for each part and
+    the cross terms between them, so a whole block of minion x demon combinations is scored with
+    one broadcast add of precomputed vectors and the M·A·Dᵀ cross matrix.
+    """
+    # Upper bound on the scripts scored per block, to keep memory use down
+    BATCH_SIZE = 1 << 20
+    # Largest minion x demon cross matrix kept between blocks rather than recomputed
+    CROSS_CACHE_SIZE = 1 << 24
+
+    def __init__(self, graph, minion_masks, demon_masks):
+        """
+        @param graph the _JinxGraph to build the adjacency matrix from
+        @param minion_masks list of bitmasks of each minion combination, in search order
+        @param demon_masks list of bitmasks of each demon combination, in search order
+        """
+        self.num_chars = len(graph.names)
+        # Counts are small integers, so float32 is exact and keeps the products in BLAS
+        self.adjacency = self.encode(graph.adj_masks)
+
+        self.minions = self.encode(minion_masks)
+        self.demons = self.encode(demon_masks)
+        self.minions_adj = self.minions @ self.adjacency
+        self.demons_adj = self.demons @ self.adjacency
+        self.minion_jinxes = self.score_batch(self.minions)
+        self.demon_jinxes = self.score_batch(self.demons)
+
+        self.block_rows = max(1, self.BATCH_SIZE // len(demon_masks))
+        self.cross = None
+        if len(minion_masks) * len(demon_masks) <= self.CROSS_CACHE_SIZE:
+            self.cross = self.get_cross(0, len(minion_masks))
+
+    def encode(self, masks):
+        """Returns the 0/1 matrix with a row for each bitmask"""
+        rows = numpy.zeros((len(masks), self.num_chars), dtype=numpy.float32)
+        for row, mask in zip(rows, masks):
+            row[list(iter_bits(mask))] = 1
+        return rows
+
+    def score_batch(self, rows):
+        """Returns the number of jinxes in each 0/1 encoded script row"""
+        return numpy.einsum("ij,ij->i", rows @ self.adjacency, rows) / 2
+
+    def get_cross(self, start, stop):
+        """Jinxes between minion combinations [start, stop) and every demon combination"""
+        if self.cross is not None:
+            return self.cross[start:stop]
+        return self.minions_adj[start:stop] @ self.demons.T
+
+    def score_block(self, prefix_mask, prefix_jinxes, start, stop):
+        """
+        Returns the matrix of jinxes in the scripts made from the prefix, each of the minion
+        combinations [start, stop) (rows) and each of the demon combinations (columns)
+        @param prefix_mask bitmask of the characters chosen from the other teams
+        @param prefix_jinxes number of jinxes within the prefix
+        """
+        prefix = self.encode([prefix_mask])[0]
+        minion_scores = self.minion_jinxes[start:stop] + self.minions_adj[start:stop] @ prefix
+        demon_scores = self.demon_jinxes + self.demons_adj @ prefix
+        return prefix_jinxes + minion_scores[:, None] + demon_scores[None, :] + \
+            self.get_cross(start, stop)
+
+
+class _BranchAndBound():
+    """
+    Branch and bound over a categorised search space, picking characters category by category.
+    A node is a partial script held as a tuple of:
+        (score, chosen mask, category depth, candidate position, slots left in the category)
+    so that open nodes can be handed to other processes as work units.
+    """
+    def __init__(self, search, graph, space):
+        """
+        @param search the Search, whose incumbent is pruned against and whose progress is updated
+        @param graph the _JinxGraph to score with
+        @param space dict of team name to list of candidate character names
+        """
+        self.search = search
+        self.graph = graph
+        adj_masks = graph.adj_masks
+
+        # Candidates in each category, most jinxed first so that strong scripts are found early
+        self.candidates = {}
+        for category in self.search.distribution.keys():
+            char_ids = [graph.get_id(char) for char in space[category]]
+            self.candidates[category] = sorted(char_ids,
+                                               key=lambda c: -adj_masks[c].bit_count())
+
+        # Fill the categories with the most jinx potential per slot first, as they tighten the
+        # bound the most. Categories with no slots have nothing to pick, so are left out.
+        def _potential(category):
+            slots = self.search.distribution[category]
+            degrees = [adj_masks[char_id].bit_count() for char_id in self.candidates[category]]
+            return sum(degrees[:slots]) / slots
+        self.category_order = sorted((category for category, slots
+                                      in self.search.distribution.items() if slots > 0),
+                                     key=_potential, reverse=True)
+
+        # remaining[category][i] is the mask of candidates[category][i:]
+        self.remaining = {}
+        for category in self.category_order:
+            candidates = self.candidates[category]
+            self.remaining[category] = [0] * (len(candidates) + 1)
+            for i in range(len(candidates) - 1, -1, -1):
+                self.remaining[category][i] = self.remaining[category][i + 1] | 1 << candidates[i]
+
+    def get_root(self):
+        if len(self.category_order) == 0:
+            # An empty distribution has only the empty script
+            return (0, 0, 0, 0, 0)
+        return (0, 0, 0, 0, self.search.distribution[self.category_order[0]])
+
+    def is_complete(self, node):
+        _, _, depth, _, slots = node
+        return slots == 0 and depth + 1 >= len(self.category_order)
+
+    def get_bound(self, score, chosen, undecided):
+        """
+        Admissible upper bound on the jinxes reachable by completing a partial script.
+        @param score jinxes already locked in by the chosen characters
+        @param chosen bitmask of the characters already in the script
+        @param undecided list of (mask, slots) for each category still to fill, where mask holds
+          the characters which could still be picked for that category's remaining slots
+        Each undecided character can gain at most its jinxes into the chosen characters, plus half
+        of its jinxes into whatever else gets picked (capped by the slots left in each category).
+        The best possible gains for each category's remaining slots are then summed.
+        When re-optimising after a change to the data, partial scripts which cannot reach any
+        touched character are also bounded by the saved floor, as any better scripts they hold
+        were saved and have already been offered.
+        """
+        adj_masks = self.graph.adj_masks
+        # Work in half-jinxes to stay in integers
+        bound = 2 * score
+        for mask, slots in undecided:
+            if slots == 0:
+                continue
+            gains = []
+            for char_id in iter_bits(mask & self.graph.jinxed_mask):
+                adj_mask = adj_masks[char_id]
+                gain = 2 * (adj_mask & chosen).bit_count()
+                for other_mask, other_slots in undecided:
+                    gain += min((adj_mask & other_mask).bit_count(), other_slots)
+                gains.append(gain)
+            gains.sort(reverse=True)
+            bound += sum(gains[:slots])
+        bound //= 2
+
+        # A script of only untouched characters has no more jinxes than it did under the saved
+        # data, so unless it was saved, no more than the saved floor
+        if self.search._unchanged_floor is not None and bound > self.search._unchanged_floor:
+            reachable = chosen
+            for mask, slots in undecided:
+                if slots > 0:
+                    reachable |= mask
+            if reachable & self.search._touched_mask == 0:
+                bound = self.search._unchanged_floor
+        return bound
+
+    def get_threshold(self):
+        """
+        Fewest jinxes a completed script must have to be worth searching for. When keeping the top
+        K, that is what the collector needs to keep a script, so scripts below the best are still
+        found. Otherwise it is one more than the incumbent, so ties with it are not enumerated.
+        """
+        solutions = self.search._collect(self.graph)
+        if solutions.limit is not None:
+            return solutions.get_threshold()
+        return self.search.incumbent.get() + 1
+
+    def get_children(self, node):
+        """Children of an incomplete node, or [] if its bound cannot reach get_threshold"""
+        score, chosen, depth, pos, slots = node
+        if slots == 0:
+            # Move on to the next category
+            depth += 1
+            pos = 0
+            slots = self.search.distribution[self.category_order[depth]]
+
+        undecided = [(self.remaining[self.category_order[depth]][pos], slots)]
+        for category in self.category_order[depth + 1:]:
+            undecided.append((self.remaining[category][0], self.search.distribution[category]))
+        if self.get_bound(score, chosen, undecided) < self.get_threshold():
+            self.search.progress.record_pruned()
+            return []
+        self.search.progress.record_expanded()
+
+        adj_masks = self.graph.adj_masks
+        candidates = self.candidates[self.category_order[depth]]
+        children = []
+        for i in range(pos, len(candidates) - slots + 1):
+            char_id = candidates[i]
+            children.append((score + (adj_masks[char_id] & chosen).bit_count(),
+                             chosen | 1 << char_id, depth, i + 1, slots - 1))
+        return children
+
+    def _check_complete(self, node):
+        """Record a complete script, offering it to the search's solutions and incumbent"""
+        self.search.progress.record(self.graph.to_names(node[1]))
+        self.search.incumbent.offer(node[0])
+        self.search._collect(self.graph).offer(node[1], node[0])
+
+    def search_from(self, nodes=None):
+        """
+        Depth-first search of the subtrees under the open nodes (or the root). Each complete script
+        reached is offered to the search's solutions, which raise the incumbent as they go.
+        @param nodes list of open nodes, in the order to visit them
+        """
+        # The next node to visit is on top
+        stack = [self.get_root()] if nodes is None else list(reversed(nodes))
+        while len(stack) > 0:
+            node = stack.pop()
+            if self.is_complete(node):
+                self._check_complete(node)
+                continue
+            stack += reversed(self.get_children(node))
+            self.search._maybe_save_checkpoint(lambda: {"open_nodes": stack[::-1]})
 
+    def split(self, num_nodes):
+        """
+        Expand the tree breadth-first until there are at least num_nodes open nodes, or nothing is
+        left to expand. Returns the open nodes, ordered as a depth-first search would visit them.
+        Complete scripts found on the way are offered to the search's solutions.
+        """
+        frontier = [self.get_root()]
+        while 0 < len(frontier) < num_nodes:
+            next_frontier = []
+            for node in frontier:
+                if self.is_complete(node):
+                    self._check_complete(node)
+                else:
+                    next_frontier += self.get_children(node)
+            frontier = next_frontier
+        return frontier
+
+
+class _SpaceReduction():
+    """
+    Shrinks a categorised search space before branching, without losing the optimum:
+    - Same-team characters with identical jinxes are interchangeable. Each such equivalence class
+      only needs as many representatives as the team has slots.
+    - A character whose jinxes are a strict subset of those of at least as many same-team
+      characters as the team has slots can always be swapped for one of them without losing a
+      jinx, so it is removed from the branching. The swap can leave the jinxes unchanged, or
+      lose fewer than another script would, so this only keeps the single optimum, not its ties
+      or the next best scripts.
+    Solutions found in the reduced space are then expanded into every equivalent script.
+    """
+    def __init__(self, graph, space, distribution, dominate=True):
+        """
+        @param graph the _JinxGraph to compare jinxes in
+        @param space dict of team name to list of candidate character names
+        @param distribution dict of team name to the number of characters picked from it
+        @param dominate whether to remove dominated characters as well as collapsing
+          interchangeable ones
+        """
+        self.original_space = space
+        self.space = {}
+        self.removed = {}
+        # Character name to the full list of its equivalence class
+        self.class_of = {}
+
+        for team, chars in space.items():
+            slots = distribution[team]
+            classes = {}
+            for char in chars:
+                dict_member_append(classes, graph.adj_masks[graph.get_id(char)], char)
+
+            kept = set()
+            self.removed[team] = []
+            for neighbours, members in classes.items():
+                num_dominators = sum(len(others) for other, others in classes.items()
+                                     if other != neighbours and neighbours & other == neighbours)
+                if dominate and num_dominators >= slots:
+                    self.removed[team] += members
+                    continue
+                kept.update(members[:slots])
+                for member in members:
+                    self.class_of[member] = members
+            # Keep the original order for the searches to work from
+            self.space[team] = [char for char in chars if char in kept]
+
+    def expand(self, solutions):
+        """Every concrete script equivalent to one of the solutions, without duplicates"""
+        expanded = []
+        seen = set()
+        for soln in solutions:
+            # Number of characters used from each equivalence class
+            picks = {}
+            for char in soln:
+                members = tuple(self.class_of.get(char, [char]))
+                picks[members] = picks.get(members, 0) + 1
+
+            for chosen in product(*[combinations(members, count)
+                                    for members, count in picks.items()]):
+                script = [char for group in chosen for char in group]
+                key = frozenset(script)
+                if key not in seen:
+                    seen.add(key)
+                    expanded.append(script)
+        return expanded
+
+
+class ScriptState():
+    """
+    A script being built by hand, one character at a time. Each character's jinxes into the
+    current script are kept up to date, so adding or removing a character, and the running jinx
+    total, cost O(degree) rather than a rescore of the whole script. A heap per team ranks the
+    characters not in the script by the jinxes they would add, for suggesting the next addition.
+    Heap entries are not removed when a character's jinxes change; newer entries are pushed, and
+    out of date ones are skipped when they reach the top.
+    """
+    def __init__(self, graph, types, chars=()):
+        """
+        @param graph the _JinxGraph to score with. Every character in types needs an id in it
+        @param types dict of character name to team
+        @param chars optional character names to start the script with
+        """
+        self.graph = graph
+        self.types = types
+        self.mask = 0
+        self.num_jinxes = 0
+        # Jinxes between each character, in the script or not, and the script
+        self.gains = [0] * len(graph.names)
+        self.team_sizes = {}
+        for team in types.values():
+            self.team_sizes[team] = self.team_sizes.get(team, 0) + 1
+        # Team to a min-heap of (-jinxes added, name)
+        self._heaps = {team: [] for team in self.team_sizes.keys()}
+        for char in types.keys():
+            self._push(char)
+        for char in chars:
+            self.add(char)
+
+    def __len__(self):
+        return self.mask.bit_count()
+
+    def __contains__(self, char):
+        char_id = self.graph.get_id(char)
+        return char_id is not None and self.mask >> char_id & 1 == 1
+
+    def _get_id(self, char):
+        char_id = self.graph.get_id(char)
+        if char_id is None or char not in self.types:
+            raise ValueError(f"Unknown character {char}")
+        return char_id
+
+    def _push(self, char):
+        """Rank char by its current gain, if it is not in the script"""
+        if char in self.types and char not in self:
+            heap = self._heaps[self.types[char]]
+            heapq.heappush(heap, (-self.gains[self.graph.get_id(char)], char))
+            # Drop the out of date entries once they outnumber the team
+            if len(heap) > 4 * self.team_sizes[self.types[char]]:
+                self._heaps[self.types[char]] = list({entry for entry in heap
+                                                      if self._is_current(entry)})
+                heapq.heapify(self._heaps[self.types[char]])
+
+    def _is_current(self, entry):
+        negative_gain, char = entry
+        return char not in self and -negative_gain == self.gains[self.graph.get_id(char)]
+
+    def _update_neighbours(self, char_id, change):
+        for other_id in iter_bits(self.graph.adj_masks[char_id]):
+            self.gains[other_id] += change
+            self._push(self.graph.names[other_id])
+
+    def add(self, char):
+        """Add char to the script. Returns the jinxes it added"""
+        char_id = self._get_id(char)
+        if char in self:
+            raise ValueError(f"{char} is already in the script")
+        added = self.gains[char_id]
+        self.mask |= 1 << char_id
+        self.num_jinxes += added
+        self._update_neighbours(char_id, 1)
+        return added
+
+    def remove(self, char):
+        """Remove char from the script. Returns the jinxes it took with it"""
+        char_id = self._get_id(char)
+        if char not in self:
+            raise ValueError(f"{char} is not in the script")
+        removed = self.gains[char_id]
+        self.mask &= ~(1 << char_id)
+        self.num_jinxes -= removed
+        self._update_neighbours(char_id, -1)
+        self._push(char)
+        return removed
+
+    def get_num_jinxes(self):
+        return self.num_jinxes
+
+    def get_gain(self, char):
+        """Jinxes between char and the script. For a character in the script, its own jinxes"""
+        return self.gains[self._get_id(char)]
+
+    def get_num_jinxes_per_character(self):
+        """Dict of each character in the script to its jinxes within the script"""
+        return {char: self.gains[self.graph.get_id(char)] for char in self.get_names()}
+
+    def get_team_counts(self):
+        counts = {team: 0 for team in self.team_sizes.keys()}
+        for char in self.get_names():
+            if char in self.types:
+                counts[self.types[char]] += 1
         return counts
 
+    def get_names(self):
+        return self.graph.to_names(self.mask)
+
+    def get_best_additions(self, team, limit=1):
+        """
+        The characters of team not in the script which would add the most jinxes, as a list of
+        up to limit (name, jinxes added), best first and then by name
+        """
+        heap = self._heaps[team]
+        best = []
+        seen = set()
+        while len(heap) > 0 and len(best) < limit:
+            entry = heapq.heappop(heap)
+            if entry[1] in seen or not self._is_current(entry):
+                continue
+            seen.add(entry[1])
+            best.append(entry)
+        # Still the best, so back they go
+        for entry in best:
+            heapq.heappush(heap, entry)
+        return [(char, -negative_gain) for negative_gain, char in best]
+
+
+class _TreeEstimator():
+    """
+    Knuth's estimator of the size of a search tree. Each probe walks from the root to a leaf,
+    picking a child at random, and takes the product of the branching factors seen so far as its
+    estimate of the number of nodes at each depth. The estimate is unbiased however lopsided the
+    tree is, but can vary a lot between probes, so many probes are averaged. Expanding the nodes
+    on the way is timed too, to predict how long the whole tree would take.
+    """
+    def __init__(self, get_children, seed=None):
+        """
+        @param get_children callable returning the list of a node's children, or [] for a leaf
+        @param seed random seed for the probes
+        """
+        self.get_children = get_children
+        self.rng = random.Random(seed)
+
+    def probe(self, root):
+        """One random root-to-leaf walk. Returns (estimated nodes, estimated leaves, expansions)"""
+        node = root
+        weight = 1
+        nodes = 1
+        expanded = 0
+        while True:
+            children = self.get_children(node)
+            if len(children) == 0:
+                return nodes, weight, expanded
+            expanded += 1
+            weight *= len(children)
+            nodes += weight
+            node = self.rng.choice(children)
+
+    def estimate(self, root, probes):
+        """
+        Average probes probes from root. Returns a dict of the estimated "nodes" and "leaves",
+        the "stderr" of the node estimate, and the measured "seconds_per_node" expanded
+        """
+        node_estimates = []
+        leaf_total = 0
+        expanded = 0
+        start = time.perf_counter()
+        for _ in range(probes):
+            nodes, leaves, num_expanded = self.probe(root)
+            node_estimates.append(nodes)
+            leaf_total += leaves
+            expanded += num_expanded
+        elapsed = time.perf_counter() - start
+
+        mean = sum(node_estimates) / probes
+        variance = sum((nodes - mean) ** 2 for nodes in node_estimates) / max(probes - 1, 1)
+        return {
+            "nodes": mean,
+            "leaves": leaf_total / probes,
+            "stderr": math.sqrt(variance / probes),
+            "seconds_per_node": elapsed / max(expanded, 1),
+        }
+
+
+class _SwapState():
+    """
+    A complete script which is changed by swapping one character for another of the same team, so
+    the team counts always stay valid. Keeps each character's jinxes into the current script, so
+    a swap is scored in O(1) and applied in O(degree).
+    """
+    def __init__(self, graph, team_ids, members):
+        """
+        @param graph the _JinxGraph to score with
+        @param team_ids dict of team name to the ids of every character in that team
+        @param members dict of team name to the ids of the characters in the script
+        """
+        self.graph = graph
+        self.teams = list(team_ids.keys())
+        self.members = {team: list(members[team]) for team in self.teams}
+        self.outside = {team: [c for c in team_ids[team] if c not in set(members[team])]
+                        for team in self.teams}
+
+        self.mask = 0
+        for team in self.teams:
+            for char_id in self.members[team]:
+                self.mask |= 1 << char_id
+        self.score = graph.count_jinxes(self.mask)
+        self.gains = [(adj_mask & self.mask).bit_count() for adj_mask in graph.adj_masks]
+
+    def get_swap_delta(self, out_id, in_id):
+        """Change in jinxes if out_id left the script and in_id joined it"""
+        return self.gains[in_id] - self.gains[out_id] - \
+            (self.graph.adj_masks[out_id] >> in_id & 1)
+
+    def swap(self, team, out_index, in_index):
+        """Swap members[team][out_index] with outside[team][in_index]"""
+        out_id = self.members[team][out_index]
+        in_id = self.outside[team][in_index]
+        self.score += self.get_swap_delta(out_id, in_id)
+        self.members[team][out_index] = in_id
+        self.outside[team][in_index] = out_id
+        self.mask ^= 1 << out_id | 1 << in_id
+
+        gains = self.gains
+        for char_id in iter_bits(self.graph.adj_masks[out_id]):
+            gains[char_id] -= 1
+        for char_id in iter_bits(self.graph.adj_masks[in_id]):
+            gains[char_id] += 1
+
+    def get_names(self):
+        return self.graph.to_names(self.mask)
+
 
 class Search:
     MANUAL = 0
@@ -156,41 +1383,283 @@ class Search:
     PEELING_GREEDY = 3
     CONSTRUCTION_GREEDY = 4
     CONSTRUCTION_GREEDY_ALL_STARTS = 5
-
-    def __init__(self, search_type=EXHAUSTION):
-        """Search type: One of Search.* enum, or a callable search func"""
+    BRANCH_AND_BOUND = 6
+    ANNEALING = 7
+    TABU = 8
+    GENETIC = 9
+    AUTO = 10
+
+    # Search types which can be split across worker processes
+    PARALLEL_TYPES = (EXHAUSTION, EXHAUSTION_REDUCED, BRANCH_AND_BOUND)
+    # Search types which prove their best script is the optimum, if they finish
+    EXACT_TYPES = (EXHAUSTION, BRANCH_AND_BOUND)
+    # Search types whose size and runtime can be estimated (see estimate). The greedy
+    # constructions expand each partial script once however it is reached, which probes of their
+    # trees cannot account for
+    ESTIMATED_TYPES = (EXHAUSTION, EXHAUSTION_REDUCED, PEELING_GREEDY, BRANCH_AND_BOUND)
+    # Exhaustive work units are formed by fixing each combination of this category
+    SPLIT_CATEGORY = "demon"
+    # Open nodes to split a bounded search into, per worker
+    UNITS_PER_WORKER = 16
+
+    # Local search settings, per restart
+    ANNEALING_ITERATIONS = 200000
+    ANNEALING_START_TEMP = 2.0
+    ANNEALING_END_TEMP = 0.05
+    TABU_ITERATIONS = 2000
+    TABU_TENURE = 7
+
+    # Population search settings
+    POPULATION_SIZE = 200
+    GENERATIONS = 1000
+    # Stop once the best script has not improved for this many generations
+    STALL_GENERATIONS = 100
+    TOURNAMENT_SIZE = 3
+    # Chance of a child having a same-team swap made after crossover
+    MUTATION_RATE = 0.3
+
+    # Seconds between telemetry snapshots, if no report interval is given
+    TELEMETRY_INTERVAL = 1.0
+
+    # Random probes of a search tree to estimate its size from
+    ESTIMATE_PROBES = 200
+    # Seconds to time a search for, after its setup, to measure its evaluations per second
+    CALIBRATION_SECONDS = 1.0
+    # Time budget for the automatic search, if it has no time limit
+    AUTO_BUDGET = 60
+    # Exact searches the automatic search picks from, and the anytime search it falls back to
+    AUTO_EXACT_TYPES = (BRANCH_AND_BOUND, EXHAUSTION)
+    AUTO_FALLBACK = ANNEALING
+
+    def __init__(self, search_type=EXHAUSTION, workers=1, checkpoint_file=None,
+                 checkpoint_interval=60, resume=False, restarts=10, seed=None, reduce=False,
+                 batch=True, distribution=None, top=None, unique=True, stream_file=None,
+                 time_limit=None, char_dict=None, jinx_dict=None, report_interval=None,
+                 telemetry_file=None, results_file=None):
+        """
+        Search type: One of Search.* enum, or a callable search func. Search.AUTO picks an exact
+          search, and its number of workers, which is estimated to finish within the time limit,
+          or falls back to an anytime search which runs until it.
+        Workers: number of processes to split the search across. Only PARALLEL_TYPES can be
+          split, and the genetic search scores each generation across them; the rest run in
+          this process.
+        Checkpoint file: if given, the exhaustive, bounded and greedy-all-starts searches save
+          their state here every checkpoint_interval seconds. Removed when the search completes.
+        Resume: continue from the state in checkpoint_file rather than starting afresh
+        Restarts: number of random starting scripts for the local searches
+        Seed: random seed for the local and genetic searches, for repeatable runs
+        Reduce: collapse interchangeable characters and drop dominated ones before searching (see
+          _SpaceReduction), then expand the solutions back into every equivalent script
+        Batch: score the exhaustive searches in blocks with NumPy (see _BatchEvaluator), if it is
+          installed
+        Distribution: dict of team name to the number of characters to pick from it. Defaults to
+          TOWN_DISTRIBUTION
+        Top: keep the best top scripts by jinx count, rather than every script tied with the best
+        Unique: keep each distinct set of characters once, however many times it is found
+        Stream file: if given, append each script kept to this file as a JSON line, as it is found
+        Time limit: if given, stop searching after this many seconds and keep the best scripts
+          found so far. Checked whenever the search records progress.
+        Char dict: characters to search over, as loaded from data/characters.yaml. Defaults to
+          data.characters
+        Jinx dict: jinxes to count, as loaded from data/jinxes.yaml. Defaults to data.jinxes
+        Report interval: if given, print a status line every this many seconds. A status line can
+          also be printed at any time with SIGUSR1.
+        Telemetry file: if given, append snapshots of the search's progress (see _ProgressReporter)
+          to this file as JSON lines
+        Results file: if given, save the best scripts here along with the data they were found
+          against (see _ResultStore). Later searches of the same distribution start from them,
+          re-scored against any changes to the data.
+        """
         self.search_type = search_type
-
-        self.types = {}
-        for category in characters.keys():
-            for char_name in characters[category].keys():
-                self.types[char_name] = category
-
-    def output_scripts(self, solutions, graph, skip_input=False):
+        self.workers = workers
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_interval = checkpoint_interval
+        self.resume = resume
+        self.restarts = restarts
+        self.seed = seed
+        self.reduce = reduce
+        self.batch = batch
+        self.top = top
+        self.unique = unique
+        self.stream_file = stream_file
+        self.time_limit = time_limit
+        self.report_interval = report_interval
+        self.telemetry_file = telemetry_file
+        self.results_file = results_file
+        self.char_dict = data.characters if char_dict is None else char_dict
+        self.jinx_dict = data.jinxes if jinx_dict is None else jinx_dict
+        # Whether the last search ran out of time
+        self.timed_out = False
+        self.checkpoint = None
+        self.progress = _SearchProgress()
+        self.incumbent = _Incumbent()
+        # The _SolutionCollector of the running search, started by _collect
+        self.solutions = None
+        self._bounded_search = None
+        self._resume_state = None
+        self._space_reduction = None
+        # Scripts from similar distributions to start bounding from (see run_sweep)
+        self._warm_starts = []
+        # Dict of stats for each generation of the last genetic search
+        self.generation_stats = []
+        # Saved scripts loaded from the results file
+        self._previous_solutions = []
+        # If the saved best was proven optimal, scripts of only untouched characters cannot beat
+        # it (see _DataDiff.get_touched), which the bounded search uses to prune. Nor can they
+        # beat the saved floor (see _ResultStore) unless they were saved
+        self._unchanged_best = None
+        self._unchanged_floor = None
+        self._touched_mask = 0
+
+        # Built once per characters dict and shared, along with its name to team map
+        self.registry = data.get_registry(self.char_dict)
+        self.types = self.registry.types
+        # Jinxes under both of their characters, which the graph and script output read from
+        self.jinx_index = data.get_jinx_index(self.jinx_dict)
+        self.set_distribution(TOWN_DISTRIBUTION if distribution is None else distribution)
+
+    def set_distribution(self, distribution):
+        """Pick the given number of characters from each team. Raises ValueError if impossible"""
+        available = {team: 0 for team in TOWN_DISTRIBUTION.keys()}
+        for team in self.types.values():
+            if team in available:
+                available[team] += 1
+        if distribution.keys() != available.keys():
+            raise ValueError(f"Distribution must give a count for each of {list(available)}")
+        for team, slots in distribution.items():
+            if not 0 <= slots <= available[team]:
+                raise ValueError(f"Cannot pick {slots} of the {available[team]} {team} characters")
+        # In TOWN_DISTRIBUTION's team order, which the searches rely on
+        self.distribution = {team: distribution[team] for team in TOWN_DISTRIBUTION.keys()}
+
+    def output_scripts(self, skip_input=False):
         """
+        Print the best script kept by the search's solutions, then optionally the rest.
         TODO: Write to script file
         """
-        solutions[0].sort()
-        print(solutions[0])
-        print(f"This has {graph.get_num_jinxes(solutions[0])} jinxes.")
+        graph = self.solutions.graph
+        solutions = self.solutions.get_solutions()
+        if len(solutions) == 0:
+            print("No scripts found.")
+            return
+        print(sorted(solutions[0]))
+        print(f"This has {graph.get_num_jinxes(solutions[0])} jinxes:")
+        for char_1, char_2, text in self.jinx_index.jinxes_within(solutions[0]):
+            print(f"  {char_1} & {char_2}: {text.strip()}")
         print()
         if not skip_input and ("y" == input(f"See all {len(solutions)} solutions? [y/N] ")):
-            for i in range(1, len(solutions)):
-                print(f"===== {graph.get_num_jinxes(solutions[i])} jinxes ====")
-                solutions([i]).sort()
-                print(solutions[i])
+            for soln in solutions[1:]:
+                print(f"===== {graph.get_num_jinxes(soln)} jinxes ====")
+                print(sorted(soln))
                 print()
 
     def run(self):
-        global start_time
-        graph = _JinxGraph(jinxes)
+        self.solve()
+
+        elapsed_time = datetime.now() - self.progress.start_time
+        if self.timed_out:
+            print(f"Stopped at the time limit after {elapsed_time} seconds")
+        else:
+            print(f"Took {elapsed_time} seconds to complete")
+
+        self.output_scripts()
 
-        signal.signal(signal.SIGINT, sigint_handler)
+    def run_sweep(self, distributions):
+        """
+        Solve each of the distributions in turn, sharing the jinx graph between them. Each search
+        is warm-started with the solutions of the distributions already solved, moved onto the new
+        distribution by _fit_to_distribution. A neighbouring distribution's optimum is usually
+        only a swap or two from its own, so most of the grid starts from a near-optimal incumbent.
+        Returns a list of (distribution, solutions), in the order given.
+        """
+        if self.checkpoint_file is not None:
+            raise ValueError("Checkpoints are not supported for sweeps")
+        # Check the whole grid before spending time on any of it
+        for distribution in distributions:
+            self.set_distribution(distribution)
+        graph = self.get_graph()
         start_time = datetime.now()
+        results = []
+        for distribution in distributions:
+            self.set_distribution(distribution)
+            self._warm_starts = [self._fit_to_distribution(graph, solutions[0])
+                                 for _, solutions in results if len(solutions) > 0]
+            print(f"===== {format_distribution(self.distribution)} =====")
+            solutions = self.solve(graph)
+            print(f"Took {datetime.now() - self.progress.start_time} seconds to complete")
+            self.output_scripts(skip_input=True)
+            results.append((self.distribution, solutions))
+        self._warm_starts = []
+
+        print(f"Swept {len(results)} distributions in {datetime.now() - start_time} seconds")
+        for distribution, solutions in results:
+            best = graph.get_num_jinxes(solutions[0]) if len(solutions) > 0 else "-"
+            print(f"{format_distribution(distribution)}: {best} jinxes")
+        return results
+
+    def get_graph(self):
+        """The _JinxGraph of the search's jinxes, with each character's id from the registry"""
+        return _JinxGraph(self.jinx_index.adjacency, self.registry.names)
+
+    def get_script_state(self, chars=(), graph=None):
+        """A ScriptState over the search's characters and jinxes, starting with chars"""
+        return ScriptState(self.get_graph() if graph is None else graph, self.types, chars)
+
+    def solve(self, graph=None):
+        """
+        Run the search for the current distribution without printing the scripts. Returns its
+        solutions, which are also left in self.solutions.
+        @param graph optional _JinxGraph of the search's jinxes, to share between searches
+        """
+        if graph is None:
+            graph = self.get_graph()
+        if self.search_type == Search.AUTO:
+            return self._auto_search(graph)
+        parallel = self.workers > 1 and self.search_type in Search.PARALLEL_TYPES
+        self.progress = _SearchProgress(shared=parallel, time_limit=self.time_limit)
+        self.timed_out = False
+        self.incumbent = _Incumbent(shared=parallel)
+        signal.signal(signal.SIGINT, self.progress.sigint_handler)
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self.progress.sigusr1_handler)
+
+        self._space_reduction = None
+        if self.reduce:
+            # Dropping dominated characters can lose ties and runners-up, so is only safe when
+            # just the one best script is kept
+            self._space_reduction = _SpaceReduction(graph, self._get_full_search_space(),
+                                                    self.distribution, self.top == 1)
+            before = describe_space_size(self._space_reduction.original_space, self.distribution)
+            after = describe_space_size(self._space_reduction.space, self.distribution)
+            print(f"Reduced search space from {before} to {after}")
+        self.solutions = None
+        solutions = self._collect(graph)
+        for soln in self._warm_starts:
+            solutions.offer_script(soln)
+            self.incumbent.offer(graph.get_num_jinxes(soln))
+        store = None
+        if self.results_file is not None:
+            store = _ResultStore(self.results_file)
+            self._load_results(store, graph)
+
+        if self.checkpoint_file is not None:
+            fingerprint = self._get_checkpoint_fingerprint(graph, parallel)
+            self.checkpoint = _Checkpoint(self.checkpoint_file, fingerprint,
+                                          self.checkpoint_interval)
+            if self.resume:
+                self._resume_from(self.checkpoint.load(), graph)
 
         # Determine which search to run
         search_func = None
         match self.search_type:
+            case Search.GENETIC:
+                search_func = self._genetic_search
+            case Search.TABU:
+                search_func = self._tabu_search
+            case Search.ANNEALING:
+                search_func = self._annealing_search
+            case Search.BRANCH_AND_BOUND:
+                search_func = self._branch_and_bound
             case Search.CONSTRUCTION_GREEDY_ALL_STARTS:
                 search_func = self._greedy_construction_all_starts
             case Search.CONSTRUCTION_GREEDY:
@@ -202,29 +1671,402 @@ class Search:
             case Search.EXHAUSTION:
                 search_func = self._exhaustion_search
             case Search.MANUAL:
-                search_func = self._manual_answer
+                search_func = self._manual_search
             case _:
-                search_func = self.search_type
+                search_func = self._custom_search
+
+        reporter = None
+        if self.report_interval is not None or self.telemetry_file is not None:
+            interval = self.report_interval or self.TELEMETRY_INTERVAL
+            reporter = _ProgressReporter(self.progress, interval, self.report_interval is not None,
+                                         self.telemetry_file)
+            reporter.start()
+        try:
+            if parallel:
+                self._run_parallel(graph)
+            else:
+                search_func(graph)
+        except _SearchTimeout:
+            self.timed_out = True
+        finally:
+            solutions.close()
+            if reporter is not None:
+                reporter.stop()
+        # A search stopped by its time limit can still be resumed from its last checkpoint
+        if self.checkpoint is not None and not self.timed_out:
+            self.checkpoint.remove()
+        if self._space_reduction is not None:
+            # Equivalent scripts have as many jinxes, so are collected alongside
+            self.solutions = _SolutionCollector(graph, self.top, self.unique)
+            self.progress.solutions = self.solutions
+            for soln in self._space_reduction.expand(solutions.get_solutions()):
+                self.solutions.offer_script(soln)
+        if store is not None:
+            store.save(graph, self.types, self.distribution, self.solutions.get_solutions(),
+                       self._is_exact(), self._get_floor())
+        return self.solutions.get_solutions()
+
+    def _load_results(self, store, graph):
+        """
+        Start from the scripts saved in the results store for this distribution, offering them to
+        the collector and incumbent and keeping them to seed the searches from
+        """
+        self._previous_solutions = []
+        self._unchanged_best = None
+        self._unchanged_floor = None
+        self._touched_mask = 0
+        diff = store.load(graph, self.types)
+        result = store.results.get(format_distribution(self.distribution))
+        if diff is None or result is None:
+            return
+
+        solutions = self._collect(graph)
+        for num_jinxes, soln in result["solutions"]:
+            solutions.offer(graph.to_mask(soln), num_jinxes)
+            self.incumbent.offer(num_jinxes)
+            self._previous_solutions.append(soln)
+        if result["exact"]:
+            self._unchanged_best = result["best"]
+            self._unchanged_floor = result["floor"]
+            self._touched_mask = graph.to_mask(diff.get_touched())
+        print(f"Starting from {len(self._previous_solutions)} saved scripts with up to "
+              f"{solutions.best} jinxes ({diff.describe()})")
+
+    def _is_exact(self):
+        """Whether the best script found is proven to be the optimum"""
+        if self.timed_out or len(self.solutions) == 0:
+            return False
+        if self.search_type in Search.EXACT_TYPES:
+            return True
+        # Nothing can beat a proven best which no change to the data could have raised
+        return self._unchanged_best is not None and self._touched_mask == 0 and \
+            self.solutions.best >= self._unchanged_best
+
+    def _get_floor(self):
+        """
+        Jinxes above which every script is among those found, if _is_exact. An exact search for
+        the top K finds every script the collector could keep, so that is one below its threshold.
+        Otherwise only the best is known to be unbeaten.
+        """
+        if self.search_type in Search.EXACT_TYPES and self.solutions.limit is not None:
+            return self.solutions.get_threshold() - 1
+        return self.solutions.best
+
+    def estimate(self, search_type, graph=None):
+        """
+        Predict the size and runtime of a search of search_type in one process, without running
+        it. Exhaustive searches check a known number of scripts, so only their rate is measured,
+        by running them (see _measure_rate). The other trees are sized by _TreeEstimator probes:
+        the bounded search's against the best seed solution, so it is an overestimate, and the
+        peeling search's.
+        Returns a dict of the estimated "nodes", "evaluations" (complete scripts reached),
+        "seconds" and the "stderr" of the node estimate.
+        @param search_type one of ESTIMATED_TYPES
+        @param graph optional _JinxGraph of the search's jinxes
+        """
+        if graph is None:
+            graph = self.get_graph()
+        # The probes count against a progress of their own, rather than one left by an earlier
+        # solve, whose time limit may have run out
+        self.progress = _SearchProgress()
+        self.solutions = None
+        self._space_reduction = None
+        if self.reduce:
+            self._space_reduction = _SpaceReduction(graph, self._get_full_search_space(),
+                                                    self.distribution, self.top == 1)
+
+        match search_type:
+            case Search.EXHAUSTION | Search.EXHAUSTION_REDUCED:
+                if search_type == Search.EXHAUSTION:
+                    space = self._get_full_search_space()
+                else:
+                    space = self._get_reduced_search_space(graph)
+                evaluations = get_space_size(space, self.distribution)
+                return {
+                    "nodes": evaluations,
+                    "evaluations": evaluations,
+                    "seconds": evaluations / self._measure_rate(graph, search_type),
+                    "stderr": 0,
+                }
+            case Search.BRANCH_AND_BOUND:
+                seeds = self._get_seed_solutions(graph)
+                self.incumbent = _Incumbent(max((graph.get_num_jinxes(soln) for soln in seeds),
+                                                default=-1))
+                bounded_search = _BranchAndBound(self, graph, self._get_full_search_space())
+                root = bounded_search.get_root()
+
+                def _get_children(node):
+                    if bounded_search.is_complete(node):
+                        return []
+                    return bounded_search.get_children(node)
+            case Search.PEELING_GREEDY:
+                root = graph.to_mask(concat_lists(self._get_reduced_search_space(graph)))
+
+                def _get_children(mask):
+                    # Remaining characters as masks, peeling the first lowest degree group which
+                    # has any valid removal
+                    names = graph.to_names(mask)
+                    counts = {team: 0 for team in self.distribution.keys()}
+                    for char in names:
+                        counts[self.types[char]] += 1
+                    if all(counts[team] <= slots for team, slots in self.distribution.items()):
+                        return []
+                    jinx_counts = transpose_dict(graph.get_num_jinxes_per_character(names))
+                    for count in sorted(jinx_counts):
+                        children = [mask & ~graph.to_mask([char]) for char in jinx_counts[count]
+                                    if not self._get_reduced_counts(counts, char)[1]]
+                        if len(children) > 0:
+                            return children
+                    return []
+            case _:
+                raise ValueError(f"Cannot estimate search type {search_type}")
+
+        estimate = _TreeEstimator(_get_children, self.seed).estimate(root, self.ESTIMATE_PROBES)
+        return {
+            "nodes": estimate["nodes"],
+            "evaluations": estimate["leaves"],
+            "seconds": estimate["nodes"] * estimate["seconds_per_node"],
+            "stderr": estimate["stderr"],
+        }
 
-        solutions = search_func(graph)
+    def _measure_rate(self, graph, search_type):
+        """
+        Evaluations per second of a search of search_type. Setup before the first evaluations are
+        recorded, such as building the batch evaluator, and those first evaluations are not timed.
+        The search is run for CALIBRATION_SECONDS after them, with a longer time limit each try
+        until the setup fits, unless it finishes first.
+        """
+        time_limit = self.CALIBRATION_SECONDS
+        while True:
+            calibration = Search(search_type, restarts=1, seed=self.seed, reduce=self.reduce,
+                                 batch=self.batch, distribution=self.distribution,
+                                 time_limit=time_limit, char_dict=self.char_dict,
+                                 jinx_dict=self.jinx_dict)
+            start = time.perf_counter()
+            calibration.solve(graph)
+            end = time.perf_counter()
+            checked = calibration.progress.get_checked()
+            first_record = calibration.progress.first_record
+            timed = end - first_record[0] if first_record is not None else 0
+            if timed > 0 and checked > first_record[1] and \
+                    (timed >= self.CALIBRATION_SECONDS or not calibration.timed_out):
+                return (checked - first_record[1]) / timed
+            if not calibration.timed_out:
+                return checked / (end - start)
+            time_limit *= 2
+
+    def _auto_search(self, graph):
+        """
+        Pick the quickest of AUTO_EXACT_TYPES, with the fewest workers, predicted by estimate to
+        finish within the time limit (or AUTO_BUDGET), and run it. If none would, run
+        AUTO_FALLBACK with as many restarts as fit, stopping at the limit. The estimates assume
+        the work splits evenly across workers, and may be up to one CPU per worker.
+        """
+        budget = self.AUTO_BUDGET if self.time_limit is None else self.time_limit
+        max_workers = self.workers if self.workers > 1 else os.cpu_count() or 1
+        start = time.monotonic()
+
+        choice = None
+        for search_type in self.AUTO_EXACT_TYPES:
+            estimate = self.estimate(search_type, graph)
+            remaining = budget - (time.monotonic() - start)
+            print(f"Estimated {get_search_name(search_type)}: {estimate['nodes']:.3e} nodes, "
+                  f"{format_duration(estimate['seconds'])} in one process")
+            workers = 1
+            if search_type in Search.PARALLEL_TYPES:
+                workers = min(max(math.ceil(estimate["seconds"] / max(remaining, 1e-9)), 1),
+                              max_workers)
+            seconds = estimate["seconds"] / workers
+            if seconds <= remaining and (choice is None or seconds < choice[2]):
+                choice = (search_type, workers, seconds)
+
+        settings = (self.search_type, self.workers, self.time_limit, self.restarts)
+        try:
+            if choice is not None:
+                self.search_type, self.workers, _ = choice
+            else:
+                self.search_type = self.AUTO_FALLBACK
+                self.workers = 1
+                iterations = self.ANNEALING_ITERATIONS if self.AUTO_FALLBACK == Search.ANNEALING \
+                    else self.TABU_ITERATIONS
+                rate = self._measure_rate(graph, self.AUTO_FALLBACK)
+                remaining = budget - (time.monotonic() - start)
+                self.restarts = max(math.ceil(remaining * rate / iterations), 1)
+            # Keep to the budget, in case an estimate was too low
+            self.time_limit = max(budget - (time.monotonic() - start), 0)
+            print(f"Running {get_search_name(self.search_type)} with {self.workers} workers")
+            return self.solve(graph)
+        finally:
+            self.search_type, self.workers, self.time_limit, self.restarts = settings
+
+    def _collect(self, graph):
+        """
+        The _SolutionCollector for the running search to offer its scripts to. solve starts a
+        fresh one for each search, as does a worker for each work unit.
+        """
+        if self.solutions is None:
+            self.solutions = _SolutionCollector(graph, self.top, self.unique, self.stream_file,
+                                                self.progress.record_improvement)
+            self.progress.solutions = self.solutions
+        return self.solutions
+
+    def _collect_scripts(self, graph, scripts):
+        """Offer each of the list of scripts to the collector, returning the solutions kept"""
+        solutions = self._collect(graph)
+        for soln in scripts:
+            solutions.offer_script(soln)
+        return solutions.get_solutions()
+
+    def _custom_search(self, graph):
+        """Run a callable search_type, which returns a list of scripts"""
+        return self._collect_scripts(graph, self.search_type(graph))
+
+    def _fit_to_distribution(self, graph, script):
+        """
+        Greedily move a script from another distribution onto this one. Teams with too many
+        characters drop whichever adds the fewest jinxes, then teams with too few add whichever
+        adds the most. Characters are picked from the whole team, as any space reduction left by the
+        last search was for its distribution's slot counts.
+        """
+        members = {team: [char for char in script if self.types.get(char) == team]
+                   for team in self.distribution.keys()}
+        mask = graph.to_mask(script)
+        for team, slots in self.distribution.items():
+            while len(members[team]) > slots:
+                worst = min(members[team], key=lambda c: graph.count_jinxes_into(c, mask))
+                members[team].remove(worst)
+                mask &= ~graph.to_mask([worst])
+        for team, slots in self.distribution.items():
+            while len(members[team]) < slots:
+                best = max((char for char in self.registry.get_team_names(team)
+                            if char not in members[team]),
+                           key=lambda c: graph.count_jinxes_into(c, mask))
+                members[team].append(best)
+                mask |= graph.to_mask([best])
+        return concat_lists(members)
+
+    def _get_checkpoint_fingerprint(self, graph, parallel):
+        """Identifies the graph, search space and search settings a checkpoint belongs to"""
+        search_name = getattr(self.search_type, "__name__", str(self.search_type))
+        contents = {
+            "graph": graph.get_fingerprint(),
+            "space": self._get_full_search_space(),
+            "distribution": self.distribution,
+            "search_type": search_name,
+            "parallel": parallel,
+            "top": self.top,
+            "unique": self.unique,
+        }
+        return hashlib.sha256(json.dumps(contents, sort_keys=True).encode()).hexdigest()
+
+    def _resume_from(self, state, graph):
+        """Restore counters and the incumbent from a checkpoint's state"""
+        self._resume_state = state
+        self.progress.checked_solns = state["checked_solns"]
+        self.progress.start_time -= timedelta(seconds=state["elapsed_seconds"])
+        solutions = self._collect(graph)
+        for soln in state["solutions"]:
+            solutions.offer_script(soln)
+            self.incumbent.offer(graph.get_num_jinxes(soln))
+
+    def _get_resume_position(self):
+        """
+        Position saved by the checkpoint being resumed from, or None. Only given out once. Its
+        solutions are already in the collector.
+        """
+        if self._resume_state is None:
+            return None
+        state = self._resume_state
+        self._resume_state = None
+        return state["position"]
 
-        elapsed_time = datetime.now() - start_time
-        print(f"Took {elapsed_time} seconds to complete")
+    def _maybe_save_checkpoint(self, position_func):
+        """
+        Save a checkpoint, along with the solutions so far, if one is due
+        @param position_func callable returning the position to resume from. Only called if saving
+        """
+        if self.checkpoint is not None and self.checkpoint.is_due():
+            self.checkpoint.save(position_func(), self.solutions.get_solutions(), self.progress)
 
-        self.output_scripts(solutions, graph)
+    def _get_work_units(self, graph):
+        """
+        Split the search into independent work units for worker processes.
+        Returns (work units, name of the method to run on each unit). Any scripts found while
+        splitting are offered to the collector.
+        - Exhaustive searches get one unit per combination of SPLIT_CATEGORY, most jinxed first
+        - A bounded search is expanded into open nodes, in the order it would visit them
+        """
+        match self.search_type:
+            case Search.BRANCH_AND_BOUND:
+                # Seed the incumbent before splitting, so that the split prunes too
+                self._seed_bounded_search(graph)
+                self._bounded_search = _BranchAndBound(self, graph, self._get_full_search_space())
+                nodes = self._bounded_search.split(self.workers * self.UNITS_PER_WORKER)
+                return nodes, "_search_node"
+            case Search.EXHAUSTION_REDUCED:
+                space = self._get_reduced_search_space(graph)
+            case _:
+                space = self._get_full_search_space()
+
+        self.progress.total_solns = get_space_size(space, self.distribution)
+        units = []
+        split_combos = combinations(space[self.SPLIT_CATEGORY],
+                                    self.distribution[self.SPLIT_CATEGORY])
+        for combo in split_combos:
+            unit = dict(space)
+            unit[self.SPLIT_CATEGORY] = list(combo)
+            units.append(unit)
+        units.sort(key=lambda unit: -sum(graph.get_degree(c) for c in unit[self.SPLIT_CATEGORY]))
+        return units, "_exhaust"
+
+    def _run_parallel(self, graph):
+        """
+        Run the search over every work unit in a pool of worker processes, merging each unit's
+        solutions into the collector as it finishes.
+        Checkpoints hold the work units which are yet to finish.
+        """
+        solutions = self._collect(graph)
+        position = self._get_resume_position()
+        if position is None:
+            units, unit_func_name = self._get_work_units(graph)
+        else:
+            units = position["open_units"]
+            unit_func_name = position["unit_func"]
+
+        finished = set()
+        self.progress.units_total = len(units)
+        with multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                  initargs=(self, graph, unit_func_name)) as pool:
+            for index, unit_solutions, last_soln in pool.imap_unordered(_run_work_unit,
+                                                                         enumerate(units)):
+                for soln in unit_solutions:
+                    solutions.offer_script(soln)
+                finished.add(index)
+                self.progress.units_done += 1
+                self.progress.last_soln = last_soln
+                self._maybe_save_checkpoint(lambda: {
+                    "unit_func": unit_func_name,
+                    "open_units": [unit for i, unit in enumerate(units) if i not in finished],
+                })
+        return solutions.get_solutions()
+
+    def _get_full_search_space(self):
+        """Every character in each category, after any dominance and symmetry reduction"""
+        if self._space_reduction is not None:
+            return {category: list(chars)
+                    for category, chars in self._space_reduction.space.items()}
+        return {category: self.registry.get_team_names(category)
+                for category in self.distribution.keys()}
 
     def _get_reduced_search_space(self, graph):
         """Remove non-jinxed characters"""
         THRESHOLD = 0
+        space = self._get_full_search_space()
         return {
-            "townsfolk": [c for c in characters["townsfolk"].keys()
-                          if graph.get_degree(c) >= THRESHOLD],
-            "outsider": [c for c in characters["outsider"].keys()
-                         if graph.get_degree(c) >= THRESHOLD],
-            "minion": [c for c in characters["minion"].keys()
-                       if graph.get_degree(c) >= THRESHOLD],
-            "demon": [c for c in characters["demon"].keys()
-                      if graph.get_degree(c) >= THRESHOLD],
+            "townsfolk": [c for c in space["townsfolk"] if graph.get_degree(c) >= THRESHOLD],
+            "outsider": [c for c in space["outsider"] if graph.get_degree(c) >= THRESHOLD],
+            "minion": [c for c in space["minion"] if graph.get_degree(c) >= THRESHOLD],
+            "demon": [c for c in space["demon"] if graph.get_degree(c) >= THRESHOLD],
         }
 
     def _get_reduced_counts(self, counts, char_name):
@@ -232,10 +2074,13 @@ class Search:
         output = counts.copy()
         problem = False
         output[self.types[char_name]] -= 1
-        if output[self.types[char_name]] < TOWN_DISTRIBUTION[self.types[char_name]]:
+        if output[self.types[char_name]] < self.distribution[self.types[char_name]]:
             problem = True
         return output, problem
 
+    def _manual_search(self, graph):
+        return self._collect_scripts(graph, self._manual_answer(graph))
+
     def _manual_answer(self, graph):
         """
         Return my manually-curated answer
@@ -275,33 +2120,7 @@ class Search:
         - Complexity: O(n!) [of some complicated flavour]
         - Time estimate: 8,858,945,580,000 years [at 5 million checks/min]
         """
-        global checked_solns, last_soln
-
-        max_jinxes = 0
-        optimal_solutions = []
-        search_space = characters
-        # Try every combination!
-        for townsfolk in combinations(search_space["townsfolk"].keys(),
-                                        TOWN_DISTRIBUTION["townsfolk"]):
-            for outsiders in combinations(search_space["outsider"].keys(),
-                                            TOWN_DISTRIBUTION["outsider"]):
-                for minions in combinations(search_space["minion"].keys(),
-                                                TOWN_DISTRIBUTION["minion"]):
-                    for demons in combinations(search_space["demon"].keys(),
-                                                    TOWN_DISTRIBUTION["demon"]):
-                        chars = list(townsfolk + outsiders + minions + demons)
-                        # The magic check
-                        num_jinxes = graph.get_num_jinxes(chars)
-                        if num_jinxes > max_jinxes:
-                            max_jinxes = num_jinxes
-                            optimal_solutions = []
-                        if num_jinxes == max_jinxes:
-                            optimal_solutions.append(chars)
-
-                        # Update for SIGINFO
-                        checked_solns += 1
-                        last_soln = chars
-        return optimal_solutions
+        return self._exhaust(graph, self._get_full_search_space())
 
     def _reduced_space_exhaustion_search(self, graph):
         """
@@ -310,32 +2129,132 @@ class Search:
         - Complexity: O(n!)
         - Time estimate: 773,350 years [at 5 million checks/min]
         """
-        global checked_solns, last_soln
-
-        max_jinxes = 0
-        optimal_solutions = []
-
         # Remove non-jinxed characters
         space = self._get_reduced_search_space(graph)
+        return self._exhaust(graph, space)
 
-        # Try every remaining combination
-        for townsfolk in combinations(space["townsfolk"], TOWN_DISTRIBUTION["townsfolk"]):
-            for outsiders in combinations(space["outsider"], TOWN_DISTRIBUTION["outsider"]):
-                for minions in combinations(space["minion"], TOWN_DISTRIBUTION["minion"]):
-                    for demons in combinations(space["demon"], TOWN_DISTRIBUTION["demon"]):
-                        chars = list(townsfolk + outsiders + minions + demons)
+    def _exhaust(self, graph, space):
+        """
+        Check every combination of the categorised space. Each team's combination is masked and
+        scored once, then extended by the jinxes between it and the teams already chosen, so the
+        innermost check is a handful of popcounts rather than a full rescore.
+        Checkpoints hold the combination indices of the next townsfolk, outsiders and minions.
+        """
+        solutions = self._collect(graph)
+        position = self._get_resume_position()
+        if position is None:
+            position = {"townsfolk": None, "outsider": 0, "minion": 0}
+
+        # The inner teams are small enough to mask and score every combination up-front
+        inner_combos = {}
+        for category in ["outsider", "minion", "demon"]:
+            inner_combos[category] = []
+            for combo in combinations(space[category], self.distribution[category]):
+                mask = graph.to_mask(combo)
+                inner_combos[category].append((combo, mask, graph.count_jinxes(mask)))
+
+        self.progress.total_solns = get_space_size(space, self.distribution)
+        evaluator = None
+        if self.batch and numpy is not None:
+            evaluator = _BatchEvaluator(graph, [mask for _, mask, _ in inner_combos["minion"]],
+                                        [mask for _, mask, _ in inner_combos["demon"]])
+
+        # Try every combination!
+        threshold = self._get_exhaust_threshold(solutions)
+        for t_indices in combinations_from(len(space["townsfolk"]), self.distribution["townsfolk"],
+                                           position["townsfolk"]):
+            townsfolk = tuple(space["townsfolk"][i] for i in t_indices)
+            t_mask = graph.to_mask(townsfolk)
+            t_jinxes = graph.count_jinxes(t_mask)
+            for o_index in range(position["outsider"], len(inner_combos["outsider"])):
+                outsiders, o_mask, o_jinxes = inner_combos["outsider"][o_index]
+                to_mask = t_mask | o_mask
+                to_jinxes = t_jinxes + o_jinxes + graph.count_jinxes_between(o_mask, t_mask)
+                if evaluator is not None:
+                    threshold = self._exhaust_batched(evaluator, inner_combos, position,
+                                                      (t_indices, townsfolk), (o_index, outsiders),
+                                                      to_mask, to_jinxes, threshold)
+                    position["minion"] = 0
+                    continue
+                for m_index in range(position["minion"], len(inner_combos["minion"])):
+                    minions, m_mask, m_jinxes = inner_combos["minion"][m_index]
+                    tom_mask = to_mask | m_mask
+                    tom_jinxes = to_jinxes + m_jinxes + \
+                        graph.count_jinxes_between(m_mask, to_mask)
+                    for demons, d_mask, d_jinxes in inner_combos["demon"]:
                         # The magic check
-                        num_jinxes = graph.get_num_jinxes(chars)
-                        if num_jinxes > max_jinxes:
-                            max_jinxes = num_jinxes
-                            optimal_solutions = []
-                        if num_jinxes == max_jinxes:
-                            optimal_solutions.append(chars)
-
-                        # Update for SIGINFO
-                        checked_solns += 1
-                        last_soln = chars
-        return optimal_solutions
+                        num_jinxes = tom_jinxes + d_jinxes + \
+                            graph.count_jinxes_between(d_mask, tom_mask)
+                        if num_jinxes >= threshold and solutions.offer(tom_mask | d_mask,
+                                                                       num_jinxes):
+                            self.incumbent.offer(num_jinxes)
+                            threshold = self._get_exhaust_threshold(solutions)
+
+                    # Update for SIGINFO
+                    self.progress.record((townsfolk, outsiders, minions),
+                                         len(inner_combos["demon"]))
+                    self._maybe_save_checkpoint(lambda: {
+                        "townsfolk": t_indices,
+                        "outsider": o_index,
+                        "minion": m_index + 1,
+                    })
+                # Only the resumed combination starts part-way through
+                position["minion"] = 0
+            position["outsider"] = 0
+        return solutions.get_solutions()
+
+    def _get_exhaust_threshold(self, solutions):
+        """Fewest jinxes an exhaustively checked script needs to be worth offering to solutions"""
+        if solutions.limit is None:
+            # Scripts worse than the best found elsewhere are not worth keeping
+            return max(solutions.get_threshold(), self.incumbent.get())
+        return solutions.get_threshold()
+
+    def _exhaust_batched(self, evaluator, inner_combos, position, townsfolk, outsiders, to_mask,
+                         to_jinxes, threshold):
+        """
+        Check every minion and demon combination for one townsfolk and outsider combination, a
+        block of minion combinations at a time. Returns the updated threshold.
+        @param townsfolk tuple of the townsfolk combination indices and characters
+        @param outsiders tuple of the outsider combination index and characters
+        @param threshold fewest jinxes worth offering to the solutions
+        """
+        t_indices, townsfolk = townsfolk
+        o_index, outsiders = outsiders
+        solutions = self.solutions
+        num_minion_combos = len(inner_combos["minion"])
+        num_demon_combos = len(inner_combos["demon"])
+        for start in range(position["minion"], num_minion_combos, evaluator.block_rows):
+            stop = min(start + evaluator.block_rows, num_minion_combos)
+            scores = evaluator.score_block(to_mask, to_jinxes, start, stop).ravel()
+            best = int(scores.max())
+            if best >= threshold:
+                # Without a limit, only the block's best scripts could be kept
+                floor = threshold if solutions.limit is not None else best
+                found = numpy.flatnonzero(scores >= floor)
+                if solutions.limit is not None and len(found) > solutions.limit:
+                    # Only the block's top limit could be kept, earliest first on ties
+                    top = numpy.argsort(-scores[found], kind="stable")[:solutions.limit]
+                    found = numpy.sort(found[top])
+                # In the same order as the unbatched loops would offer them
+                for index in found.tolist():
+                    m_offset, d_index = divmod(index, num_demon_combos)
+                    num_jinxes = int(scores[index])
+                    mask = to_mask | inner_combos["minion"][start + m_offset][1] | \
+                        inner_combos["demon"][d_index][1]
+                    if num_jinxes >= threshold and solutions.offer(mask, num_jinxes):
+                        self.incumbent.offer(num_jinxes)
+                        threshold = self._get_exhaust_threshold(solutions)
+
+            # Update for SIGINFO
+            self.progress.record((townsfolk, outsiders, inner_combos["minion"][stop - 1][0]),
+                                 scores.size)
+            self._maybe_save_checkpoint(lambda: {
+                "townsfolk": t_indices,
+                "outsider": o_index,
+                "minion": stop,
+            })
+        return threshold
 
     def _greedy_peeling(self, graph):
         """
@@ -343,8 +2262,7 @@ class Search:
         chance.
         Complexity: O(n^2*d) [Getting jinxes per character, recursing on n-1]
         """
-        max_jinxes = 0
-        optimal_solutions = []
+        solutions = self._collect(graph)
 
         # Remove non-jinxed characters
         space = self._get_reduced_search_space(graph)
@@ -353,21 +2271,22 @@ class Search:
         space = concat_lists(space)
 
         def _greedy_peeling_recursive(graph, counts, space, depth):
-            global checked_solns, last_soln
+            """Returns whether any complete script was reached"""
             # Base case
             correct_size = True
-            for category in TOWN_DISTRIBUTION.keys():
-                if counts[category] > TOWN_DISTRIBUTION[category]:
+            for category in self.distribution.keys():
+                if counts[category] > self.distribution[category]:
                     correct_size = False
             if correct_size:
-                checked_solns += 1
-                last_soln = space
-                return [space]
+                self.progress.record(space)
+                solutions.offer_script(space)
+                return True
             # Find lowest degree to remove
+            self.progress.record_expanded()
             jinx_counts = transpose_dict(graph.get_num_jinxes_per_character(space))
 
             # Try each character with lowest degree
-            solutions = []
+            found = False
             for count in sorted(list(jinx_counts)):
                 for removed_char in jinx_counts[count]:
                     altered_counts, count_invalid = self._get_reduced_counts(counts, removed_char)
@@ -375,32 +2294,27 @@ class Search:
                         continue
                     # Remove/append likely inefficient
                     space.remove(removed_char)
-                    solutions += _greedy_peeling_recursive(graph, altered_counts, space, depth + 1)
+                    if _greedy_peeling_recursive(graph, altered_counts, space, depth + 1):
+                        found = True
                     space.append(removed_char)
-                if len(solutions) > 0:
+                if found:
                     break
-            return solutions
+            return found
 
-        solutions = _greedy_peeling_recursive(graph, counts, space, 0)
-        for soln in solutions:
-            num_jinxes = graph.get_num_jinxes(soln)
-            if num_jinxes > max_jinxes:
-                max_jinxes = num_jinxes
-                optimal_solutions = []
-            if num_jinxes == max_jinxes:
-                optimal_solutions.append(soln)
+        _greedy_peeling_recursive(graph, counts, space, 0)
+        return solutions.get_solutions()
 
-        return optimal_solutions
-
-    def _get_most_jinxes(self, graph, space, counts, current_chars):
+    def _get_most_jinxes(self, graph, space, counts, current_mask):
         # Char(s) adding the most jinxes to the script
         most_added = 0
         best_chars = []
         for char in space:
+            if graph.to_mask([char]) & current_mask:
+                continue
             char_type = self.types[char]
-            if counts[char_type] >= TOWN_DISTRIBUTION[char_type]:
+            if counts[char_type] >= self.distribution[char_type]:
                 continue
-            num = graph.get_num_jinxes(current_chars + [char])
+            num = graph.count_jinxes_into(char, current_mask)
             if num > most_added:
                 most_added = num
                 best_chars = []
@@ -421,42 +2335,47 @@ class Search:
                 best_chars.append(char)
         return best_chars
 
-    def _greedy_construction_recursive(self, graph, space, counts, current_chars, depth):
-        global checked_solns, last_soln
-        if depth > 100:
-            print("Depth limit exceeded")
-            return [current_chars]
+    def _greedy_construction_recursive(self, graph, space, counts, current_mask, table):
+        """
+        Extend the partial script in current_mask by the character(s) adding the most jinxes,
+        splitting into sub-searches on ties. counts holds the number of characters per category in
+        the partial script, and is updated in place (but restored before returning).
+        Returns (jinxes, set of the best complete script masks reachable). The same unordered
+        partial script is reached through many insertion orders, so each result is stored in table
+        by its mask and only expanded once.
+        """
+        result = table.get(current_mask)
+        if result is not None:
+            return result
 
-        candidates = self._get_most_jinxes(graph, space, counts, current_chars)
+        candidates = self._get_most_jinxes(graph, space, counts, current_mask)
         candidates = self._get_most_potential_jinxes(graph, candidates)
         if len(candidates) == 0:
             # This is also the base case
-            last_soln = current_chars
-            checked_solns += 1
-            return [current_chars]
-
-        best_val = 0
-        solutions = []
+            self.progress.record(graph.to_names(current_mask))
+            result = (graph.count_jinxes(current_mask), {current_mask})
+            table[current_mask] = result
+            return result
+
+        self.progress.record_expanded()
+        best_val = -1
+        solutions = set()
         for cand in candidates:
-            new_space = space[:]
-            new_space.remove(cand)
-            new_counts = deepcopy(counts)
-            new_counts[self.types[cand]] += 1
-            new_chars = current_chars[:]
-            new_chars.append(cand)
-
-            subsolutions = self._greedy_construction_recursive(graph, new_space, new_counts,
-                                                               new_chars, depth + 1)
-
-            for soln in subsolutions:
-                found_jinxes = graph.get_num_jinxes(soln)
-                if found_jinxes > best_val:
-                    solutions = []
-                    best_val = found_jinxes
-                if found_jinxes == best_val:
-                    solutions.append(soln)
-
-        return solutions
+            category = self.types[cand]
+            counts[category] += 1
+            found_jinxes, subsolutions = self._greedy_construction_recursive(
+                graph, space, counts, current_mask | graph.to_mask([cand]), table)
+            counts[category] -= 1
+
+            if found_jinxes > best_val:
+                best_val = found_jinxes
+                solutions = set(subsolutions)
+            elif found_jinxes == best_val:
+                solutions |= subsolutions
+
+        result = (best_val, solutions)
+        table[current_mask] = result
+        return result
 
     def _greedy_construction(self, graph):
         """
@@ -466,52 +2385,492 @@ class Search:
         """
         # Remove non-jinxed characters
         space = self._get_reduced_search_space(graph)
-        counts = {key: 0 for key in TOWN_DISTRIBUTION.keys()}
+        counts = {key: 0 for key in self.distribution.keys()}
         # Collapse to list
         space = concat_lists(space)
 
-        current_chars = []
-        return self._greedy_construction_recursive(graph, space, counts, current_chars, 0)
+        solutions = self._collect(graph)
+        num_jinxes, masks = self._greedy_construction_recursive(graph, space, counts, 0, {})
+        for mask in masks:
+            solutions.offer(mask, num_jinxes)
+        return solutions.get_solutions()
 
     def _greedy_construction_all_starts(self, graph):
         """
-        Attempt to dodge local optima by starting at any given character
+        Attempt to dodge local optima by starting at any given character. Partial scripts are
+        shared between starts, so each is only expanded once across the whole search.
+        Checkpoints hold the index of the next start character, and the table of partial scripts
+        expanded so far as [mask, jinxes, [best script masks]].
         """
         # Remove non-jinxed characters
         space = self._get_reduced_search_space(graph)
-        counts = {key: 0 for key in TOWN_DISTRIBUTION.keys()}
+        counts = {key: 0 for key in self.distribution.keys()}
         # Collapse to list
         space = concat_lists(space)
 
-        max_jinxes = 0
-        optimal = []
+        solutions = self._collect(graph)
+        position = self._get_resume_position()
+        if position is None:
+            position = {"start": 0, "table": []}
+        table = {mask: (num_jinxes, set(masks)) for mask, num_jinxes, masks in position["table"]}
 
-        for char in space:
+        for start in range(position["start"], len(space)):
+            char = space[start]
+            if counts[self.types[char]] >= self.distribution[self.types[char]]:
+                # Its team has no slots to start from
+                continue
             # Seed start point
-            current_chars = [char]
-            given_space = space[:]
-            given_space.remove(char)
-            given_counts = deepcopy(counts)
-            given_counts[self.types[char]] += 1
+            counts[self.types[char]] += 1
+            char_max, char_solns = self._greedy_construction_recursive(
+                graph, space, counts, graph.to_mask([char]), table)
+            counts[self.types[char]] -= 1
+
+            # Sets are unordered, so offer in mask order for repeatable results
+            kept = [solutions.offer(mask, char_max) for mask in sorted(char_solns)]
+            if any(kept):
+                self.output_scripts(True)
+            self._maybe_save_checkpoint(lambda: {
+                "start": start + 1,
+                "table": [[mask, num_jinxes, sorted(masks)]
+                          for mask, (num_jinxes, masks) in table.items()],
+            })
+
+        return solutions.get_solutions()
+
+    def _get_seed_solutions(self, graph):
+        """Known-good scripts to start bounding from. Only kept if they fit self.distribution"""
+        seeds = []
+        for soln in self._manual_answer(graph) + self._warm_starts + self._previous_solutions:
+            counts = {category: 0 for category in self.distribution.keys()}
+            for char in soln:
+                category = self.types.get(char)
+                if category in counts:
+                    counts[category] += 1
+            if counts == self.distribution and len(soln) == sum(counts.values()):
+                seeds.append(soln)
+        return seeds
+
+    def _branch_and_bound(self, graph):
+        """
+        Exact search which picks characters category by category, pruning any partial script whose
+        upper bound (see _BranchAndBound.get_bound) cannot beat the best script found so far.
+        Seeded with the best known answer, so only strictly better scripts are explored. Ties with
+        the optimum are not enumerated, unless keeping the top K (--top), when every partial script
+        which could make the top K is explored.
+        - Search space: 2.3281309e25 before pruning [69C13*23C4*27C4*19C4]
+        - Complexity: O(n!) worst case
+        - Time estimate: ~5 seconds [proves 46 jinxes on the 10 Mar 2026 jinx data]
+        """
+        # Start from the best known answer, or where the checkpoint left off
+        solutions = self._collect(graph)
+        position = self._get_resume_position()
+        if position is None:
+            self._seed_bounded_search(graph)
+            open_nodes = None
+        else:
+            open_nodes = [tuple(node) for node in position["open_nodes"]]
+
+        bounded_search = _BranchAndBound(self, graph, self._get_full_search_space())
+        bounded_search.search_from(open_nodes)
+        return solutions.get_solutions()
+
+    def _seed_bounded_search(self, graph):
+        """Offer the seed solutions to the collector, and raise the incumbent to the best"""
+        solutions = self._collect(graph)
+        # Keeping the top K, the search finds the seeds again, so they would be kept twice
+        offer_seeds = solutions.limit is None or solutions.unique
+        for soln in self._get_seed_solutions(graph):
+            if offer_seeds:
+                solutions.offer_script(soln)
+            self.incumbent.offer(graph.get_num_jinxes(soln))
+
+    def _annealing_search(self, graph):
+        """
+        Simulated annealing over same-team swaps, from restarts random scripts.
+        - Complexity: O(restarts * ANNEALING_ITERATIONS * d)
+        """
+        self.progress.total_solns = self.restarts * self.ANNEALING_ITERATIONS
+        return self._local_search(graph, self._anneal)
+
+    def _tabu_search(self, graph):
+        """
+        Tabu search over same-team swaps, from restarts random scripts.
+        - Complexity: O(restarts * TABU_ITERATIONS * n^2) [n per team]
+        """
+        # At most, as a restart stops early if every swap is tabu
+        self.progress.total_solns = self.restarts * self.TABU_ITERATIONS
+        return self._local_search(graph, self._tabu)
+
+    def _local_search(self, graph, improve_func):
+        """
+        Improve a random script with improve_func for each restart, keeping the best scripts seen.
+        """
+        rng = random.Random(self.seed)
+        space = self._get_full_search_space()
+        team_ids = {team: [graph.get_id(char) for char in space[team]]
+                    for team in self.distribution.keys()}
+
+        # Start the first restarts from the saved scripts, if they are still in the space
+        starts = []
+        for soln in self._previous_solutions:
+            members = {team: [graph.get_id(char) for char in soln if self.types[char] == team]
+                       for team in self.distribution.keys()}
+            if all(set(members[team]) <= set(team_ids[team]) for team in members.keys()):
+                starts.append(members)
+
+        solutions = self._collect(graph)
+        for restart in range(self.restarts):
+            if restart < len(starts):
+                members = starts[restart]
+            else:
+                members = {team: rng.sample(team_ids[team], self.distribution[team])
+                           for team in self.distribution.keys()}
+            state = _SwapState(graph, team_ids, members)
+            best_mask, best_score = improve_func(state, rng)
+
+            self.incumbent.offer(best_score)
+            solutions.offer(best_mask, best_score)
+        return solutions.get_solutions()
+
+    def _anneal(self, state, rng):
+        """
+        Try a random same-team swap each step. Improvements are always taken, and worse swaps are
+        taken with a chance that falls as the temperature cools. Returns (best mask, its jinxes)
+        """
+        # Each script position is equally likely to move
+        teams = [team for team in state.teams if len(state.outside[team]) > 0
+                 for _ in range(self.distribution[team])]
+        best_mask, best_score = state.mask, state.score
+        if len(teams) == 0:
+            return best_mask, best_score
+
+        temperature = self.ANNEALING_START_TEMP
+        cooling = (self.ANNEALING_END_TEMP / self.ANNEALING_START_TEMP) ** \
+            (1 / self.ANNEALING_ITERATIONS)
+        for step in range(1, self.ANNEALING_ITERATIONS + 1):
+            team = rng.choice(teams)
+            out_index = rng.randrange(len(state.members[team]))
+            in_index = rng.randrange(len(state.outside[team]))
+            delta = state.get_swap_delta(state.members[team][out_index],
+                                         state.outside[team][in_index])
+            if delta >= 0 or rng.random() < math.exp(delta / temperature):
+                state.swap(team, out_index, in_index)
+                if state.score > best_score:
+                    best_mask, best_score = state.mask, state.score
+            temperature *= cooling
+
+            # Update for SIGINFO
+            if step % 10000 == 0:
+                self.progress.record(state.get_names(), 10000)
+        return best_mask, best_score
+
+    def _tabu(self, state, rng):
+        """
+        Take the best same-team swap each step, even if it is worse. A character which leaves the
+        script may not rejoin for a while, unless that would beat the best script seen. Returns
+        (best mask, its jinxes)
+        """
+        adj_masks = state.graph.adj_masks
+        gains = state.gains
+        tabu_until = {}
+        best_mask, best_score = state.mask, state.score
+        for step in range(self.TABU_ITERATIONS):
+            best_move = None
+            best_delta = None
+            ties = 0
+            for team in state.teams:
+                for out_index, out_id in enumerate(state.members[team]):
+                    out_adj = adj_masks[out_id]
+                    for in_index, in_id in enumerate(state.outside[team]):
+                        delta = gains[in_id] - gains[out_id] - (out_adj >> in_id & 1)
+                        if tabu_until.get(in_id, -1) > step and \
+                                state.score + delta <= best_score:
+                            continue
+                        if best_delta is None or delta > best_delta:
+                            best_move = (team, out_index, in_index)
+                            best_delta = delta
+                            ties = 1
+                        elif delta == best_delta:
+                            # Break ties at random
+                            ties += 1
+                            if rng.randrange(ties) == 0:
+                                best_move = (team, out_index, in_index)
+            if best_move is None:
+                break
+
+            team, out_index, _ = best_move
+            tabu_until[state.members[team][out_index]] = step + self.TABU_TENURE + \
+                rng.randrange(self.TABU_TENURE)
+            state.swap(*best_move)
+            if state.score > best_score:
+                best_mask, best_score = state.mask, state.score
+
+            # Update for SIGINFO
+            self.progress.record(state.get_names())
+        return best_mask, best_score
+
+    def _genetic_search(self, graph):
+        """
+        Evolve a population of scripts, starting from the seed solutions and random scripts. Each
+        generation breeds POPULATION_SIZE children from tournament-picked parents, crossed team by
+        team and mutated by same-team swaps, so every child keeps the distribution. Like a beam,
+        the best distinct scripts of the parents and children form the next generation. Stops
+        after GENERATIONS, or STALL_GENERATIONS without improving.
+        Each generation is scored in batches across the worker processes, if there are any.
+        - Complexity: O(GENERATIONS * POPULATION_SIZE * n) [n per script]
+        """
+        rng = random.Random(self.seed)
+        space = self._get_full_search_space()
+        teams = list(self.distribution.keys())
+        team_masks = [graph.to_mask(space[team]) for team in teams]
+        # Each script position is equally likely to be mutated
+        mutable = [i for i, team in enumerate(teams)
+                   if len(space[team]) > self.distribution[team]
+                   for _ in range(self.distribution[team])]
+        self.generation_stats = []
+        self.progress.total_solns = self.GENERATIONS * self.POPULATION_SIZE
+
+        # Scripts are tuples of each team's mask, so they can be bred team by team
+        population = []
+        for soln in self._get_seed_solutions(graph):
+            population.append(tuple(graph.to_mask([c for c in soln if self.types[c] == team])
+                                    for team in teams))
+        while len(population) < self.POPULATION_SIZE:
+            population.append(tuple(graph.to_mask(rng.sample(space[team], self.distribution[team]))
+                                    for team in teams))
+
+        def _tournament(ranked):
+            # The ranked population is sorted best first, so the lowest index picked wins
+            return ranked[min(rng.sample(range(len(ranked)), min(self.TOURNAMENT_SIZE,
+                                                                 len(ranked))))]
+
+        def _crossover(parent_1, parent_2):
+            # Keep the characters the parents share, and fill up from those only one has
+            child = []
+            for i, team in enumerate(teams):
+                shared = parent_1[i] & parent_2[i]
+                either = list(iter_bits(parent_1[i] ^ parent_2[i]))
+                for char_id in rng.sample(either, self.distribution[team] - shared.bit_count()):
+                    shared |= 1 << char_id
+                child.append(shared)
+            return child
+
+        def _mutate(child):
+            i = rng.choice(mutable)
+            out_id = rng.choice(list(iter_bits(child[i])))
+            in_id = rng.choice(list(iter_bits(team_masks[i] & ~child[i])))
+            child[i] ^= 1 << out_id | 1 << in_id
+
+        pool = contextlib.nullcontext()
+        if self.workers > 1:
+            pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                        initargs=(self, graph))
+        with pool as pool:
+            ranked, _ = self._rank_population(graph, population, [], pool)
+            best = ranked[0][0]
+            last_improvement = 0
+            for generation in range(1, self.GENERATIONS + 1):
+                parents = [individual for _, _, individual in ranked]
+                children = []
+                for _ in range(self.POPULATION_SIZE):
+                    child = _crossover(_tournament(parents), _tournament(parents))
+                    if len(mutable) > 0 and rng.random() < self.MUTATION_RATE:
+                        _mutate(child)
+                    children.append(tuple(child))
+                ranked, num_new = self._rank_population(graph, children, ranked, pool)
+
+                if ranked[0][0] > best:
+                    best = ranked[0][0]
+                    last_improvement = generation
+                stats = {
+                    "generation": generation,
+                    "best": best,
+                    "mean": sum(score for score, _, _ in ranked) / len(ranked),
+                    "worst": ranked[-1][0],
+                    # Children which were not already in the population, nor repeats
+                    "new_children": num_new,
+                    "stalled": generation - last_improvement,
+                }
+                self.generation_stats.append(stats)
+                if self.progress.reporter is not None:
+                    self.progress.reporter.write("generation", **stats)
+                if stats["stalled"] >= self.STALL_GENERATIONS:
+                    break
+        return self._collect(graph).get_solutions()
 
-            char_solns = self._greedy_construction_recursive(graph, given_space, given_counts,
-                                                             current_chars, 0)
+    def _rank_population(self, graph, children, ranked, pool):
+        """
+        Score the children, offering them to the collector, and merge them into the ranked
+        population. Returns (the best POPULATION_SIZE distinct scripts as a list of
+        (jinxes, script mask, team masks), best first; the number of distinct new children)
+        @param pool a multiprocessing.Pool to score the children across, or None
+        """
+        masks = []
+        for child in children:
+            mask = 0
+            for team_mask in child:
+                mask |= team_mask
+            masks.append(mask)
+        if pool is None:
+            scores = [graph.count_jinxes(mask) for mask in masks]
+        else:
+            # One batch per worker, which pool.map returns in order
+            size = math.ceil(len(masks) / self.workers)
+            scores = [score for batch in pool.map(
+                _score_masks, [masks[i:i + size] for i in range(0, len(masks), size)])
+                for score in batch]
+        self.progress.record(graph.to_names(masks[-1]), len(masks))
+
+        solutions = self._collect(graph)
+        merged = {mask: (score, mask, team_masks) for score, mask, team_masks in ranked}
+        num_parents = len(merged)
+        for child, mask, score in zip(children, masks, scores):
+            if score >= solutions.get_threshold():
+                solutions.offer(mask, score)
+            self.incumbent.offer(score)
+            merged.setdefault(mask, (score, mask, child))
+        # Ties are broken by mask, so a seeded search is repeatable
+        ranked = sorted(merged.values(), reverse=True)[:self.POPULATION_SIZE]
+        return ranked, len(merged) - num_parents
+
+    def _search_node(self, graph, node):
+        """Branch and bound from one open node of the full search space"""
+        if self._bounded_search is None:
+            self._bounded_search = _BranchAndBound(self, graph, self._get_full_search_space())
+        # Nodes read back from a checkpoint are lists
+        self._bounded_search.search_from([tuple(node)])
+        return self._collect(graph).get_solutions()
+
+
+# State of a worker process in a parallel search, set once by _init_worker
+_worker_state = {}
+
+
+def _init_worker(search, graph, unit_func_name=None):
+    """
+    Pool initializer. The parent process handles SIGINT and checkpoints, so workers do neither
+    @param unit_func_name name of the Search method to run on each work unit, if there are units
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    search.checkpoint = None
+    search.stream_file = None
+    _worker_state["search"] = search
+    _worker_state["graph"] = graph
+    if unit_func_name is not None:
+        _worker_state["unit_func"] = getattr(search, unit_func_name)
+
+
+def _run_work_unit(indexed_unit):
+    """Search one (index, work unit) pair. Returns (index, solutions, last solution seen)"""
+    index, unit = indexed_unit
+    search = _worker_state["search"]
+    # Each unit's solutions are sent back to be merged, so start each unit's collector afresh
+    search.solutions = None
+    solutions = _worker_state["unit_func"](_worker_state["graph"], unit)
+    search.progress.flush()
+    return index, solutions, search.progress.last_soln
+
+
+def _score_masks(masks):
+    """Jinxes in each of a batch of script masks, for a generation of the genetic search"""
+    graph = _worker_state["graph"]
+    return [graph.count_jinxes(mask) for mask in masks]
+
+
+SEARCH_TYPES = {
+    "auto": Search.AUTO,
+    "annealing": Search.ANNEALING,
+    "tabu": Search.TABU,
+    "genetic": Search.GENETIC,
+    "manual": Search.MANUAL,
+    "exhaustion": Search.EXHAUSTION,
+    "exhaustion-reduced": Search.EXHAUSTION_REDUCED,
+    "peeling-greedy": Search.PEELING_GREEDY,
+    "construction-greedy": Search.CONSTRUCTION_GREEDY,
+    "construction-greedy-all-starts": Search.CONSTRUCTION_GREEDY_ALL_STARTS,
+    "branch-and-bound": Search.BRANCH_AND_BOUND,
+}
 
-            # Num jinxes is same for all returned
-            char_max = graph.get_num_jinxes(char_solns[0])
-            if char_max > max_jinxes:
-                max_jinxes = char_max
-                optimal = []
-            if char_max == max_jinxes:
-                optimal += char_solns
-                self.output_scripts(optimal, graph, True)
 
-        return optimal
+def get_search_name(search_type):
+    """Name of a Search.* type in SEARCH_TYPES, or of a callable search func"""
+    for name, other_type in SEARCH_TYPES.items():
+        if other_type == search_type:
+            return name
+    return getattr(search_type, "__name__", str(search_type))
 
 
 def main():
-    search = Search(Search.CONSTRUCTION_GREEDY_ALL_STARTS)
-    search.run()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--search", choices=SEARCH_TYPES.keys(), default="branch-and-bound",
+                        help="search strategy to run")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes to split exhaustive and bounded searches, or "
+                             "score genetic generations, across")
+    parser.add_argument("--checkpoint", metavar="FILE",
+                        help="periodically save search state to FILE")
+    parser.add_argument("--checkpoint-interval", type=float, default=60, metavar="SECONDS",
+                        help="minimum time between checkpoints (default 60)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from the state saved in the --checkpoint file")
+    parser.add_argument("--restarts", type=int, default=10,
+                        help="random starting scripts for the annealing and tabu searches")
+    parser.add_argument("--seed", type=int,
+                        help="random seed for repeatable local and genetic searches")
+    parser.add_argument("--reduce", action="store_true",
+                        help="collapse interchangeable characters first, and with --top 1 also "
+                             "drop dominated ones")
+    parser.add_argument("--distribution", type=parse_distributions, default=[TOWN_DISTRIBUTION],
+                        metavar="T,O,M,D",
+                        help="number of townsfolk, outsiders, minions and demons (default "
+                             "13,4,4,4). Ranges such as 12-14,4-5,4,4 sweep every distribution "
+                             "in the grid")
+    parser.add_argument("--top", type=int, metavar="K",
+                        help="keep the best K scripts found, rather than every tie with the best")
+    parser.add_argument("--stream", metavar="FILE",
+                        help="append each script kept to FILE as a JSON line, as it is found")
+    parser.add_argument("--time-limit", type=float, metavar="SECONDS",
+                        help="stop after SECONDS and report the best scripts found so far. The "
+                             "auto search picks a strategy to finish within SECONDS (default "
+                             f"{Search.AUTO_BUDGET})")
+    parser.add_argument("--estimate", action="store_true",
+                        help="estimate the size and runtime of the exhaustive, branch-and-bound "
+                             "and peeling searches, then stop")
+    parser.add_argument("--report-interval", type=float, metavar="SECONDS",
+                        help="print a status line every SECONDS (or send SIGUSR1 at any time)")
+    parser.add_argument("--telemetry", metavar="FILE",
+                        help="append progress snapshots and improvements to FILE as JSON lines")
+    parser.add_argument("--results", metavar="FILE",
+                        help="save the best scripts to FILE, and start later searches from them, "
+                             "re-scored against any changes to the jinx and character data")
+    parser.add_argument("--no-batch", dest="batch", action="store_false",
+                        help="score exhaustive searches one script at a time, without NumPy")
+    args = parser.parse_args()
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume requires --checkpoint")
+    if args.top is not None and args.top < 1:
+        parser.error("--top must be at least 1")
+    sweep = len(args.distribution) > 1
+    if sweep and args.checkpoint is not None:
+        parser.error("--checkpoint cannot be used when sweeping distributions")
+
+    search = Search(SEARCH_TYPES[args.search], workers=args.workers,
+                    checkpoint_file=args.checkpoint, checkpoint_interval=args.checkpoint_interval,
+                    resume=args.resume, restarts=args.restarts, seed=args.seed,
+                    reduce=args.reduce, batch=args.batch, distribution=args.distribution[0],
+                    top=args.top, stream_file=args.stream, time_limit=args.time_limit,
+                    report_interval=args.report_interval, telemetry_file=args.telemetry,
+                    results_file=args.results)
+    if args.estimate:
+        for search_type in Search.ESTIMATED_TYPES:
+            estimate = search.estimate(search_type)
+            print(f"{get_search_name(search_type)}: {estimate['nodes']:.3e} nodes "
+                  f"(± {estimate['stderr']:.1e}), {estimate['evaluations']:.3e} scripts, "
+                  f"{format_duration(estimate['seconds'])} in one process")
+    elif sweep:
+        search.run_sweep(args.distribution)
+    else:
+        search.run()
 
 
 if __name__ == "__main__":
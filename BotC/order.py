@@ -1,33 +1,217 @@
 """
 Script to generate/fetch a night ordering of characters. Can be run independently to generate the
 night order with user input, or imported to use the data.
+
+Generating asks the user to compare pairs of characters. Answers are kept in a memo file, so no
+question is asked twice (or at all, if it is implied by earlier answers), and --insert adds new
+characters to the existing order with a binary search each. --derive instead builds the order
+straight from the numeric positions in characters.yaml, and reports where it differs from the
+existing order.
 """
-from data import characters, write_yaml, load_yaml
+import argparse
+import bisect
+import json
+import os
+import sys
+
+from collections import OrderedDict
+from data import DATA_DIR, get_registry, write_yaml, load_cached_yaml
 
 
-_DEFAULT_NIGHT_ORDER_FILE = './data/night-order.yaml'
+_DEFAULT_NIGHT_ORDER_FILE = os.path.join(DATA_DIR, 'night-order.yaml')
+_DEFAULT_MEMO_FILE = os.path.join(DATA_DIR, 'night-order-memo.json')
+
+# Steps of the night which are not characters, each night's in order. Dusk always comes first
+_NIGHT_ANCHORS = {
+    "firstNight": ("dusk", "minioninfo", "demoninfo", "dawn"),
+    "otherNight": ("dusk", "dawn"),
+}
+_ANCHOR_REMINDERS = {
+    "dusk": "Start the Night Phase.",
+    "dawn": "Wait for a few seconds. End the Night Phase.",
+    "minioninfo": "If there are 7 or more players, wake all Minions: Show the {THIS IS THE DEMON} "
+                  "token. Point to the Demon. Show the {THESE ARE YOUR MINIONS} token. Point to "
+                  "the other Minions.",
+    "demoninfo": "If there are 7 or more players, wake the Demon: Show the {THESE ARE YOUR "
+                 "MINIONS} token. Point to all Minions. Show the {THESE CHARACTERS ARE NOT IN "
+                 "PLAY} token. Show 3 not-in-play good character tokens.",
+}
+# Night to the Character attributes of its position and reminder
+_NIGHT_FIELDS = {
+    "firstNight": ("first_night", "first_night_reminder"),
+    "otherNight": ("other_night", "other_night_reminder"),
+}
 
 
 class _Orderable:
-    """Defines a less-than function to allow sorting"""
+    """A named reminder to be placed in a night order"""
     def __init__(self, name, reminder_text):
         self.name = name
         self.reminder_text = reminder_text
 
-    def __lt__(self, other):
-        """Compare with another character"""
-        decision = input(f"Should {self.name} go before {other.name}? [y/N] ")
-        return "y" == decision.lower().strip()
-
     def output(self):
         """YAML-compatible output format"""
         return {self.name: self.reminder_text.strip()}
 
 
-def generate_order(char_set, filename=None):
+def _ask_user(name_1, name_2, night):
+    """Ask whether name_1 goes before name_2 on night"""
+    decision = input(f"Should {name_1} go before {name_2}? [y/N] ")
+    return "y" == decision.lower().strip()
+
+
+class _ComparisonMemo():
+    """
+    Every answer to "should A go before B?", per night, along with all the answers they imply by
+    transitivity. If given a file, answers are loaded from it and each new answer is saved to it
+    straight away, so an interrupted ordering loses nothing.
     """
-    Generate night order for characters specified in char_set. If filename is not None, write output
-    in YAML format to the specified file.
+    VERSION = 1
+
+    def __init__(self, filename=None):
+        """Raises ValueError if the file exists but is not a memo of this version"""
+        self.filename = filename
+        # Night to the list of [earlier, later] answers given
+        self.answers = {}
+        # Night to dict of name to the set of names known to go after (or before) it
+        self._after = {}
+        self._before = {}
+        if filename is not None and os.path.exists(filename):
+            with open(filename) as file:
+                state = json.load(file)
+            if state.get("version") != self.VERSION:
+                raise ValueError(f"{filename} is not a night order memo of version {self.VERSION}")
+            for night, answers in state["answers"].items():
+                for earlier, later in answers:
+                    self._record(night, earlier, later)
+
+    def get(self, night, name_1, name_2):
+        """True if name_1 is known to go before name_2, False if after, or None if unknown"""
+        if name_2 in self._after.get(night, {}).get(name_1, ()):
+            return True
+        if name_1 in self._after.get(night, {}).get(name_2, ()):
+            return False
+        return None
+
+    def add(self, night, earlier, later):
+        """
+        Record that earlier goes before later, and save. Raises ValueError if the memo already
+        implies the opposite.
+        """
+        if self.get(night, earlier, later) is False:
+            raise ValueError(f"{later} is already known to go before {earlier}")
+        self._record(night, earlier, later)
+        if self.filename is not None:
+            self.save()
+
+    def _record(self, night, earlier, later):
+        """Add the answer, and everything it implies, without saving"""
+        self.answers.setdefault(night, []).append([earlier, later])
+        after = self._after.setdefault(night, {})
+        before = self._before.setdefault(night, {})
+        # Everything before earlier now goes before everything after later
+        earliers = before.get(earlier, set()) | {earlier}
+        laters = after.get(later, set()) | {later}
+        for name in earliers:
+            after.setdefault(name, set()).update(laters)
+        for name in laters:
+            before.setdefault(name, set()).update(earliers)
+
+    def save(self):
+        state = {
+            "version": self.VERSION,
+            "answers": self.answers,
+        }
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, 'w') as file:
+            json.dump(state, file)
+        os.replace(temp_filename, self.filename)
+
+
+def _get_comparer(night, memo, ask):
+    """
+    Returns a function of whether one _Orderable goes before another on night, which only asks
+    when memo cannot answer
+    """
+    def goes_before(orderable_1, orderable_2):
+        known = memo.get(night, orderable_1.name, orderable_2.name)
+        if known is None:
+            known = ask(orderable_1.name, orderable_2.name, night)
+            if known:
+                memo.add(night, orderable_1.name, orderable_2.name)
+            else:
+                memo.add(night, orderable_2.name, orderable_1.name)
+        return known
+    return goes_before
+
+
+def _get_insertion_order(count):
+    """
+    The order to insert the count pending items of a merge-insertion sort, by index. Items are
+    taken in groups ending at the Jacobsthal numbers, each group last to first, so that every
+    binary search is over just under a power of two items.
+    """
+    order = []
+    previous = 1
+    k = 2
+    while len(order) < count:
+        group_end = (2 ** (k + 1) + (-1) ** k) // 3
+        # Pending index 0 is the second item to insert (the first is placed for free)
+        for item in range(min(group_end, count + 1), previous, -1):
+            order.append(item - 2)
+        previous = group_end
+        k += 1
+    return order
+
+
+def _merge_insertion_sort(items, goes_before):
+    """
+    Sort items with the Ford-Johnson merge-insertion sort, which makes close to the fewest
+    comparisons possible. Each comparison is expensive here, being a question for the user.
+    @param goes_before function of whether its first argument sorts before its second
+    @return a new sorted list
+    """
+    if len(items) <= 1:
+        return list(items)
+
+    # Compare in pairs, then sort the later item of each pair
+    pairs = []
+    for i in range(0, len(items) - 1, 2):
+        if goes_before(items[i], items[i + 1]):
+            pairs.append((items[i], items[i + 1]))
+        else:
+            pairs.append((items[i + 1], items[i]))
+    earlier_of = {id(later): earlier for earlier, later in pairs}
+    laters = _merge_insertion_sort([later for _, later in pairs], goes_before)
+
+    # The earliest pair's earlier item is before everything in the chain
+    chain = [earlier_of[id(laters[0])]] + laters
+    # Each pending item goes before its partner, so only the chain up to that is searched
+    pending = [(earlier_of[id(later)], later) for later in laters[1:]]
+    if len(items) % 2 == 1:
+        pending.append((items[-1], None))
+    for index in _get_insertion_order(len(pending)):
+        item, partner = pending[index]
+        low = 0
+        high = len(chain)
+        if partner is not None:
+            high = next(i for i, chained in enumerate(chain) if chained is partner)
+        while low < high:
+            middle = (low + high) // 2
+            if goes_before(item, chain[middle]):
+                high = middle
+            else:
+                low = middle + 1
+        chain.insert(low, item)
+    return chain
+
+
+def generate_order(char_set, filename=None, memo_file=None, ask=_ask_user):
+    """
+    Generate night order for characters specified in char_set, by asking the user how pairs of
+    characters are ordered. Questions whose answers are already known, directly or by
+    transitivity, are skipped, and the rest are kept few by a merge-insertion sort.
+    If filename is not None, write output in YAML format to the specified file.
     @param char_set dict of characters in the following format:
     {
         <name>: {
@@ -36,6 +220,9 @@ def generate_order(char_set, filename=None):
         }, ...
     }
     @param filename the file to write results to when done. Will silently overwrite if this exists!
+    @param memo_file JSON file to keep the answers in, so that an interrupted run (or a later one
+      with more characters) does not ask them again
+    @param ask function (name_1, name_2, night) of whether name_1 goes before name_2
     @return order dict of night order in the below format. This includes dusk and dawn
     {
         "firstNight": [
@@ -48,22 +235,8 @@ def generate_order(char_set, filename=None):
         ]
     }
     """
-    # Define dawn/dusk for consistency
-    _DUSK = _Orderable("dusk", "Start the Night Phase.")
-    _DAWN = _Orderable("dawn", "Wait for a few seconds. End the Night Phase.")
-    _MINION_INFO = _Orderable("minion info",
-                              "If there are 7 or more players, wake all Minions: Show the {THIS " +
-                              "IS THE DEMON} token. Point to the Demon. Show the {THESE ARE YOUR " +
-                              "MINIONS} token. Point to the other Minions.")
-    _DEMON_INFO = _Orderable("demon info",
-                             "If there are 7 or more players, wake the Demon: Show the {THESE " +
-                             "ARE YOUR MINIONS} token. Point to all Minions. Show the {THESE " +
-                             "CHARACTERS ARE NOT IN PLAY} token. Show 3 not-in-play good " +
-                             "character tokens.")
-    order = {
-        "firstNight": [_DAWN, _MINION_INFO, _DEMON_INFO],
-        "otherNight": [_DAWN],
-    }
+    order = {night: [_Orderable(name, _ANCHOR_REMINDERS[name]) for name in anchors[1:]]
+             for night, anchors in _NIGHT_ANCHORS.items()}
 
     for char_name in char_set.keys():
         # Determine whether character wakes at night
@@ -72,11 +245,12 @@ def generate_order(char_set, filename=None):
                 orderable = _Orderable(char_name, char_set[char_name][night])
                 order[night].append(orderable)
 
-    # Sort into correct order (where each comparison asks the user)
+    # Sort into correct order (where each unknown comparison asks the user)
+    memo = _ComparisonMemo(memo_file)
     for night in order.keys():
         print(f"== {night} ============")
-        order[night].sort()
-        order[night] = [_DUSK.output()] + \
+        order[night] = _merge_insertion_sort(order[night], _get_comparer(night, memo, ask))
+        order[night] = [_Orderable("dusk", _ANCHOR_REMINDERS["dusk"]).output()] + \
                        [char.output() for char in order[night]]
 
     # Write to file
@@ -85,49 +259,509 @@ def generate_order(char_set, filename=None):
     return order
 
 
-def pick_from_order(character_names, include_defaults=True, filename=_DEFAULT_NIGHT_ORDER_FILE):
+def insert_into_order(char_set, filename=_DEFAULT_NIGHT_ORDER_FILE, memo_file=None, ask=_ask_user,
+                      output_filename=None):
+    """
+    Add new characters to an existing night order, binary searching each into place with about
+    log2(n) questions rather than generating the whole order again.
+    @param char_set dict of the characters to add, in the format taken by generate_order
+    @param filename the night order to add to (defaults to data/night-order.yaml)
+    @param memo_file JSON file to keep the answers in, as for generate_order
+    @param ask function (name_1, name_2, night) of whether name_1 goes before name_2
+    @param output_filename the file to write the new order to (defaults to filename)
+    @return the new order dict, in the format returned by generate_order
+    Raises ValueError if the order cannot be loaded, or already includes one of the characters.
+    """
+    order = load_cached_yaml(filename)
+    if not isinstance(order, dict):
+        raise ValueError(f"Could not load a night order from {filename}")
+    memo = _ComparisonMemo(memo_file)
+
+    for night, entries in order.items():
+        goes_before = _get_comparer(night, memo, ask)
+        names = {list(entry.keys())[0] for entry in entries}
+        for char_name, reminders in char_set.items():
+            if reminders.get(night, 0) == 0:
+                continue
+            if char_name in names:
+                raise ValueError(f"{char_name} is already in the {night} order of {filename}")
+            print(f"== {night} ============")
+            orderable = _Orderable(char_name, reminders[night])
+            # Dusk always stays first
+            low = 1 if len(entries) > 0 and "dusk" in entries[0] else 0
+            high = len(entries)
+            while low < high:
+                middle = (low + high) // 2
+                (other_name, other_reminder), = entries[middle].items()
+                if goes_before(orderable, _Orderable(other_name, other_reminder)):
+                    high = middle
+                else:
+                    low = middle + 1
+            entries.insert(low, orderable.output())
+            names.add(char_name)
+
+    write_yaml(filename if output_filename is None else output_filename, order)
+    return order
+
+
+def derive_order(registry=None, anchor_positions=None, filename=None):
+    """
+    Build the night order straight from the numeric firstNight and otherNight positions in
+    characters.yaml, without asking anything. Positions start at 1, and those no character uses
+    are taken by the anchors (dusk, minion info, demon info and dawn), in order.
+    @param registry CharacterRegistry to read the characters from (defaults to data.registry)
+    @param anchor_positions optional dict of night to dict of anchor name to its position, for
+      when the unused positions do not match the anchors
+    @param filename if not None, the file to write the order to in YAML format
+    @return (order, ties). order is a dict in the format returned by generate_order. ties is a
+      dict of night to a list of the lists of characters which share a position, which are
+      ordered by name
+    Raises ValueError if the anchors cannot be placed.
+    """
+    if registry is None:
+        registry = get_registry()
+    order = {}
+    ties = {}
+    for night, (position_field, reminder_field) in _NIGHT_FIELDS.items():
+        ranked = []
+        by_position = {}
+        for char in registry:
+            position = getattr(char, position_field)
+            if position:
+                reminder = getattr(char, reminder_field) or ""
+                ranked.append((position, 0, char.name, reminder))
+                by_position.setdefault(position, []).append(char.name)
+        ties[night] = [sorted(names) for _, names in sorted(by_position.items())
+                       if len(names) > 1]
+
+        anchors = _NIGHT_ANCHORS[night]
+        positions = (anchor_positions or {}).get(night)
+        if positions is None:
+            last = max(by_position.keys(), default=0)
+            unused = [position for position in range(1, last + 1) if position not in by_position]
+            if len(unused) == len(anchors) - 1 or len(by_position) == 0:
+                # Nothing comes after the last anchor
+                unused += range(last + 1, last + 1 + len(anchors) - len(unused))
+            if len(unused) != len(anchors):
+                raise ValueError(f"Cannot place the {night} anchors {', '.join(anchors)} at the "
+                                 f"unused positions {unused}, so give anchor_positions")
+            positions = dict(zip(anchors, unused))
+        for anchor_index, anchor in enumerate(anchors):
+            # Before any character at the same position
+            ranked.append((positions[anchor], anchor_index - len(anchors), anchor,
+                           _ANCHOR_REMINDERS[anchor]))
+        ranked.sort()
+        order[night] = [_Orderable(name, reminder).output() for *_, name, reminder in ranked]
+
+    if filename is not None:
+        write_yaml(filename, order)
+    return order, ties
+
+
+def _get_out_of_order(names, ranks):
+    """
+    The fewest of names to move for them to be in the order of ranks, found as those outside the
+    longest run of names already in order
+    @param names list of names, each with a rank
+    @param ranks dict of name to its rank in the other order
+    """
+    # Patience sorting: tails[i] is the index of the smallest tail of an increasing run of i + 1
+    tails = []
+    tail_ranks = []
+    previous = [None] * len(names)
+    for i, name in enumerate(names):
+        low = bisect.bisect_left(tail_ranks, ranks[name])
+        previous[i] = tails[low - 1] if low > 0 else None
+        if low == len(tails):
+            tails.append(i)
+            tail_ranks.append(ranks[name])
+        else:
+            tails[low] = i
+            tail_ranks[low] = ranks[name]
+    in_order = set()
+    i = tails[-1] if len(tails) > 0 else None
+    while i is not None:
+        in_order.add(i)
+        i = previous[i]
+    return [name for i, name in enumerate(names) if i not in in_order]
+
+
+def compare_orders(order, reference):
+    """
+    Find where order disagrees with reference, e.g. a derived order against the curated one.
+    @param order dict of night order, in the format returned by generate_order
+    @param reference dict of night order in the same format
+    @return dict of night to a dict of "missing" (names only in reference), "extra" (names only
+      in order), "moved" (the fewest names of both which must move to match reference) and
+      "reminder changed" (names of both whose reminder text differs), each a list of names.
+      Nights which agree are left out.
+    """
+    conflicts = {}
+    for night in order.keys() | reference.keys():
+        names = [list(entry.keys())[0] for entry in order.get(night, [])]
+        reminders = [list(entry.values())[0] for entry in order.get(night, [])]
+        reference_ranks = {list(entry.keys())[0]: rank
+                           for rank, entry in enumerate(reference.get(night, []))}
+        reference_reminders = {list(entry.keys())[0]: list(entry.values())[0]
+                               for entry in reference.get(night, [])}
+        shared = [name for name in names if name in reference_ranks]
+        present = set(names)
+        night_conflicts = {
+            "missing": [name for name in reference_ranks if name not in present],
+            "extra": [name for name in names if name not in reference_ranks],
+            "moved": _get_out_of_order(shared, reference_ranks),
+            "reminder changed": [name for name, reminder in zip(names, reminders)
+                                 if name in reference_reminders
+                                 and reminder.strip() != reference_reminders[name].strip()],
+        }
+        if any(len(names) > 0 for names in night_conflicts.values()):
+            conflicts[night] = night_conflicts
+    return conflicts
+
+
+class NightOrderOverlay():
+    """
+    A script's exceptions to the global night order, as constraints that one name goes before
+    another on a night. Only the constraints are stored, never a copy of the order. Each
+    constraint changes the order as little as it can: a character that must wait for another
+    follows straight after it.
+    """
+    def __init__(self, constraints=()):
+        """
+        @param constraints iterable of (night, earlier name, later name), e.g. the constraints
+          attribute of another overlay, as saved to YAML or JSON
+        Raises ValueError if the constraints contradict each other.
+        """
+        self.constraints = []
+        # Night to dict of name to the names which must come after it
+        self._later = {}
+        self._key = None
+        for night, earlier, later in constraints:
+            self.add_before(night, earlier, later)
+
+    def __len__(self):
+        return len(self.constraints)
+
+    def add_before(self, night, name, other):
+        """
+        Put name before other on night. Raises ValueError if the overlay already puts other
+        before name, directly or through other constraints.
+        """
+        if name == other:
+            raise ValueError(f"{name} cannot go before itself")
+        later = self._later.setdefault(night, {})
+        if other in later.get(name, ()):
+            return
+        # Adding the constraint must not close a cycle
+        stack = [other]
+        seen = {other}
+        while stack:
+            current = stack.pop()
+            if current == name:
+                raise ValueError(f"{name} cannot go before {other} on {night}, as the overlay "
+                                 f"already puts {other} before {name}")
+            for next_name in later.get(current, ()):
+                if next_name not in seen:
+                    seen.add(next_name)
+                    stack.append(next_name)
+        later.setdefault(name, []).append(other)
+        self.constraints.append((night, name, other))
+        self._key = None
+
+    def add_after(self, night, name, other):
+        """Put name after other on night, i.e. straight after it if it would have been earlier"""
+        self.add_before(night, other, name)
+
+    def get_key(self):
+        """Hashable key of the constraints, equal for overlays with the same constraints"""
+        if self._key is None:
+            self._key = frozenset(self.constraints)
+        return self._key
+
+    def get_later(self, night):
+        """Dict of each constrained name to the names which must come after it on night"""
+        return self._later.get(night, {})
+
+
+def _merge_constraints(base, later, hidden):
+    """
+    Topologically merge constraints into an order, keeping to it wherever the constraints allow.
+    Takes time proportional to the number of names and constraints.
+    @param base list of names, in their order without the constraints
+    @param later dict of name to the names which must come after it
+    @param hidden names in base which only carry constraints through, and are left out
+    @return the new list of names
+    Raises ValueError if the constraints form a cycle.
+    """
+    position = {name: i for i, name in enumerate(base)}
+    waiting_for = dict.fromkeys(base, 0)
+    for name in base:
+        for later_name in later.get(name, ()):
+            if later_name in waiting_for:
+                waiting_for[later_name] += 1
+
+    merged = []
+    passed = set()
+    for name in base:
+        passed.add(name)
+        if waiting_for[name] > 0:
+            continue
+        # Names which were passed while waiting go straight after what they waited for
+        stack = [name]
+        while stack:
+            current = stack.pop()
+            merged.append(current)
+            released = []
+            for later_name in later.get(current, ()):
+                if later_name in waiting_for:
+                    waiting_for[later_name] -= 1
+                    if waiting_for[later_name] == 0 and later_name in passed:
+                        released.append(later_name)
+            released.sort(key=position.__getitem__, reverse=True)
+            stack.extend(released)
+
+    if len(merged) < len(base):
+        stuck = [name for name in base if waiting_for[name] > 0]
+        raise ValueError(f"Contradictory constraints between {', '.join(stuck)}")
+    return [name for name in merged if name not in hidden]
+
+
+class NightOrderIndex():
+    """
+    Rank index of a night order, as loaded from night-order.yaml. Each name maps to its
+    (night, position, reminder) on every night it wakes, so a script is ordered by sorting its own
+    characters by rank rather than walking the whole order.
+    """
+    # Steps of every night order, which are not characters
+    DEFAULTS = ("dusk", "dawn", "minioninfo", "demoninfo")
+    # Number of orders resolved with an overlay to keep
+    RESOLVED_CACHE_SIZE = 4096
+
+    def __init__(self, order, filename=None):
+        """
+        @param order dict of night order, in the format returned by generate_order
+        @param filename the file the order was loaded from, for error messages
+        Raises ValueError if an entry is not a single {<name>: <reminder>}.
+        """
+        self.nights = list(order.keys())
+        # Name to a tuple of (night, position, reminder), one for each night it wakes
+        self.ranks = {}
+        # Night to dict of name to (position, reminder)
+        self._night_ranks = {night: {} for night in self.nights}
+        for night, entries in order.items():
+            for position, entry in enumerate(entries):
+                if not isinstance(entry, dict) or len(entry) != 1:
+                    raise ValueError(f"Issue while processing data from {filename}: expected "
+                                     f"a single {{<name>: <reminder>}}, got {entry!r}")
+                (name, reminder), = entry.items()
+                self.ranks[name] = self.ranks.get(name, ()) + ((night, position, reminder),)
+                self._night_ranks[night][name] = (position, reminder)
+        # (names, overlay key) to each night's tuple of (name, reminder), least recent first
+        self._resolved = OrderedDict()
+
+    def pick(self, character_names, include_defaults=True, overlay=None):
+        """
+        The night order of just the given characters. Returns a new dict, in the format of
+        pick_from_order. Unknown names, and characters which do not wake, are left out.
+        @param overlay optional NightOrderOverlay of exceptions to the order
+        Raises ValueError if the overlay constrains a name which does not wake on its night.
+        """
+        names = set(character_names)
+        if include_defaults:
+            names.update(self.DEFAULTS)
+        if overlay is not None and len(overlay) > 0:
+            resolved = self._resolve(frozenset(names), overlay)
+            return {night: [{name: reminder} for name, reminder in entries]
+                    for night, entries in resolved.items()}
+
+        ranked = {night: [] for night in self.nights}
+        for name in names:
+            for night, position, reminder in self.ranks.get(name, ()):
+                ranked[night].append((position, name, reminder))
+        order = {}
+        for night, entries in ranked.items():
+            entries.sort()
+            order[night] = [{name: reminder} for _, name, reminder in entries]
+        return order
+
+    def _resolve(self, names, overlay):
+        """Each night's tuple of (name, reminder) for names under the overlay, through the cache"""
+        key = (names, overlay.get_key())
+        resolved = self._resolved.get(key)
+        if resolved is not None:
+            self._resolved.move_to_end(key)
+            return resolved
+
+        resolved = {}
+        for night in self.nights:
+            night_ranks = self._night_ranks[night]
+            later = overlay.get_later(night)
+            constrained = set(later.keys()).union(*later.values())
+            for name in constrained:
+                if name not in night_ranks:
+                    raise ValueError(f"The overlay orders {name}, which does not wake on {night}")
+            # Constrained names outside the script still pass their constraints on
+            hidden = constrained - names
+            base = sorted((name for name in names | hidden if name in night_ranks),
+                          key=lambda name: night_ranks[name][0])
+            merged = _merge_constraints(base, later, hidden)
+            resolved[night] = tuple((name, night_ranks[name][1]) for name in merged)
+
+        self._resolved[key] = resolved
+        if len(self._resolved) > self.RESOLVED_CACHE_SIZE:
+            self._resolved.popitem(last=False)
+        return resolved
+
+
+# File to (modification time, size, index) of each night order loaded
+_indexes = {}
+
+
+def get_night_order_index(filename=_DEFAULT_NIGHT_ORDER_FILE):
+    """
+    The NightOrderIndex of filename, built once and rebuilt only if the file changes.
+    Raises ValueError if the file cannot be loaded.
+    """
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        raise ValueError(f"Could not find {filename}")
+    cached = _indexes.get(filename)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    order = load_cached_yaml(filename)
+    if not isinstance(order, dict):
+        raise ValueError(f"Could not load a night order from {filename}")
+    index = NightOrderIndex(order, filename)
+    _indexes[filename] = (stat.st_mtime_ns, stat.st_size, index)
+    return index
+
+
+def pick_from_order(character_names, include_defaults=True, filename=_DEFAULT_NIGHT_ORDER_FILE,
+                    overlay=None):
     """
     Assign characters a night order from the specified file.
-    @param character_names list of character names to include in the order
+    @param character_names iterable of character names to include in the order. Not modified.
     @param include_defaults bool of whether to include dusk/dawn/minioninfo/demoninfo
-    @param filename save file to source order from (defaults to ./data/night-order.yaml)
+    @param filename save file to source order from (defaults to data/night-order.yaml)
+    @param overlay optional NightOrderOverlay of the script's exceptions to the order
     @return order dict of night order in the below format. This includes dusk and dawn
     {
-        "first night": [
+        "firstNight": [
             {<name>: <first night reminder>},
             ...
         ],
-        "other nights": [
+        "otherNight": [
             {<name>: <other nights reminder>},
             ...
         ]
     }
+    Raises ValueError if the file cannot be loaded or is malformed, or the overlay constrains a
+    name which does not wake on its night.
+    """
+    return get_night_order_index(filename).pick(character_names, include_defaults, overlay)
+
+
+def pick_many_from_order(scripts, include_defaults=True, filename=_DEFAULT_NIGHT_ORDER_FILE,
+                         overlays=None):
     """
-    order = load_yaml(filename)
+    Night orders of many scripts at once, for which the file is only checked once.
+    @param scripts iterable of scripts, each an iterable of character names
+    @param overlays optional iterable of a NightOrderOverlay (or None) for each script
+    @return list of night order dicts, one per script in the order given, in the format returned
+      by pick_from_order
+    """
+    index = get_night_order_index(filename)
+    if overlays is None:
+        return [index.pick(script, include_defaults) for script in scripts]
+    return [index.pick(script, include_defaults, overlay)
+            for script, overlay in zip(scripts, overlays, strict=True)]
+
 
-    names_to_keep = character_names
-    if include_defaults:
-        names_to_keep += ["dusk", "dawn", "minioninfo", "demoninfo"]
+def get_night_reminders(teams=("townsfolk", "outsider", "minion", "demon"), registry=None):
+    """
+    Reminders of every character in teams which wakes at night, in the char_set format taken by
+    generate_order
+    @param registry CharacterRegistry to read the characters from (defaults to data.registry)
+    """
+    if registry is None:
+        registry = get_registry()
+    char_set = {}
+    for team in teams:
+        for char_id in registry.get_team_range(team):
+            char = registry[char_id]
+            reminders = {}
+            if char.first_night:
+                reminders["firstNight"] = char.first_night_reminder or ""
+            if char.other_night:
+                reminders["otherNight"] = char.other_night_reminder or ""
+            char_set[char.name] = reminders
+    return char_set
 
+
+def format_conflicts(conflicts, ties):
+    """
+    Lines describing the results of compare_orders and the ties of derive_order, if there are any
+    """
+    lines = []
+    for night, night_conflicts in conflicts.items():
+        for kind, names in night_conflicts.items():
+            if len(names) > 0:
+                lines.append(f"{night}: {kind}: {', '.join(names)}")
+    for night, night_ties in ties.items():
+        for names in night_ties:
+            lines.append(f"{night}: share a position: {', '.join(names)}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate data/night-order.yaml by asking how "
+                                     "pairs of characters are ordered")
+    parser.add_argument("--memo", default=_DEFAULT_MEMO_FILE, metavar="FILE",
+                        help="file to keep answers in, so that they are never asked twice "
+                             f"(default {os.path.relpath(_DEFAULT_MEMO_FILE)})")
+    parser.add_argument("--insert", nargs="+", metavar="CHARACTER",
+                        help="add just these characters to the existing order")
+    parser.add_argument("--derive", action="store_true",
+                        help="instead build the order from the firstNight/otherNight positions in "
+                             "data/characters.yaml, without asking, and report how it differs "
+                             "from the existing order")
+    parser.add_argument("--check", action="store_true",
+                        help="like --derive, but only report, and exit with status 1 if the "
+                             "orders differ or any characters share a position")
+    args = parser.parse_args()
+
+    if args.derive or args.check:
+        derived, ties = derive_order()
+        curated = load_cached_yaml(_DEFAULT_NIGHT_ORDER_FILE) \
+            if os.path.exists(_DEFAULT_NIGHT_ORDER_FILE) else None
+        conflicts = {} if curated is None else compare_orders(derived, curated)
+        lines = format_conflicts(conflicts, ties)
+        for line in lines:
+            print(line)
+        if args.check:
+            if len(lines) > 0:
+                sys.exit(1)
+            print(f"{os.path.relpath(_DEFAULT_NIGHT_ORDER_FILE)} matches data/characters.yaml")
+        else:
+            write_yaml(_DEFAULT_NIGHT_ORDER_FILE, derived)
+            print(f"Wrote {os.path.relpath(_DEFAULT_NIGHT_ORDER_FILE)}")
+        return
+
+    char_set = get_night_reminders()
     try:
-        for night in order.keys():
-            to_remove = []
-            for i in range(len(order[night])):
-                char_object = order[night][i]
-                char_name = list(char_object.keys())[0]
-                if char_name not in names_to_keep:
-                    to_remove.append(i)
-            # Remove later because list traversal funtimes
-            for i in reversed(to_remove):
-                del order[night][i]
-        return order
-    except ValueError as e:
-        raise ValueError(f"Issue while processing data from {filename}: {e.msg}")
+        if args.insert is None:
+            generate_order(char_set, _DEFAULT_NIGHT_ORDER_FILE, args.memo)
+        else:
+            unknown = [char_name for char_name in args.insert if char_name not in char_set]
+            if len(unknown) > 0:
+                parser.error(f"Unknown characters: {', '.join(unknown)}")
+            insert_into_order({char_name: char_set[char_name] for char_name in args.insert},
+                              memo_file=args.memo)
+    except KeyboardInterrupt:
+        print(f"\nStopped. Answers so far are kept in {args.memo}")
 
 
-# If run directly, generate ./data/night-order.yaml
+# If run directly, generate data/night-order.yaml
 if __name__ == '__main__':
-    # Load all characters
-    all_chars = characters["townsfolk"] | characters["outsider"] | \
-                characters["minion"] | characters["demon"]
-    generate_order(all_chars, _DEFAULT_NIGHT_ORDER_FILE)
+    main()
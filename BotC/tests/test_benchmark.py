@@ -0,0 +1,64 @@
+""" Tests for the search benchmark harness """
+
+import pytest
+
+import benchmark
+
+
+def _first_script(graph):
+    """A custom search which returns the first characters of each team"""
+    chars = list(graph.names)
+    return [chars[:1]]
+
+
+@pytest.fixture
+def tiny_graphs():
+    return benchmark.get_graphs(sizes=[6], densities=[0.3], real=False)
+
+
+class TestBenchmark():
+    def test_synthetic_world_is_seeded(self):
+        assert benchmark.synthetic_world(8, 0.2) == benchmark.synthetic_world(8, 0.2)
+        assert benchmark.synthetic_world(8, 0.2, 1) != benchmark.synthetic_world(8, 0.2, 2)
+
+        char_dict, jinx_dict = benchmark.synthetic_world(8, 0.0)
+        assert [len(team) for team in char_dict.values()] == [8, 8, 8, 8]
+        assert jinx_dict == {}
+
+    def test_run_benchmarks(self, tiny_graphs):
+        document = benchmark.run_benchmarks(["exhaustion", "branch-and-bound", _first_script],
+                                            tiny_graphs, time_limit=30, log=lambda _: None)
+        results = {result["strategy"]: result for result in document["results"]}
+        assert set(results) == {"exhaustion", "branch-and-bound",
+                                "test_benchmark._first_script"}
+        for result in results.values():
+            assert "error" not in result
+            assert result["graph"] == "synthetic-6-0.3"
+            assert result["distribution"] == "3/1/1/1"
+            assert result["peak_memory_kib"] > 0
+            assert not result["timed_out"]
+        # Both exact searches agree
+        assert results["exhaustion"]["best_jinxes"] == results["branch-and-bound"]["best_jinxes"]
+        assert results["exhaustion"]["evaluations"] == 20 * 6 * 6 * 6
+
+    def test_time_limit(self):
+        graphs = benchmark.get_graphs(sizes=[16], densities=[0.25], real=False)
+        result = benchmark.run_case("exhaustion", graphs[0], time_limit=0.5)
+        assert result["timed_out"]
+        assert result["best_jinxes"] is not None
+        assert result["wall_seconds"] < 10
+
+    def test_compare(self):
+        def _document(best, rate):
+            return {"results": [{
+                "strategy": "tabu",
+                "graph": "real",
+                "best_jinxes": best,
+                "evaluations_per_second": rate,
+            }]}
+        assert benchmark.compare(_document(46, 1000), _document(46, 900)) == []
+        assert benchmark.compare(_document(46, 1000), _document(47, 100000)) == []
+        assert len(benchmark.compare(_document(46, 1000), _document(45, 1000))) == 1
+        assert len(benchmark.compare(_document(46, 1000), _document(46, 500))) == 1
+        # New cases have nothing to regress from
+        assert benchmark.compare({"results": []}, _document(1, 1)) == []
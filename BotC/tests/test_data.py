@@ -1,8 +1,11 @@
 """ Tests for data integrity and fetching """
 
 import os
+import subprocess
+import sys
 import pytest
 
+import data
 from data import characters, jinxes, load_yaml, write_yaml, get_team_of_character
 from urllib.parse import urlparse
 
@@ -420,3 +423,199 @@ class TestYAMLOperations():
         finally:
             # Cleanup
             os.remove(self.TEST_YAML_FILE)
+
+
+class TestYAMLCache():
+    """Test that parsed YAML is cached, and the cache kept up to date"""
+    def _load_without_parsing(self, monkeypatch, filename):
+        """Load filename, failing if it has to be parsed rather than read from the cache"""
+        with monkeypatch.context() as patch:
+            patch.setattr(data, "load_yaml", lambda _: pytest.fail("Parsed despite the cache"))
+            return data.load_cached_yaml(filename)
+
+    def test_cache_is_used(self, tmp_path, monkeypatch):
+        filename = str(tmp_path / "test.yaml")
+        write_yaml(filename, YAML_TEST["object"])
+        assert data.load_cached_yaml(filename) == YAML_TEST["object"]
+        assert os.path.exists(data.get_cache_filename(filename))
+        assert self._load_without_parsing(monkeypatch, filename) == YAML_TEST["object"]
+
+    def test_rebuilt_on_change(self, tmp_path):
+        filename = str(tmp_path / "test.yaml")
+        write_yaml(filename, YAML_TEST["object"])
+        data.load_cached_yaml(filename)
+
+        changed = {"test": {"data": [1, 2], "name": "changed"}}
+        write_yaml(filename, changed)
+        assert data.load_cached_yaml(filename) == changed
+
+    def test_touched_file_reuses_cache(self, tmp_path, monkeypatch):
+        filename = str(tmp_path / "test.yaml")
+        write_yaml(filename, YAML_TEST["object"])
+        data.load_cached_yaml(filename)
+
+        # Same contents with a new modification time, as after a fresh checkout
+        stat = os.stat(filename)
+        os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert self._load_without_parsing(monkeypatch, filename) == YAML_TEST["object"]
+        assert self._load_without_parsing(monkeypatch, filename) == YAML_TEST["object"]
+
+    def test_corrupt_cache(self, tmp_path):
+        filename = str(tmp_path / "test.yaml")
+        write_yaml(filename, YAML_TEST["object"])
+        data.load_cached_yaml(filename)
+        with open(data.get_cache_filename(filename), "wb") as file:
+            file.write(b"not a cache")
+        assert data.load_cached_yaml(filename) == YAML_TEST["object"]
+
+    def test_matches_parse(self):
+        assert characters == load_yaml("./data/characters.yaml")
+        assert jinxes == load_yaml("./data/jinxes.yaml")
+
+
+class TestLazyExports():
+    """Test that the datasets load on first use, from anywhere"""
+    def _run_elsewhere(self, tmp_path, code):
+        """Run code in a fresh interpreter, from a directory without the data"""
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(data.__file__))
+        return subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env,
+                              capture_output=True, text=True, check=True).stdout.split()
+
+    def test_loads_on_first_access(self, tmp_path):
+        output = self._run_elsewhere(tmp_path, "import data; "
+                                     "print('characters' in vars(data)); "
+                                     "print(len(data.characters)); "
+                                     "print('characters' in vars(data), 'jinxes' in vars(data))")
+        assert output == ["False", str(len(EXPECTED_COUNTS)), "True", "False"]
+
+    def test_from_import(self, tmp_path):
+        output = self._run_elsewhere(tmp_path, "from data import jinxes, get_team_of_character; "
+                                     "print(len(jinxes)); print(get_team_of_character('imp'))")
+        assert output == [str(len(jinxes)), "demon"]
+
+    def test_unknown_attribute(self):
+        with pytest.raises(AttributeError):
+            data.not_a_dataset
+
+
+class TestCharacterRegistry():
+    """Test the indexed view of the characters"""
+    def test_ids_are_dense_and_grouped_by_team(self):
+        registry = data.registry
+        assert len(registry) == sum(EXPECTED_COUNTS.values())
+        assert registry.teams == list(characters.keys())
+        next_id = 0
+        for team in registry.teams:
+            team_range = registry.get_team_range(team)
+            assert team_range.start == next_id
+            assert len(team_range) == EXPECTED_COUNTS[team]
+            assert registry.get_team_names(team) == list(characters[team].keys())
+            next_id = team_range.stop
+        assert next_id == len(registry)
+
+    @pytest.mark.parametrize("team", EXPECTED_COUNTS.keys())
+    def test_lookups(self, team):
+        registry = data.registry
+        for name in characters[team].keys():
+            char_id = registry.get_id(name)
+            assert registry.get_name(char_id) == name
+            assert registry.get_team(name) == team
+            assert registry.get_team_of_id(char_id) == team
+            assert registry.types[name] == team
+            assert registry[char_id] is registry[name] is registry.get(name)
+            assert name in registry
+
+    def test_unknown_character(self):
+        registry = data.registry
+        assert "not a character" not in registry
+        assert registry.get("not a character") is None
+        assert registry.get_id("not a character") is None
+        assert registry.get_team("not a character") is None
+        assert get_team_of_character("not a character") is None
+        with pytest.raises(KeyError):
+            registry["not a character"]
+        with pytest.raises(KeyError):
+            registry[len(registry)]
+
+    def test_records_match_yaml(self):
+        for char in data.registry:
+            fields = characters[char.team][char.name]
+            assert char.display_name == fields["name"]
+            assert char.ability == fields["ability"]
+            assert char.first_night == fields.get("firstNight", 0)
+            assert char.first_night_reminder == fields.get("firstNightReminder")
+            assert char.other_night == fields.get("otherNight", 0)
+            assert char.other_night_reminder == fields.get("otherNightReminder")
+            assert char.setup == fields.get("setup", False)
+            assert not hasattr(char, "__dict__")
+
+    def test_built_once(self):
+        assert data.get_registry() is data.registry
+        assert data.get_registry(characters) is data.registry
+
+    def test_other_characters(self):
+        char_dict = {"townsfolk": {"a": {"firstNight": 3}, "b": None}, "demon": {"c": {}}}
+        registry = data.get_registry(char_dict)
+        try:
+            assert registry.names == ["a", "b", "c"]
+            assert registry["a"].first_night == 3
+            assert registry["b"].first_night == 0
+            assert registry.get_team_range("demon") == range(2, 3)
+        finally:
+            data.get_registry()
+
+    def test_duplicate_character(self):
+        with pytest.raises(ValueError):
+            data.CharacterRegistry({"townsfolk": {"a": {}}, "outsider": {"a": {}}})
+
+
+class TestJinxIndex():
+    """Test the symmetric view of the jinxes"""
+    def test_matches_yaml(self):
+        index = data.jinx_index
+        count = 0
+        for char_1, char_jinxes in jinxes.items():
+            for char_2, text in char_jinxes.items():
+                assert index.jinx_between(char_1, char_2) == text
+                assert index.jinx_between(char_2, char_1) == text
+                assert index.jinxes_for(char_2)[char_1] == text
+                count += 1
+        assert len(index) == count == len(list(index))
+        assert data.get_jinx_index() is index
+
+    def test_unjinxed(self):
+        index = data.jinx_index
+        assert index.jinx_between("imp", "washerwoman") is None
+        assert index.jinx_between("not a character", "imp") is None
+        assert len(index.jinxes_for("not a character")) == 0
+        with pytest.raises(TypeError):
+            index.jinxes_for("spy")["imp"] = "Read only"
+
+    @pytest.mark.parametrize("script", [
+        [],
+        ["imp"],
+        ["alchemist", "spy", "widow", "imp", "washerwoman"],
+        list(characters["minion"].keys()) + list(characters["townsfolk"].keys()),
+    ])
+    def test_jinxes_within(self, script):
+        expected = sorted((*sorted((char_1, char_2)), text)
+                          for char_1, char_jinxes in jinxes.items()
+                          for char_2, text in char_jinxes.items()
+                          if char_1 in script and char_2 in script)
+        assert data.jinx_index.jinxes_within(script) == expected
+        assert data.jinx_index.count_jinxes_within(script) == len(expected)
+
+    def test_stored_under_either_character(self):
+        index = data.JinxIndex({"b": {"a": "Jinx", "c": "Other"}, "c": {"b": "Other"}})
+        assert len(index) == 2
+        assert index.jinx_between("a", "b") == "Jinx"
+        assert dict(index.jinxes_for("b")) == {"a": "Jinx", "c": "Other"}
+        assert sorted(index) == [("a", "b", "Jinx"), ("b", "c", "Other")]
+
+    @pytest.mark.parametrize("jinx_dict", [
+        {"a": {"b": "Jinx"}, "b": {"a": "Different jinx"}},
+        {"a": {"a": "Jinx"}},
+    ])
+    def test_invalid(self, jinx_dict):
+        with pytest.raises(ValueError):
+            data.JinxIndex(jinx_dict)
@@ -0,0 +1,1021 @@
+""" Tests for the max jinx script search """
+
+import importlib.util
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import pytest
+
+from data import characters, jinxes
+
+
+def _load_script_module():
+    """The script's filename is not a valid module name, so load it by path"""
+    path = os.path.join(os.path.dirname(__file__), "..", "max-jinx-script.py")
+    spec = importlib.util.spec_from_file_location("max_jinx_script", path)
+    module = importlib.util.module_from_spec(spec)
+    # Worker processes find pickled functions by module name
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+mjs = _load_script_module()
+
+SMALL_JINXES = {
+    "a": {
+        "b": "A-B jinx",
+        "c": "A-C jinx",
+    },
+    "b": {
+        "c": "B-C jinx",
+    },
+    # Stored in reverse order, and duplicated
+    "d": {
+        "c": "C-D jinx",
+    },
+    "c": {
+        "d": "C-D jinx",
+    },
+}
+
+SAMPLE_SCRIPTS = [
+    (["a", "b", "c", "d"], 4),
+    (["a", "b"], 1),
+    (["d", "c", "e"], 1),
+    (["a", "d", "e"], 0),
+    ([], 0),
+]
+
+
+def _naive_num_jinxes(char_list):
+    """Count jinxes by checking every pair in both orders"""
+    count = 0
+    for i in range(len(char_list)):
+        for j in range(i + 1, len(char_list)):
+            char_1, char_2 = sorted([char_list[i], char_list[j]])
+            if char_2 in jinxes.get(char_1, {}) or char_1 in jinxes.get(char_2, {}):
+                count += 1
+    return count
+
+
+class TestJinxGraph():
+    """Tests of the bitset-backed _JinxGraph"""
+    def test_small_graph_structure(self):
+        graph = mjs._JinxGraph(SMALL_JINXES)
+        assert graph.get_total_num_jinxes() == 4
+        assert graph.get_num_jinxed_chars() == 4
+        assert graph.get_highest_num_jinxes() == 3
+        assert graph.get_degree("c") == 3
+        assert graph.get_degree("e") == 0
+
+    @pytest.mark.parametrize("char_list,expected", SAMPLE_SCRIPTS)
+    def test_small_graph_num_jinxes(self, char_list, expected):
+        graph = mjs._JinxGraph(SMALL_JINXES)
+        assert graph.get_num_jinxes(char_list) == expected
+        assert graph.count_jinxes(graph.to_mask(char_list)) == expected
+
+    def test_per_character(self):
+        graph = mjs._JinxGraph(SMALL_JINXES, ["e"])
+        assert graph.get_num_jinxes_per_character(["a", "c", "d", "e"]) == {
+            "a": 1,
+            "c": 2,
+            "d": 1,
+            "e": 0,
+        }
+
+    def test_masks(self):
+        graph = mjs._JinxGraph(SMALL_JINXES, ["e"])
+        # Unjinxed characters passed up-front are given ids first
+        assert graph.get_id("e") == 0
+        mask = graph.to_mask(["d", "e", "a"])
+        assert sorted(graph.to_names(mask)) == ["a", "d", "e"]
+        assert graph.count_jinxes_between(graph.to_mask(["a", "b"]),
+                                          graph.to_mask(["c", "d"])) == 2
+
+    def test_real_graph(self):
+        all_chars = [char_name for team in mjs.TOWN_DISTRIBUTION.keys()
+                     for char_name in characters[team].keys()]
+        graph = mjs._JinxGraph(jinxes, all_chars)
+        assert graph.get_total_num_jinxes() == 131
+
+        # Compare against pairwise counting on a spread of scripts
+        for start in range(0, len(all_chars) - 25, 7):
+            script = all_chars[start:start + 25]
+            assert graph.get_num_jinxes(script) == _naive_num_jinxes(script)
+
+    def test_manual_answer(self):
+        search = mjs.Search(mjs.Search.MANUAL)
+        graph = mjs._JinxGraph(jinxes, search.registry.names)
+        solution = search._manual_answer(graph)[0]
+        assert graph.get_num_jinxes(solution) == _naive_num_jinxes(solution)
+
+    def test_ids_match_registry(self):
+        search = mjs.Search()
+        graph = search.get_graph()
+        for char in search.registry:
+            assert graph.get_id(char.name) == char.id
+
+    def test_jinxes_stored_twice(self):
+        # The index takes jinxes stored under both characters, so they are only counted once
+        jinx_dict = {"a": {"b": "Jinx"}, "b": {"a": "Jinx"}}
+        search = mjs.Search(char_dict={team: {} for team in mjs.TOWN_DISTRIBUTION} |
+                            {"townsfolk": {"a": {}, "b": {}}},
+                            distribution={"townsfolk": 2, "outsider": 0, "minion": 0, "demon": 0},
+                            jinx_dict=jinx_dict)
+        graph = search.get_graph()
+        assert graph.get_total_num_jinxes() == 1
+        assert graph.get_num_jinxes(["a", "b"]) == 1
+        assert search.jinx_index.jinxes_within(["b", "a"]) == [("a", "b", "Jinx")]
+
+    def test_output_lists_jinxes(self, capsys):
+        search = mjs.Search(mjs.Search.MANUAL)
+        search.solve()
+        search.output_scripts(skip_input=True)
+        output = capsys.readouterr().out
+        best = search.solutions.get_solutions()[0]
+        for char_1, char_2, _ in search.jinx_index.jinxes_within(best):
+            assert f"{char_1} & {char_2}: " in output
+
+
+class TestScriptState():
+    """Tests of the incremental script builder"""
+    @pytest.mark.parametrize("seed", range(3))
+    def test_matches_rescoring(self, seed):
+        search = mjs.Search()
+        graph = search.get_graph()
+        state = search.get_script_state(graph=graph)
+        rng = random.Random(seed)
+        names = sorted(search.types.keys())
+        for _ in range(500):
+            char = rng.choice(names)
+            if char in state:
+                assert state.remove(char) == graph.count_jinxes_into(char, state.mask)
+            else:
+                assert state.add(char) == graph.count_jinxes_into(char, state.mask)
+            assert state.get_num_jinxes() == graph.count_jinxes(state.mask)
+
+            script = state.get_names()
+            assert state.get_num_jinxes_per_character() == \
+                graph.get_num_jinxes_per_character(script)
+            team = search.types[char]
+            expected = sorted((-graph.count_jinxes_into(other, state.mask), other)
+                              for other in names
+                              if search.types[other] == team and other not in script)
+            assert state.get_best_additions(team, 3) == [(other, -gain)
+                                                         for gain, other in expected[:3]]
+
+    def test_starting_script(self):
+        search = mjs.Search()
+        graph = search.get_graph()
+        script = search._manual_answer(graph)[0]
+        state = search.get_script_state(script, graph)
+        assert state.get_num_jinxes() == graph.get_num_jinxes(script)
+        assert len(state) == len(script)
+        assert {team: count for team, count in state.get_team_counts().items()
+                if count > 0} == mjs.TOWN_DISTRIBUTION
+
+    def test_invalid_changes(self):
+        state = mjs.Search().get_script_state(["imp"])
+        with pytest.raises(ValueError):
+            state.add("imp")
+        with pytest.raises(ValueError):
+            state.remove("chef")
+        with pytest.raises(ValueError):
+            state.add("not a character")
+
+
+SMALL_DISTRIBUTION = {
+    "townsfolk": 3,
+    "outsider": 2,
+    "minion": 2,
+    "demon": 1,
+}
+
+
+def _synthetic_world(seed, team_size=6, density=0.3):
+    """Random characters and jinxes for the four teams in SMALL_DISTRIBUTION"""
+    rng = random.Random(seed)
+    chars = {team: {f"{team}{i}": {} for i in range(team_size)}
+             for team in SMALL_DISTRIBUTION.keys()}
+    names = [name for team in chars.values() for name in team.keys()]
+    jinx_dict = {}
+    for i in range(len(names)):
+        for j in range(i + 1, len(names)):
+            if rng.random() < density:
+                jinx_dict.setdefault(names[i], {})[names[j]] = "jinx"
+    return chars, jinx_dict
+
+
+@pytest.fixture
+def small_world(monkeypatch):
+    """Point the search at a seeded synthetic world"""
+    def _apply(seed):
+        chars, jinx_dict = _synthetic_world(seed)
+        monkeypatch.setattr(mjs.data, "characters", chars)
+        monkeypatch.setattr(mjs, "TOWN_DISTRIBUTION", SMALL_DISTRIBUTION)
+        search = mjs.Search(mjs.Search.BRANCH_AND_BOUND)
+        return search, mjs._JinxGraph(jinx_dict, search.registry.names)
+    return _apply
+
+
+def _check_distribution(search, solution):
+    counts = {team: 0 for team in search.distribution.keys()}
+    for char in solution:
+        counts[search.types[char]] += 1
+    assert counts == search.distribution
+
+
+def _brute_force_best(graph, chars, distribution):
+    """Most jinxes of any script with the distribution, by scoring every one"""
+    return max(graph.get_num_jinxes(list(itertools.chain(*picks))) for picks in itertools.product(
+        *[itertools.combinations(chars[team], slots) for team, slots in distribution.items()]))
+
+
+class TestBranchAndBound():
+    """Tests that the bounded search is exact"""
+    @pytest.mark.parametrize("seed", range(5))
+    def test_matches_exhaustion(self, small_world, seed):
+        search, graph = small_world(seed)
+        expected = graph.get_num_jinxes(search._exhaustion_search(graph)[0])
+
+        search.incumbent = mjs._Incumbent()
+        search.solutions = None
+        solutions = search._branch_and_bound(graph)
+        assert len(solutions) > 0
+        for soln in solutions:
+            _check_distribution(search, soln)
+            assert graph.get_num_jinxes(soln) == expected
+
+    @pytest.mark.parametrize("seed", range(2))
+    @pytest.mark.parametrize("text", ["0,2,2,1", "3,2,0,0", "3,0,2,1", "0,0,0,0"])
+    @pytest.mark.parametrize("reduce", [False, True])
+    def test_empty_teams(self, seed, text, reduce):
+        chars, jinx_dict = _synthetic_world(seed)
+        distribution = mjs.parse_distributions(text)[0]
+        search = mjs.Search(mjs.Search.BRANCH_AND_BOUND, distribution=distribution,
+                            char_dict=chars, jinx_dict=jinx_dict, reduce=reduce, top=1)
+        solutions = search.solve()
+        graph = search.get_graph()
+        expected = _brute_force_best(graph, chars, distribution)
+        assert len(solutions) == 1
+        _check_distribution(search, solutions[0])
+        assert graph.get_num_jinxes(solutions[0]) == expected
+
+    def test_bound_is_admissible(self, small_world):
+        search, graph = small_world(0)
+        # With nothing chosen, the bound must be at least the optimum
+        optimum = graph.get_num_jinxes(search._exhaustion_search(graph)[0])
+        undecided = [(graph.to_mask(mjs.data.characters[team].keys()), slots)
+                     for team, slots in SMALL_DISTRIBUTION.items()]
+        bounded_search = mjs._BranchAndBound(search, graph, search._get_full_search_space())
+        assert bounded_search.get_bound(0, 0, undecided) >= optimum
+
+
+class TestDistributions():
+    """Tests of searching other team distributions, and sweeping over a grid of them"""
+    def test_parse_distributions(self):
+        assert mjs.parse_distributions("13,4,4,4") == [mjs.TOWN_DISTRIBUTION]
+        grid = mjs.parse_distributions("12-13,4-5,4,3")
+        assert [mjs.format_distribution(d) for d in grid] == \
+               ["12/4/4/3", "12/5/4/3", "13/4/4/3", "13/5/4/3"]
+
+    @pytest.mark.parametrize("text", ["13,4,4", "13,4,4,4,1", "13,5-4,4,4", "13,-1,4,4", "a,4,4,4"])
+    def test_parse_invalid(self, text):
+        with pytest.raises(ValueError):
+            mjs.parse_distributions(text)
+
+    @pytest.mark.parametrize("distribution", [
+        {"townsfolk": 13, "outsider": 4, "minion": 4},
+        {"townsfolk": 13, "outsider": 4, "minion": 4, "demon": 400},
+        {"townsfolk": 13, "outsider": -1, "minion": 4, "demon": 4},
+    ])
+    def test_rejects_impossible(self, distribution):
+        with pytest.raises(ValueError):
+            mjs.Search(mjs.Search.BRANCH_AND_BOUND, distribution=distribution)
+
+    @pytest.mark.parametrize("seed", range(3))
+    def test_other_distribution(self, small_world, seed):
+        search, graph = small_world(seed)
+        search.set_distribution({"townsfolk": 2, "outsider": 3, "minion": 1, "demon": 2})
+        expected = search._exhaustion_search(graph)
+
+        search.incumbent = mjs._Incumbent()
+        search.solutions = None
+        solutions = search._branch_and_bound(graph)
+        assert len(solutions) > 0
+        for soln in solutions + expected:
+            _check_distribution(search, soln)
+            assert graph.get_num_jinxes(soln) == graph.get_num_jinxes(expected[0])
+
+    def test_fit_to_distribution(self, small_world):
+        search, graph = small_world(4)
+        script = search._exhaustion_search(graph)[0]
+        # Already fits, so nothing changes
+        assert sorted(search._fit_to_distribution(graph, script)) == sorted(script)
+
+        search.set_distribution({"townsfolk": 2, "outsider": 3, "minion": 2, "demon": 1})
+        fitted = search._fit_to_distribution(graph, script)
+        _check_distribution(search, fitted)
+        # Only the townsfolk and outsiders needed to change
+        assert len(set(fitted) & set(script)) == len(script) - 1
+
+    def test_fit_ignores_last_reduction(self):
+        chars, jinx_dict = _synthetic_world(0, team_size=7, density=0.12)
+        search = mjs.Search(mjs.Search.BRANCH_AND_BOUND, distribution=SMALL_DISTRIBUTION,
+                            char_dict=chars, jinx_dict=jinx_dict, reduce=True, top=1)
+        script = search.solve()[0]
+        graph = search.get_graph()
+        assert len(search._space_reduction.space["demon"]) < 7
+
+        # More demons than the last search's reduction kept
+        search.set_distribution({"townsfolk": 3, "outsider": 2, "minion": 2, "demon": 7})
+        fitted = search._fit_to_distribution(graph, script)
+        _check_distribution(search, fitted)
+
+    @pytest.mark.parametrize("search_type", [mjs.Search.EXHAUSTION, mjs.Search.BRANCH_AND_BOUND])
+    def test_sweep_matches_independent_runs(self, small_world, monkeypatch, search_type):
+        _, jinx_dict = _synthetic_world(5)
+        search, graph = small_world(5)
+        monkeypatch.setattr(mjs.data, "jinxes", jinx_dict)
+        distributions = mjs.parse_distributions("2-3,1-2,2,1")
+
+        search = mjs.Search(search_type)
+        results = search.run_sweep(distributions)
+        assert [distribution for distribution, _ in results] == distributions
+        for distribution, solutions in results:
+            search.set_distribution(distribution)
+            search.incumbent = mjs._Incumbent()
+            search.solutions = None
+            expected = search._exhaustion_search(graph)
+            assert len(solutions) > 0
+            for soln in solutions:
+                _check_distribution(search, soln)
+                assert graph.get_num_jinxes(soln) == graph.get_num_jinxes(expected[0])
+
+
+class TestParallelSearch():
+    """Tests that splitting a search across processes gives the same results"""
+    @pytest.mark.parametrize("search_type", [mjs.Search.EXHAUSTION, mjs.Search.BRANCH_AND_BOUND])
+    def test_matches_single_process(self, small_world, search_type):
+        search, graph = small_world(1)
+        expected = search._exhaustion_search(graph)
+
+        search = mjs.Search(search_type, workers=2)
+        # Small enough that every unit is a single demon or a handful of open nodes
+        search.progress = mjs._SearchProgress(shared=True)
+        search.incumbent = mjs._Incumbent(shared=True)
+        solutions = search._run_parallel(graph)
+
+        expected_jinxes = graph.get_num_jinxes(expected[0])
+        for soln in solutions:
+            _check_distribution(search, soln)
+            assert graph.get_num_jinxes(soln) == expected_jinxes
+        if search_type == mjs.Search.EXHAUSTION:
+            # Every tie is found, whichever worker found it
+            assert sorted(sorted(soln) for soln in solutions) == \
+                   sorted(sorted(soln) for soln in expected)
+        # Counts from every worker are aggregated
+        assert search.progress.get_checked() > 0
+
+
+class _StopSearch(Exception):
+    pass
+
+
+def _interrupt_after(search, num_records):
+    """Make the search stop part-way, as if killed, after num_records progress updates"""
+    record = search.progress.record
+    calls = 0
+
+    def _record(soln, count=1):
+        nonlocal calls
+        calls += 1
+        if calls > num_records:
+            raise _StopSearch()
+        record(soln, count)
+    search.progress.record = _record
+
+
+class TestCheckpoint():
+    """Tests of saving and resuming long searches"""
+    @pytest.mark.parametrize("start", [None, (0, 1, 2), (1, 3, 5), (3, 4, 5)])
+    def test_combinations_from(self, start):
+        expected = list(itertools.combinations(range(6), 3))
+        if start is not None:
+            expected = expected[expected.index(start):]
+        assert list(mjs.combinations_from(6, 3, start)) == expected
+
+    @pytest.mark.parametrize("search_name,batch", [
+        ("_exhaustion_search", False),
+        ("_exhaustion_search", True),
+        ("_branch_and_bound", False),
+        ("_greedy_construction_all_starts", False),
+    ])
+    def test_resume_matches_full_run(self, small_world, monkeypatch, tmp_path, search_name,
+                                     batch):
+        if batch:
+            pytest.importorskip("numpy")
+            # Several blocks per outsider combination, so a checkpoint can land part-way through
+            monkeypatch.setattr(mjs._BatchEvaluator, "BATCH_SIZE", 12)
+        search, graph = small_world(2)
+        search.batch = batch
+        expected = getattr(search, search_name)(graph)
+        expected_checked = search.progress.get_checked()
+
+        # Checkpoint on every chance, then stop part-way
+        filename = str(tmp_path / "checkpoint.json")
+        search = mjs.Search(mjs.Search.EXHAUSTION, batch=batch)
+        search.checkpoint = mjs._Checkpoint(filename, "fingerprint", interval=0)
+        _interrupt_after(search, 3)
+        with pytest.raises(_StopSearch):
+            getattr(search, search_name)(graph)
+
+        search = mjs.Search(mjs.Search.EXHAUSTION, batch=batch)
+        search._resume_from(mjs._Checkpoint(filename, "fingerprint").load(), graph)
+        solutions = getattr(search, search_name)(graph)
+        assert sorted(sorted(soln) for soln in solutions) == \
+               sorted(sorted(soln) for soln in expected)
+        # Nothing finished before the checkpoint is checked again
+        assert search.progress.get_checked() == expected_checked
+
+    def test_rejects_other_data(self, small_world, tmp_path):
+        search, graph = small_world(2)
+        filename = str(tmp_path / "checkpoint.json")
+        fingerprint = search._get_checkpoint_fingerprint(graph, False)
+        mjs._Checkpoint(filename, fingerprint).save({}, [], search.progress)
+
+        # Different jinxes
+        _, changed_graph = small_world(3)
+        changed_fingerprint = search._get_checkpoint_fingerprint(changed_graph, False)
+        assert changed_fingerprint != fingerprint
+        with pytest.raises(ValueError):
+            mjs._Checkpoint(filename, changed_fingerprint).load()
+
+    @pytest.mark.parametrize("settings", [{"top": 5}, {"unique": False}])
+    def test_rejects_other_collection(self, small_world, settings):
+        search, graph = small_world(2)
+        other = mjs.Search(mjs.Search.BRANCH_AND_BOUND, **settings)
+        assert other._get_checkpoint_fingerprint(graph, False) != \
+            search._get_checkpoint_fingerprint(graph, False)
+
+
+def _change_jinxes(jinx_dict, seed, changes=4):
+    """Copy of jinx_dict with changes random jinxes added or removed"""
+    rng = random.Random(seed)
+    names = sorted({name for jinxed in jinx_dict.values() for name in jinxed} | set(jinx_dict))
+    changed = {char: dict(jinxed) for char, jinxed in jinx_dict.items()}
+    for _ in range(changes):
+        char_1, char_2 = sorted(rng.sample(names, 2))
+        if char_2 in changed.get(char_1, {}) or char_1 in changed.get(char_2, {}):
+            changed.get(char_1, {}).pop(char_2, None)
+            changed.get(char_2, {}).pop(char_1, None)
+        else:
+            changed.setdefault(char_1, {})[char_2] = "New jinx"
+    return changed
+
+
+class TestResultStore():
+    """Tests of saving results and re-optimising from them when the data changes"""
+    @staticmethod
+    def _search(search_type, jinx_dict, chars, results_file, **kwargs):
+        return mjs.Search(search_type, distribution=SMALL_DISTRIBUTION, char_dict=chars,
+                          jinx_dict=jinx_dict, results_file=str(results_file), top=20, **kwargs)
+
+    @pytest.mark.parametrize("seed", range(3))
+    def test_rescore(self, tmp_path, seed):
+        chars, jinx_dict = _synthetic_world(seed)
+        results_file = tmp_path / "results.json"
+        self._search(mjs.Search.EXHAUSTION, jinx_dict, chars, results_file).solve()
+
+        changed = _change_jinxes(jinx_dict, seed)
+        search = self._search(mjs.Search.EXHAUSTION, changed, chars, results_file)
+        graph = search.get_graph()
+        store = mjs._ResultStore(str(results_file))
+        diff = store.load(graph, search.types)
+        assert len(diff.added_edges) + len(diff.removed_edges) == 4
+        solutions = store.results[mjs.format_distribution(SMALL_DISTRIBUTION)]["solutions"]
+        assert len(solutions) == 20
+        for num_jinxes, soln in solutions:
+            assert num_jinxes == graph.get_num_jinxes(soln)
+
+    def test_drops_removed_characters(self, tmp_path):
+        chars, jinx_dict = _synthetic_world(0)
+        results_file = tmp_path / "results.json"
+        solutions = self._search(mjs.Search.EXHAUSTION, jinx_dict, chars, results_file).solve()
+
+        # Move a character in the best script to another team
+        moved = next(char for char in solutions[0] if char.startswith("outsider"))
+        chars = {team: dict(team_chars) for team, team_chars in chars.items()}
+        chars["townsfolk"][moved] = chars["outsider"].pop(moved)
+        search = self._search(mjs.Search.EXHAUSTION, jinx_dict, chars, results_file)
+        store = mjs._ResultStore(str(results_file))
+        diff = store.load(search.get_graph(), search.types)
+        assert diff.moved_chars == [moved]
+        for _, soln in store.results[mjs.format_distribution(SMALL_DISTRIBUTION)]["solutions"]:
+            assert moved not in soln
+
+    def test_unchanged_is_not_searched(self, tmp_path):
+        chars, jinx_dict = _synthetic_world(1)
+        results_file = tmp_path / "results.json"
+        expected = self._search(mjs.Search.EXHAUSTION, jinx_dict, chars, results_file).solve()
+
+        search = self._search(mjs.Search.BRANCH_AND_BOUND, jinx_dict, chars, results_file)
+        assert search.solve() == expected
+        assert search.progress.get_counts()[:2] == [0, 0]
+        # Still proven optimal, though the bounded search did not prove it again
+        with open(results_file) as results:
+            result = json.load(results)["results"][mjs.format_distribution(SMALL_DISTRIBUTION)]
+        assert result["exact"]
+
+    @pytest.mark.parametrize("seed", range(5))
+    @pytest.mark.parametrize("search_type", [mjs.Search.BRANCH_AND_BOUND, mjs.Search.TABU])
+    def test_reoptimise_matches_fresh(self, tmp_path, seed, search_type):
+        chars, jinx_dict = _synthetic_world(seed)
+        results_file = tmp_path / "results.json"
+        self._search(mjs.Search.BRANCH_AND_BOUND, jinx_dict, chars, results_file).solve()
+
+        changed = _change_jinxes(jinx_dict, seed, changes=6)
+        fresh = mjs.Search(mjs.Search.EXHAUSTION, distribution=SMALL_DISTRIBUTION,
+                           char_dict=chars, jinx_dict=changed)
+        fresh.solve()
+        store = mjs._ResultStore(str(results_file))
+        store.load(fresh.get_graph(), fresh.types)
+        saved = store.results[mjs.format_distribution(SMALL_DISTRIBUTION)]["solutions"]
+
+        search = self._search(search_type, changed, chars, results_file, seed=seed, restarts=2)
+        search.solve()
+        # Starts from the saved scripts, so is never worse than them
+        assert search.solutions.best >= max(num_jinxes for num_jinxes, _ in saved)
+        if search_type == mjs.Search.BRANCH_AND_BOUND:
+            assert search.solutions.best == fresh.solutions.best
+
+
+class TestSolutionCollector():
+    """Tests of keeping the best scripts found by a search"""
+    @pytest.mark.parametrize("limit", [1, 3, 10])
+    def test_keeps_top_limit(self, limit):
+        graph = mjs._JinxGraph(SMALL_JINXES, ["e"])
+        rng = random.Random(limit)
+        offers = [(rng.randrange(1 << 5), rng.randrange(6)) for _ in range(50)]
+        collector = mjs._SolutionCollector(graph, limit, unique=False)
+        for mask, num_jinxes in offers:
+            collector.offer(mask, num_jinxes)
+
+        # Most jinxes first, and earliest found first on ties
+        expected = sorted(range(len(offers)), key=lambda i: -offers[i][1])[:limit]
+        assert collector.get_solutions() == [graph.to_names(offers[i][0]) for i in expected]
+        assert collector.best == max(num_jinxes for _, num_jinxes in offers)
+
+    def test_keeps_every_tie(self):
+        graph = mjs._JinxGraph(SMALL_JINXES, ["e"])
+        collector = mjs._SolutionCollector(graph)
+        assert collector.offer(0b1, 2)
+        assert not collector.offer(0b10, 1)
+        assert collector.offer(0b100, 3)
+        for mask in range(8, 108):
+            assert collector.offer(mask, 3)
+        assert len(collector) == 101
+        assert collector.get_threshold() == 3
+
+    @pytest.mark.parametrize("limit", [None, 5])
+    def test_unique(self, limit):
+        graph = mjs._JinxGraph(SMALL_JINXES, ["e"])
+        collector = mjs._SolutionCollector(graph, limit)
+        assert collector.offer_script(["a", "b", "c"])
+        assert not collector.offer_script(["c", "b", "a"])
+        assert collector.get_solutions() == [graph.to_names(graph.to_mask(["a", "b", "c"]))]
+
+        collector = mjs._SolutionCollector(graph, limit, unique=False)
+        assert collector.offer_script(["a", "b", "c"])
+        assert collector.offer_script(["c", "b", "a"])
+        assert len(collector) == 2
+
+    def test_stream(self, tmp_path):
+        graph = mjs._JinxGraph(SMALL_JINXES, ["e"])
+        filename = str(tmp_path / "solutions.jsonl")
+        collector = mjs._SolutionCollector(graph, 2, stream_file=filename)
+        for script in [["a", "b"], ["a", "e"], ["a", "b", "c"], ["b", "c", "d"]]:
+            collector.offer_script(script)
+        collector.close()
+
+        with open(filename) as stream:
+            streamed = [json.loads(line) for line in stream]
+        # Every script kept at the time, even those since pushed out
+        assert [line["jinxes"] for line in streamed] == [1, 0, 3, 2]
+        assert sorted(streamed[2]["script"]) == ["a", "b", "c"]
+
+    @pytest.mark.parametrize("batch", [False, True])
+    @pytest.mark.parametrize("top", [1, 7, 40])
+    def test_exhaustion_top(self, small_world, batch, top):
+        if batch:
+            pytest.importorskip("numpy")
+        search, graph = small_world(6)
+        space = search._get_full_search_space()
+        # Every script, in the order the exhaustive search checks them
+        scripts = [list(itertools.chain(*teams)) for teams in itertools.product(
+            *[itertools.combinations(space[team], slots)
+              for team, slots in SMALL_DISTRIBUTION.items()])]
+        expected = sorted(scripts, key=lambda script: -graph.get_num_jinxes(script))[:top]
+
+        search = mjs.Search(mjs.Search.EXHAUSTION, batch=batch, top=top)
+        solutions = search._exhaustion_search(graph)
+        assert [sorted(soln) for soln in solutions] == [sorted(soln) for soln in expected]
+
+    @pytest.mark.parametrize("seed", range(3))
+    @pytest.mark.parametrize("top", [1, 5, 50])
+    def test_branch_and_bound_top(self, small_world, seed, top):
+        search, graph = small_world(seed)
+        expected = mjs.Search(mjs.Search.EXHAUSTION, batch=False, top=top)._exhaustion_search(graph)
+
+        search = mjs.Search(mjs.Search.BRANCH_AND_BOUND, top=top)
+        solutions = search._branch_and_bound(graph)
+        # Ties may be found in another order, so only the scores have to match
+        assert [graph.get_num_jinxes(soln) for soln in solutions] == \
+            [graph.get_num_jinxes(soln) for soln in expected]
+        assert len(set(frozenset(soln) for soln in solutions)) == len(solutions)
+
+
+class TestBatchEvaluator():
+    """Tests that scoring exhaustive searches in NumPy blocks matches the popcount loops"""
+    @pytest.fixture(autouse=True)
+    def _needs_numpy(self):
+        pytest.importorskip("numpy")
+
+    def test_score_batch(self):
+        graph = mjs._JinxGraph(SMALL_JINXES, ["e"])
+        masks = [graph.to_mask(char_list) for char_list, _ in SAMPLE_SCRIPTS]
+        evaluator = mjs._BatchEvaluator(graph, masks, masks)
+        assert list(evaluator.score_batch(evaluator.encode(masks))) == \
+               [expected for _, expected in SAMPLE_SCRIPTS]
+
+    @pytest.mark.parametrize("seed", range(3))
+    @pytest.mark.parametrize("batch_size", [1, 20, 1 << 20])
+    @pytest.mark.parametrize("cache_cross", [True, False])
+    def test_matches_unbatched(self, small_world, monkeypatch, seed, batch_size, cache_cross):
+        search, graph = small_world(seed)
+        search.batch = False
+        expected = search._exhaustion_search(graph)
+        expected_checked = search.progress.get_checked()
+
+        monkeypatch.setattr(mjs._BatchEvaluator, "BATCH_SIZE", batch_size)
+        if not cache_cross:
+            monkeypatch.setattr(mjs._BatchEvaluator, "CROSS_CACHE_SIZE", 0)
+        search = mjs.Search(mjs.Search.EXHAUSTION)
+        # Same solutions, in the same order
+        assert search._exhaustion_search(graph) == expected
+        assert search.progress.get_checked() == expected_checked
+
+
+class TestInstrumentation():
+    """Tests of the search's progress counters, snapshots and telemetry"""
+    @staticmethod
+    def _search(search_type, seed=0, **kwargs):
+        chars, jinx_dict = _synthetic_world(seed)
+        return mjs.Search(search_type, distribution=SMALL_DISTRIBUTION, char_dict=chars,
+                          jinx_dict=jinx_dict, **kwargs)
+
+    def test_exhaustion_snapshot(self):
+        search = self._search(mjs.Search.EXHAUSTION)
+        search.solve()
+        snapshot = search.progress.get_snapshot()
+        # Every script in the space is checked, so the total is known
+        assert snapshot["checked"] == search.progress.total_solns == 20 * 15 * 15 * 6
+        assert snapshot["eta_seconds"] == 0
+        assert snapshot["best"] == search.solutions.best
+
+    def test_huge_eta(self):
+        # e.g. an exhaustive search of the real data, which would take billions of years
+        progress = mjs._SearchProgress()
+        progress.total_solns = 10 ** 40
+        progress.record(None, 1000)
+        progress.start_time -= mjs.timedelta(seconds=1)
+        status = progress.format_snapshot()
+        assert "years left" in status
+
+    def test_branch_and_bound_counts(self):
+        search = self._search(mjs.Search.BRANCH_AND_BOUND)
+        search.solve()
+        checked, expanded, pruned = search.progress.get_counts()
+        assert checked > 0 and expanded > 0 and pruned > 0
+
+    @pytest.mark.parametrize("search_type", [mjs.Search.EXHAUSTION, mjs.Search.ANNEALING])
+    def test_history_improves(self, search_type):
+        search = self._search(search_type, seed=1)
+        search.solve()
+        history = search.progress.history
+        assert len(history) > 0
+        assert history[-1][1] == search.solutions.best
+        for (time_1, jinxes_1), (time_2, jinxes_2) in zip(history, history[1:]):
+            assert time_1 <= time_2 and jinxes_1 < jinxes_2
+
+    def test_telemetry(self, tmp_path):
+        telemetry_file = tmp_path / "telemetry.jsonl"
+        search = self._search(mjs.Search.BRANCH_AND_BOUND, telemetry_file=str(telemetry_file))
+        search.solve()
+        with open(telemetry_file) as telemetry:
+            events = [json.loads(line) for line in telemetry]
+        assert events[0]["event"] == "start"
+        assert events[-1]["event"] == "end"
+        assert events[-1]["best"] == search.solutions.best
+        improvements = [event["jinxes"] for event in events if event["event"] == "improvement"]
+        assert improvements == [jinxes for _, jinxes in search.progress.history]
+
+
+class TestEstimation():
+    """Tests of the search tree size estimator and the automatic search"""
+    def test_uniform_tree_is_exact(self):
+        # A complete ternary tree of depth 5, with nodes as their depths
+        estimator = mjs._TreeEstimator(lambda depth: [depth + 1] * 3 if depth < 5 else [])
+        estimate = estimator.estimate(0, 10)
+        assert estimate["nodes"] == sum(3 ** depth for depth in range(6))
+        assert estimate["leaves"] == 3 ** 5
+        assert estimate["stderr"] == 0
+
+    @pytest.mark.parametrize("seed", range(3))
+    def test_bounded_tree_estimate(self, small_world, seed):
+        search, graph = small_world(seed)
+        search.incumbent = mjs._Incumbent(graph.get_num_jinxes(search._exhaustion_search(graph)[0]))
+        bounded_search = mjs._BranchAndBound(search, graph, search._get_full_search_space())
+
+        def _get_children(node):
+            if bounded_search.is_complete(node):
+                return []
+            return bounded_search.get_children(node)
+
+        def _count(node):
+            return 1 + sum(_count(child) for child in _get_children(node))
+        expected = _count(bounded_search.get_root())
+
+        estimate = mjs._TreeEstimator(_get_children, seed).estimate(bounded_search.get_root(),
+                                                                     2000)
+        assert abs(estimate["nodes"] - expected) <= max(4 * estimate["stderr"], 0.1 * expected)
+
+    @pytest.mark.parametrize("search_type", mjs.Search.ESTIMATED_TYPES)
+    def test_estimate(self, small_world, monkeypatch, search_type):
+        search, graph = small_world(1)
+        monkeypatch.setattr(mjs.Search, "CALIBRATION_SECONDS", 0.05)
+        monkeypatch.setattr(mjs.Search, "ESTIMATE_PROBES", 20)
+        estimate = search.estimate(search_type, graph)
+        assert estimate["nodes"] >= estimate["evaluations"] > 0
+        assert estimate["seconds"] > 0
+        if search_type == mjs.Search.EXHAUSTION:
+            assert estimate["evaluations"] == 20 * 15 * 15 * 6
+
+    def test_rate_excludes_setup(self, small_world, monkeypatch):
+        search, graph = small_world(1)
+        search.batch = False
+        monkeypatch.setattr(mjs.Search, "CALIBRATION_SECONDS", 0.1)
+        rate = search._measure_rate(graph, mjs.Search.EXHAUSTION)
+
+        # Setup longer than the calibration would otherwise leave no time to measure
+        exhaustion_search = mjs.Search._exhaustion_search
+
+        def _slow_setup(self, graph):
+            time.sleep(0.3)
+            return exhaustion_search(self, graph)
+        monkeypatch.setattr(mjs.Search, "_exhaustion_search", _slow_setup)
+        assert search._measure_rate(graph, mjs.Search.EXHAUSTION) > rate / 3
+
+    @pytest.mark.parametrize("budget,expected", [(60, mjs.Search.BRANCH_AND_BOUND),
+                                                 (0.1, mjs.Search.ANNEALING)])
+    def test_auto(self, monkeypatch, budget, expected):
+        chars, jinx_dict = _synthetic_world(2)
+        exhaustion = mjs.Search(mjs.Search.EXHAUSTION, distribution=SMALL_DISTRIBUTION,
+                                char_dict=chars, jinx_dict=jinx_dict)
+        exhaustion.solve()
+
+        monkeypatch.setattr(mjs.Search, "CALIBRATION_SECONDS", 0.05)
+        monkeypatch.setattr(mjs.Search, "ANNEALING_ITERATIONS", 1000)
+        # Predictions which fit a minute, but not a fraction of a second
+        monkeypatch.setattr(mjs.Search, "estimate", lambda self, search_type, graph: {
+            "nodes": 1, "evaluations": 1, "stderr": 0,
+            "seconds": 30 if search_type == mjs.Search.BRANCH_AND_BOUND else 45,
+        })
+        chosen = []
+        solve = mjs.Search.solve
+
+        def _solve(self, graph=None):
+            chosen.append(self.search_type)
+            return solve(self, graph)
+        monkeypatch.setattr(mjs.Search, "solve", _solve)
+
+        search = mjs.Search(mjs.Search.AUTO, distribution=SMALL_DISTRIBUTION, char_dict=chars,
+                            jinx_dict=jinx_dict, time_limit=budget, seed=0)
+        search.solve()
+        assert chosen[-1] == expected
+        if expected == mjs.Search.BRANCH_AND_BOUND:
+            assert search.solutions.best == exhaustion.solutions.best
+        # The settings are put back for the next search
+        assert search.search_type == mjs.Search.AUTO
+        assert search.time_limit == budget
+
+    def test_auto_sweep(self, monkeypatch):
+        chars, jinx_dict = _synthetic_world(2)
+        monkeypatch.setattr(mjs.Search, "CALIBRATION_SECONDS", 0.05)
+        monkeypatch.setattr(mjs.Search, "ESTIMATE_PROBES", 20)
+        solve = mjs.Search.solve
+
+        def _solve(self, graph=None):
+            solutions = solve(self, graph)
+            if self.search_type != mjs.Search.AUTO:
+                # Let the chosen search's time limit run out before the next estimate
+                time.sleep(self.time_limit)
+            return solutions
+        monkeypatch.setattr(mjs.Search, "solve", _solve)
+
+        search = mjs.Search(mjs.Search.AUTO, distribution=SMALL_DISTRIBUTION, char_dict=chars,
+                            jinx_dict=jinx_dict, time_limit=1)
+        results = search.run_sweep(mjs.parse_distributions("2-3,2,2,1"))
+        assert len(results) == 2
+        for distribution, solutions in results:
+            search.set_distribution(distribution)
+            assert len(solutions) > 0
+            _check_distribution(search, solutions[0])
+
+
+class TestLocalSearch():
+    """Tests of the annealing and tabu searches"""
+    def test_swap_state_scores(self, small_world):
+        search, graph = small_world(4)
+        team_ids = {team: [graph.get_id(c) for c in mjs.data.characters[team].keys()]
+                    for team in SMALL_DISTRIBUTION.keys()}
+        members = {team: team_ids[team][:slots] for team, slots in SMALL_DISTRIBUTION.items()}
+        state = mjs._SwapState(graph, team_ids, members)
+
+        rng = random.Random(0)
+        for _ in range(50):
+            team = rng.choice(list(SMALL_DISTRIBUTION.keys()))
+            out_index = rng.randrange(len(state.members[team]))
+            in_index = rng.randrange(len(state.outside[team]))
+            expected = state.score + state.get_swap_delta(state.members[team][out_index],
+                                                          state.outside[team][in_index])
+            state.swap(team, out_index, in_index)
+            assert state.score == expected == graph.count_jinxes(state.mask)
+            _check_distribution(search, state.get_names())
+
+    @pytest.mark.parametrize("search_type", [mjs.Search.ANNEALING, mjs.Search.TABU])
+    def test_finds_optimum(self, small_world, search_type):
+        search, graph = small_world(5)
+        expected = graph.get_num_jinxes(search._exhaustion_search(graph)[0])
+
+        search = mjs.Search(search_type, restarts=3, seed=1)
+        search.ANNEALING_ITERATIONS = 2000
+        search.TABU_ITERATIONS = 50
+        func = search._annealing_search if search_type == mjs.Search.ANNEALING \
+            else search._tabu_search
+        solutions = func(graph)
+        for soln in solutions:
+            _check_distribution(search, soln)
+            assert graph.get_num_jinxes(soln) == expected
+
+        # The same seed gives the same scripts
+        assert func(graph) == solutions
+
+
+class TestGeneticSearch():
+    """Tests of the population search"""
+    def test_finds_optimum(self, small_world):
+        search, graph = small_world(5)
+        expected = graph.get_num_jinxes(search._exhaustion_search(graph)[0])
+
+        search = mjs.Search(mjs.Search.GENETIC, seed=1)
+        search.STALL_GENERATIONS = 20
+        solutions = search._genetic_search(graph)
+        assert len(solutions) > 0
+        for soln in solutions:
+            _check_distribution(search, soln)
+            assert graph.get_num_jinxes(soln) == expected
+
+        stats = search.generation_stats
+        assert stats[-1]["stalled"] == search.STALL_GENERATIONS
+        assert stats[-1]["best"] == expected
+        for before, after in zip(stats, stats[1:]):
+            assert before["best"] <= after["best"]
+            assert after["best"] >= after["mean"] >= after["worst"]
+
+    def test_repeatable_across_workers(self, small_world):
+        _, graph = small_world(2)
+        results = []
+        for workers in [1, 2]:
+            search = mjs.Search(mjs.Search.GENETIC, seed=3, workers=workers)
+            search.POPULATION_SIZE = 20
+            search.GENERATIONS = 10
+            results.append((search._genetic_search(graph), search.generation_stats))
+        assert results[0] == results[1]
+
+
+class TestGreedyConstruction():
+    """Tests of the construction searches and their shared transposition table"""
+    def test_shared_table_matches_fresh_tables(self, small_world):
+        search, graph = small_world(6)
+        space = mjs.concat_lists(search._get_reduced_search_space(graph))
+
+        # Expand every start from scratch
+        best = -1
+        expected = set()
+        for char in space:
+            counts = {team: 0 for team in SMALL_DISTRIBUTION.keys()}
+            counts[search.types[char]] += 1
+            found, masks = search._greedy_construction_recursive(graph, space, counts,
+                                                                 graph.to_mask([char]), {})
+            if found > best:
+                best = found
+                expected = set()
+            if found == best:
+                expected |= masks
+
+        solutions = search._greedy_construction_all_starts(graph)
+        assert {graph.to_mask(soln) for soln in solutions} == expected
+        for soln in solutions:
+            _check_distribution(search, soln)
+            assert graph.get_num_jinxes(soln) == best
+
+    @pytest.mark.parametrize("text", ["3,0,2,1", "0,2,2,1", "3,2,0,0"])
+    def test_all_starts_fit_distribution(self, small_world, text):
+        search, graph = small_world(6)
+        search.set_distribution(mjs.parse_distributions(text)[0])
+        solutions = search._greedy_construction_all_starts(graph)
+        assert len(solutions) > 0
+        for soln in solutions:
+            _check_distribution(search, soln)
+
+
+class TestSpaceReduction():
+    """Tests that dominance and symmetry reduction keeps the optimum"""
+    @pytest.mark.parametrize("seed", range(4))
+    def test_keeps_optimum(self, monkeypatch, seed):
+        # Sparser jinxes give more interchangeable and dominated characters
+        chars, jinx_dict = _synthetic_world(seed, team_size=7, density=0.12)
+        monkeypatch.setattr(mjs.data, "characters", chars)
+        monkeypatch.setattr(mjs, "TOWN_DISTRIBUTION", SMALL_DISTRIBUTION)
+        search = mjs.Search(mjs.Search.EXHAUSTION)
+        graph = mjs._JinxGraph(jinx_dict, search.registry.names)
+        expected = search._exhaustion_search(graph)
+        expected_jinxes = graph.get_num_jinxes(expected[0])
+
+        search = mjs.Search(mjs.Search.EXHAUSTION)
+        reduction = mjs._SpaceReduction(graph, search._get_full_search_space(),
+                                        search.distribution)
+        search._space_reduction = reduction
+        assert mjs.describe_space_size(reduction.space, search.distribution) != \
+               mjs.describe_space_size(reduction.original_space, search.distribution)
+
+        solutions = reduction.expand(search._exhaustion_search(graph))
+        assert len(solutions) > 0
+        expected_keys = {frozenset(soln) for soln in expected}
+        for soln in solutions:
+            _check_distribution(search, soln)
+            assert graph.get_num_jinxes(soln) == expected_jinxes
+            assert frozenset(soln) in expected_keys
+
+    @pytest.mark.parametrize("seed", range(3))
+    @pytest.mark.parametrize("top", [None, 1, 10])
+    def test_keeps_ties_and_top(self, seed, top):
+        # Only the single best script can skip the dominated characters
+        chars, jinx_dict = _synthetic_world(seed, team_size=7, density=0.12)
+        expected = mjs.Search(mjs.Search.EXHAUSTION, distribution=SMALL_DISTRIBUTION,
+                              char_dict=chars, jinx_dict=jinx_dict, top=top).solve()
+        search = mjs.Search(mjs.Search.EXHAUSTION, distribution=SMALL_DISTRIBUTION,
+                            char_dict=chars, jinx_dict=jinx_dict, top=top, reduce=True)
+        solutions = search.solve()
+        graph = search.get_graph()
+        assert [graph.get_num_jinxes(soln) for soln in solutions] == \
+            [graph.get_num_jinxes(soln) for soln in expected]
+        if top is None:
+            assert {frozenset(soln) for soln in solutions} == \
+                {frozenset(soln) for soln in expected}
+        assert any(search._space_reduction.removed.values()) == (top == 1)
+
+    def test_expands_equivalent_characters(self, monkeypatch):
+        chars = {
+            "townsfolk": {"t1": {}, "t2": {}, "t3": {}, "t4": {}},
+            "outsider": {"o1": {}, "o2": {}},
+            "minion": {"m1": {}, "m2": {}},
+            "demon": {"d1": {}},
+        }
+        # t1-t3 are interchangeable, t4 has no jinxes and is dominated by all of them
+        jinx_dict = {"d1": {"t1": "", "t2": "", "t3": "", "o1": "", "m1": ""}}
+        monkeypatch.setattr(mjs.data, "characters", chars)
+        monkeypatch.setattr(mjs, "TOWN_DISTRIBUTION", {
+            "townsfolk": 2,
+            "outsider": 1,
+            "minion": 1,
+            "demon": 1,
+        })
+        search = mjs.Search(mjs.Search.EXHAUSTION)
+        graph = mjs._JinxGraph(jinx_dict, search.registry.names)
+        reduction = mjs._SpaceReduction(graph, search._get_full_search_space(),
+                                        search.distribution)
+        assert reduction.space["townsfolk"] == ["t1", "t2"]
+        assert reduction.removed["townsfolk"] == ["t4"]
+
+        expanded = reduction.expand([["t1", "t2", "o1", "m1", "d1"]])
+        assert sorted(sorted(soln) for soln in expanded) == [
+            ["d1", "m1", "o1", "t1", "t2"],
+            ["d1", "m1", "o1", "t1", "t3"],
+            ["d1", "m1", "o1", "t2", "t3"],
+        ]
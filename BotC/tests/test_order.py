@@ -1,8 +1,15 @@
 """ Tests for night ordering"""
 
+import os
+import random
 import pytest
 
-from order import pick_from_order
+import order
+
+from data import CharacterRegistry, characters, load_cached_yaml, write_yaml
+from order import NightOrderIndex, NightOrderOverlay, compare_orders, derive_order, \
+    format_conflicts, generate_order, get_night_order_index, get_night_reminders, \
+    insert_into_order, pick_from_order, pick_many_from_order
 
 TEST_DATA = {
     "tb": {
@@ -183,3 +190,318 @@ class TestPickFromOrder():
 
         given_order = pick_from_order(chars)
         _assert_matching_order(given_order, expected_order)
+
+    def test_does_not_modify_arguments(self):
+        chars = list(TEST_DATA["tb"]["chars"])
+        pick_from_order(chars)
+        assert chars == TEST_DATA["tb"]["chars"]
+        # Nor does modifying the result change later orders
+        pick_from_order(chars)["firstNight"].clear()
+        _assert_matching_order(pick_from_order(chars), TEST_DATA["tb"]["expected_order"])
+
+    def test_without_defaults(self):
+        given_order = pick_from_order(TEST_DATA["tb"]["chars"], include_defaults=False)
+        expected_order = {night: [name for name in names if name not in NightOrderIndex.DEFAULTS]
+                          for night, names in TEST_DATA["tb"]["expected_order"].items()}
+        _assert_matching_order(given_order, expected_order)
+
+    def test_unknown_characters(self):
+        given_order = pick_from_order(["not a character"], include_defaults=False)
+        assert given_order == {"firstNight": [], "otherNight": []}
+
+    def test_many(self):
+        scripts = [TEST_DATA[script]["chars"] for script in TEST_DATA.keys()] * 3
+        given_orders = pick_many_from_order(scripts)
+        assert given_orders == [pick_from_order(chars) for chars in scripts]
+
+    def test_rebuilt_when_file_changes(self, tmp_path):
+        filename = str(tmp_path / "night-order.yaml")
+        write_yaml(filename, {"firstNight": [{"a": "A"}, {"b": "B"}]})
+        index = get_night_order_index(filename)
+        assert get_night_order_index(filename) is index
+        assert pick_from_order(["b", "a"], filename=filename) == \
+            {"firstNight": [{"a": "A"}, {"b": "B"}]}
+
+        write_yaml(filename, {"firstNight": [{"b": "B"}, {"a": "Changed"}]})
+        os.utime(filename, ns=(0, 0))
+        assert pick_from_order(["b", "a"], filename=filename) == \
+            {"firstNight": [{"b": "B"}, {"a": "Changed"}]}
+
+    @pytest.mark.parametrize("contents", [None, {"firstNight": ["a"]}])
+    def test_invalid_file(self, tmp_path, contents):
+        filename = str(tmp_path / "night-order.yaml")
+        if contents is not None:
+            write_yaml(filename, contents)
+        with pytest.raises(ValueError):
+            pick_from_order(["a"], filename=filename)
+
+
+class TestGetNightReminders():
+    """Tests of the get_night_reminders function"""
+    def test_reminders(self):
+        char_set = get_night_reminders()
+        assert char_set["poisoner"] == {
+            "firstNight": characters["minion"]["poisoner"]["firstNightReminder"],
+            "otherNight": characters["minion"]["poisoner"]["otherNightReminder"],
+        }
+        assert char_set["acrobat"].keys() == {"otherNight"}
+        assert char_set["mayor"] == {}
+        # Only the playable teams
+        assert "spiritofivory" not in char_set
+
+
+def _get_oracle(true_order):
+    """An ask function answering from true_order, which records every question asked"""
+    ranks = {name: rank for rank, name in enumerate(true_order)}
+    questions = []
+
+    def ask(name_1, name_2, night):
+        questions.append((night, name_1, name_2))
+        return ranks[name_1] < ranks[name_2]
+    ask.questions = questions
+    return ask
+
+
+# Worst-case comparisons of the Ford-Johnson sort for 0 to 13 items
+MERGE_INSERTION_COMPARISONS = [0, 0, 1, 3, 5, 7, 10, 13, 16, 19, 22, 26, 30, 34]
+
+
+class TestGenerateOrder():
+    """Tests of generating the order from the user's answers"""
+    @pytest.mark.parametrize("count", range(len(MERGE_INSERTION_COMPARISONS)))
+    def test_merge_insertion_sort(self, count):
+        rng = random.Random(count)
+        for _ in range(20):
+            items = list(range(count))
+            rng.shuffle(items)
+            comparisons = []
+
+            def goes_before(item_1, item_2):
+                comparisons.append((item_1, item_2))
+                return item_1 < item_2
+            assert order._merge_insertion_sort(items, goes_before) == sorted(items)
+            assert len(comparisons) <= MERGE_INSERTION_COMPARISONS[count]
+
+    def _get_char_set(self, names):
+        return {name: {"firstNight": f"{name} wakes."} for name in names}
+
+    def test_generate(self, tmp_path):
+        names = [f"char{i}" for i in range(10)]
+        true_order = ["dawn", "minioninfo", "demoninfo"] + names
+        ask = _get_oracle(true_order)
+        shuffled = random.Random(0).sample(names, len(names))
+        result = generate_order(self._get_char_set(shuffled),
+                                memo_file=str(tmp_path / "memo.json"), ask=ask)
+        assert [list(entry.keys())[0] for entry in result["firstNight"]] == ["dusk"] + true_order
+        assert result["otherNight"] == [{"dusk": "Start the Night Phase."},
+                                        {"dawn": "Wait for a few seconds. End the Night Phase."}]
+        assert 0 < len(ask.questions) <= MERGE_INSERTION_COMPARISONS[len(true_order)]
+        assert len(set(ask.questions)) == len(ask.questions)
+
+    def test_resumes_from_memo(self, tmp_path):
+        names = [f"char{i}" for i in range(8)]
+        true_order = ["dawn", "minioninfo", "demoninfo"] + names
+        memo_file = str(tmp_path / "memo.json")
+        ask = _get_oracle(true_order)
+
+        def interrupt_after_five(name_1, name_2, night):
+            if len(ask.questions) == 5:
+                raise KeyboardInterrupt
+            return ask(name_1, name_2, night)
+        with pytest.raises(KeyboardInterrupt):
+            generate_order(self._get_char_set(names), memo_file=memo_file,
+                           ask=interrupt_after_five)
+
+        resumed = _get_oracle(true_order)
+        result = generate_order(self._get_char_set(names), memo_file=memo_file, ask=resumed)
+        assert [list(entry.keys())[0] for entry in result["firstNight"]] == ["dusk"] + true_order
+        # None of the first five are asked again
+        assert set(resumed.questions).isdisjoint(ask.questions)
+
+        again = _get_oracle(true_order)
+        generate_order(self._get_char_set(names), memo_file=memo_file, ask=again)
+        assert again.questions == []
+
+    def test_memo_transitivity(self, tmp_path):
+        memo = order._ComparisonMemo(str(tmp_path / "memo.json"))
+        memo.add("firstNight", "a", "b")
+        memo.add("firstNight", "c", "d")
+        memo.add("firstNight", "b", "c")
+        assert memo.get("firstNight", "a", "d") is True
+        assert memo.get("firstNight", "d", "a") is False
+        assert memo.get("otherNight", "a", "d") is None
+        with pytest.raises(ValueError):
+            memo.add("firstNight", "d", "a")
+
+        loaded = order._ComparisonMemo(str(tmp_path / "memo.json"))
+        assert loaded.get("firstNight", "a", "d") is True
+
+    def test_insert(self, tmp_path):
+        filename = str(tmp_path / "night-order.yaml")
+        existing = [f"char{i:02}" for i in range(31)]
+        write_yaml(filename, {
+            "firstNight": [{"dusk": "Start."}] + [{name: "Wake."} for name in existing],
+            "otherNight": [{"dusk": "Start."}, {"char05": "Wake."}],
+        })
+        new_names = ["char07a", "char20a"]
+        ask = _get_oracle(sorted(existing + new_names))
+        result = insert_into_order(self._get_char_set(new_names), filename, ask=ask)
+        assert [list(entry.keys())[0] for entry in result["firstNight"]] == \
+            ["dusk"] + sorted(existing + new_names)
+        assert result["otherNight"] == [{"dusk": "Start."}, {"char05": "Wake."}]
+        # A binary search each, over 31 and then 32 characters
+        assert len(ask.questions) <= 5 + 6
+        assert pick_from_order(["char20a"], include_defaults=False, filename=filename) == \
+            {"firstNight": [{"char20a": "char20a wakes."}], "otherNight": []}
+
+        with pytest.raises(ValueError):
+            insert_into_order(self._get_char_set(["char00"]), filename, ask=ask)
+
+
+class TestDeriveOrder():
+    """Tests of building the order from the numeric positions in characters.yaml"""
+    def _get_registry(self, first_nights, other_nights=None):
+        char_dict = {"townsfolk": {name: {"firstNight": position,
+                                          "firstNightReminder": f"{name} wakes."}
+                                   for name, position in first_nights.items()}}
+        for name, position in (other_nights or {}).items():
+            char_dict["townsfolk"].setdefault(name, {}).update(
+                {"otherNight": position, "otherNightReminder": f"{name} wakes again."})
+        return CharacterRegistry(char_dict)
+
+    def test_matches_curated_order(self):
+        derived, ties = derive_order()
+        curated = load_cached_yaml(order._DEFAULT_NIGHT_ORDER_FILE)
+        assert compare_orders(derived, curated) == {}
+        assert ties == {"firstNight": [], "otherNight": []}
+
+    def test_anchors_take_unused_positions(self):
+        registry = self._get_registry({"a": 2, "b": 3, "c": 5, "d": 7}, {"a": 3, "c": 2})
+        derived, ties = derive_order(registry)
+        assert [list(entry.keys())[0] for entry in derived["firstNight"]] == \
+            ["dusk", "a", "b", "minioninfo", "c", "demoninfo", "d", "dawn"]
+        assert [list(entry.keys())[0] for entry in derived["otherNight"]] == \
+            ["dusk", "c", "a", "dawn"]
+        assert derived["firstNight"][1] == {"a": "a wakes."}
+
+    def test_anchor_positions(self):
+        registry = self._get_registry({"a": 2, "b": 3, "c": 4, "d": 5})
+        with pytest.raises(ValueError):
+            derive_order(registry)
+        positions = {"firstNight": {"dusk": 1, "minioninfo": 3, "demoninfo": 3, "dawn": 5},
+                     "otherNight": {"dusk": 1, "dawn": 2}}
+        derived, _ = derive_order(registry, positions)
+        assert [list(entry.keys())[0] for entry in derived["firstNight"]] == \
+            ["dusk", "a", "minioninfo", "demoninfo", "b", "c", "dawn", "d"]
+
+    def test_ties(self):
+        registry = self._get_registry({"b": 2, "a": 2, "c": 4, "d": 6, "e": 6})
+        positions = {"firstNight": {"dusk": 1, "minioninfo": 3, "demoninfo": 5, "dawn": 7}}
+        derived, ties = derive_order(registry, positions)
+        assert ties["firstNight"] == [["a", "b"], ["d", "e"]]
+        assert [list(entry.keys())[0] for entry in derived["firstNight"]][:3] == \
+            ["dusk", "a", "b"]
+
+    def test_compare_orders(self):
+        def as_order(names):
+            return {"firstNight": [{name: ""} for name in names]}
+        reference = as_order(["dusk", "a", "b", "c", "d", "e", "dawn"])
+        assert compare_orders(reference, reference) == {}
+        changed = as_order(["dusk", "d", "a", "b", "c", "f", "dawn"])
+        changed["firstNight"][3] = {"b": "New reminder"}
+        conflicts = compare_orders(changed, reference)
+        assert conflicts == {"firstNight": {"missing": ["e"], "extra": ["f"], "moved": ["d"],
+                                            "reminder changed": ["b"]}}
+        assert format_conflicts(conflicts, {"firstNight": [["a", "b"]]}) == [
+            "firstNight: missing: e",
+            "firstNight: extra: f",
+            "firstNight: moved: d",
+            "firstNight: reminder changed: b",
+            "firstNight: share a position: a, b",
+        ]
+
+
+class TestNightOrderOverlay():
+    """Tests of custom exceptions to the global night order"""
+    def _get_index(self):
+        return NightOrderIndex({
+            "firstNight": [{name: f"{name} wakes."} for name in "abcdefg"],
+            "otherNight": [{name: f"{name} wakes again."} for name in "ace"],
+        })
+
+    def _pick_names(self, index, script, overlay):
+        return {night: [list(entry.keys())[0] for entry in entries]
+                for night, entries in index.pick(script, False, overlay).items()}
+
+    @pytest.mark.parametrize("constraints,expected", [
+        # Already in order
+        ([("firstNight", "a", "c")], "abcdefg"),
+        # A character which must wait follows straight after what it waits for
+        ([("firstNight", "f", "b")], "acdefbg"),
+        ([("firstNight", "f", "b"), ("firstNight", "b", "c")], "adefbcg"),
+        ([("firstNight", "g", "a"), ("firstNight", "e", "a")], "bcdefga"),
+        ([("firstNight", "d", "a"), ("firstNight", "d", "b")], "cdabefg"),
+    ])
+    def test_resolve(self, constraints, expected):
+        index = self._get_index()
+        overlay = NightOrderOverlay(constraints)
+        names = self._pick_names(index, "abcdefg", overlay)
+        assert "".join(names["firstNight"]) == expected
+        assert names["otherNight"] == ["a", "c", "e"]
+        assert index.pick("abcdefg", False, overlay)["firstNight"][0] == \
+            {expected[0]: f"{expected[0]} wakes."}
+
+    def test_add_after(self):
+        overlay = NightOrderOverlay()
+        overlay.add_after("firstNight", "a", "e")
+        assert overlay.constraints == [("firstNight", "e", "a")]
+        assert "".join(self._pick_names(self._get_index(), "abcdefg", overlay)["firstNight"]) == \
+            "bcdeafg"
+
+    def test_constraints_through_other_characters(self):
+        # f before d before b still puts f before b in a script without d
+        overlay = NightOrderOverlay([("firstNight", "f", "d"), ("firstNight", "d", "b")])
+        assert self._pick_names(self._get_index(), "abf", overlay)["firstNight"] == ["a", "f", "b"]
+
+    def test_contradictions(self):
+        overlay = NightOrderOverlay([("firstNight", "a", "b"), ("firstNight", "b", "c")])
+        with pytest.raises(ValueError):
+            overlay.add_before("firstNight", "c", "a")
+        with pytest.raises(ValueError):
+            overlay.add_before("firstNight", "a", "a")
+        # Each night is separate
+        overlay.add_before("otherNight", "c", "a")
+        assert len(overlay) == 3
+        with pytest.raises(ValueError):
+            NightOrderOverlay(overlay.constraints + [("otherNight", "a", "c")])
+
+    def test_not_waking(self):
+        overlay = NightOrderOverlay([("otherNight", "a", "b")])
+        with pytest.raises(ValueError):
+            self._get_index().pick("ab", False, overlay)
+
+    def test_cache(self):
+        index = self._get_index()
+        overlay = NightOrderOverlay([("firstNight", "f", "b")])
+        first = index.pick("abcf", False, overlay)
+        first["firstNight"].clear()
+        assert index.pick("fcba", False, NightOrderOverlay(overlay.constraints)) == \
+            index.pick("abcf", False, overlay) != first
+        assert len(index._resolved) == 1
+        overlay.add_before("firstNight", "c", "a")
+        assert self._pick_names(index, "abcf", overlay)["firstNight"] == ["c", "a", "f", "b"]
+        assert len(index._resolved) == 2
+
+    def test_real_order(self):
+        chars = TEST_DATA["tb"]["chars"]
+        overlay = NightOrderOverlay()
+        overlay.add_after("otherNight", "monk", "imp")
+        given_order = pick_from_order(chars, overlay=overlay)
+        names = [list(entry.keys())[0] for entry in given_order["otherNight"]]
+        expected = [name for name in TEST_DATA["tb"]["expected_order"]["otherNight"]
+                    if name != "monk"]
+        expected.insert(expected.index("imp") + 1, "monk")
+        assert names == expected
+        assert given_order["firstNight"] == pick_from_order(chars)["firstNight"]
+        assert pick_many_from_order([chars, chars], overlays=[overlay, None]) == \
+            [given_order, pick_from_order(chars)]
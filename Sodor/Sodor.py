@@ -19,8 +19,8 @@ class Controller:
     # Setup
     def __init__(self):
         self.model = Model("./data/stations.txt", "./data/tracks.txt")
+        # Indexed by the model's edge ids
         self.edge_list = self.model.get_all_edges()
-        self.edge_map = {}
         self.trains = []
         self.awaiting_answer = False
 
@@ -40,17 +40,8 @@ class Controller:
 
     # Actions
     def find_edge_index_from_nodes(self, node_1, node_2):
-        """ Use some dynamic programming (big air quotes) """
-        goal = (self.model.nodes[node_1], self.model.nodes[node_2])
-        if goal in self.edge_map:
-            return self.edge_map[goal]
-        i = 0
-        for (n1, n2, w) in self.edge_list:
-            if n1 in goal and n2 in goal:
-                self.edge_map[goal] = i
-                return i
-            i += 1
-        raise KeyError
+        """ The model's edge table does the work. Raises KeyError if they are not adjacent """
+        return self.model.get_edge_id(node_1, node_2)
 
     def get_train_by_name(self, name):
         for train in self.trains:
@@ -125,31 +116,19 @@ class Controller:
         # Need to enumerate
         for path in paths:
             path.reverse()
-            prev_node = node_1
-            ind_path = []
-            for curr_node in path:
-                ind_path.append(self.find_edge_index_from_nodes(prev_node, curr_node))
-                prev_node = curr_node
-            indexed_paths.append(ind_path)
+            indexed_paths.append(self.model.get_path_edge_ids([node_1] + path))
         path_receiver(indexed_paths)
 
     def shortest_path_between(self, node_1, node_2, path_receiver):
         path = self.model.shortest_path_between(node_1, node_2)
-        prev_node = node_1
-        ind_path = []
-        for curr_node in path:
-            ind_path.append(self.find_edge_index_from_nodes(prev_node, curr_node))
-            prev_node = curr_node
-        path_receiver([ind_path])
+        path_receiver([self.model.get_path_edge_ids([node_1] + path)])
 
     def deactivate_track(self, track_id, callback):
-        node_1, node_2, weight = self.edge_list[track_id]
-        self.model.remove_edge(node_1, node_2, weight)
+        self.model.set_edge_active(track_id, False)
         callback(track_id)
 
     def activate_track(self, track_id, callback):
-        node_1, node_2, weight = self.edge_list[track_id]
-        self.model.add_edge(node_1, node_2, weight)
+        self.model.set_edge_active(track_id, True)
         callback(track_id)
 
     def crane_puzzle_numbers(self, start_point, rotation_left, rotation_right, callback):
@@ -37,7 +37,8 @@ class View:
         self.stations = stations
 
         self.selected_tracks = []
-        self.track_ids = []     # Maps the tk id to the track object
+        self.track_ids = []     # Maps the track index to the tk id
+        self.track_indices = {}     # Maps the tk id to the track index
         self.tracks = tracks
         self.deactivated_tracks = []
 
@@ -192,6 +193,7 @@ class View:
                                  partial(self.on_track_l_click, track_id))
             self.canvas.tag_bind(track_id, '<Button-3>',
                                  partial(self.on_track_r_click, track_id))
+            self.track_indices[track_id] = len(self.track_ids)
             self.track_ids.append(track_id)
 
     def start(self):
@@ -219,7 +221,7 @@ class View:
                        f"{len(self.selected_tracks)} selected"
         self.tracks_num_lbl.config(text=lbl_contents)
 
-        selected_length = sum([self.tracks[self.track_ids.index(tk_id)][2] for tk_id in
+        selected_length = sum([self.tracks[self.track_indices[tk_id]][2] for tk_id in
                                self.selected_tracks])
         lbl_contents = "-" if len(self.selected_tracks) == 0 else f"{selected_length}km"
         self.tracks_dist_lbl.config(text=lbl_contents)
@@ -314,11 +316,11 @@ class View:
             self.canvas.itemconfig(track_id, fill=TRACK)
         if track_id in self.deactivated_tracks:
             t = Thread(target=self.controller.activate_track,
-                       args=(self.track_ids.index(track_id),
+                       args=(self.track_indices[track_id],
                              self.track_reactivated))
         else:
             t = Thread(target=self.controller.deactivate_track,
-                       args=(self.track_ids.index(track_id),
+                       args=(self.track_indices[track_id],
                              self.track_deactivated))
         t.start()
 